@@ -3,10 +3,11 @@ import logging
 import random
 
 import numpy as np
-import torch
-import tensorflow as tf
-from tensorflow.python.client import device_lib
-from torch.autograd import Variable
+
+from utils.utilities import get_float_dtype
+
+# torch and tensorflow are imported by the classes needing them, so that
+# importing one framework never loads the other
 
 
 class deepBase(metaclass=abc.ABCMeta):
@@ -45,27 +46,41 @@ class deepBase(metaclass=abc.ABCMeta):
 class PyTorchUtils(metaclass=abc.ABCMeta):
     """
     Abstract class for PyTorch based deep learning  detection algorithms.
+    Networks and tensors take the dtype policy of ``get_float_dtype`` when
+    the detector is created.
 
     """
     def __init__(self, seed, gpu):
+        import torch
         self.gpu = gpu
         self.seed = seed
         if self.seed is not None:
             torch.manual_seed(self.seed)
             torch.cuda.manual_seed(self.seed)
         self.framework = 0
+        self.float_dtype = get_float_dtype()
 
     @property
     def device(self):
+        import torch
         return torch.device(f'cuda:{self.gpu}' if torch.cuda.is_available() and self.gpu is not None else 'cpu')
 
+    @property
+    def torch_dtype(self):
+        import torch
+        return getattr(torch, np.dtype(self.float_dtype).name)
+
     def to_var(self, t, **kwargs):
         # ToDo: check whether cuda Variable.
-        t = t.to(self.device)
+        from torch.autograd import Variable
+        if t.is_floating_point():
+            t = t.to(self.device, dtype=self.torch_dtype)
+        else:
+            t = t.to(self.device)
         return Variable(t, **kwargs)
 
     def to_device(self, model):
-        model.to(self.device)
+        model.to(self.device, dtype=self.torch_dtype)
 
 
 class TensorflowUtils(metaclass=abc.ABCMeta):
@@ -74,6 +89,7 @@ class TensorflowUtils(metaclass=abc.ABCMeta):
 
     """
     def __init__(self, seed, gpu):
+        import tensorflow as tf
         self.gpu = gpu
         self.seed = seed
         if self.seed is not None:
@@ -82,6 +98,8 @@ class TensorflowUtils(metaclass=abc.ABCMeta):
 
     @property
     def device(self):
+        import tensorflow as tf
+        from tensorflow.python.client import device_lib
         local_device_protos = device_lib.list_local_devices()
         gpus = [x.name for x in local_device_protos if x.device_type == 'GPU']
         return tf.device(gpus[self.gpu] if gpus and self.gpu is not None else '/cpu:0')
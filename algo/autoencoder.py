@@ -11,6 +11,7 @@ from tqdm import trange
 
 from .algorithm_utils import deepBase, PyTorchUtils
 from algo.base import Base
+from utils.preprocessing import impute
 
 
 class AUTOENCODER(Base,deepBase, PyTorchUtils):
@@ -72,9 +73,7 @@ class AUTOENCODER(Base,deepBase, PyTorchUtils):
         X : dataframe of shape (n_samples, n_features)
             The input samples.
         """
-        X.interpolate(inplace=True)
-        X.bfill(inplace=True)
-        data = X.values
+        data = impute(X)
         sequences = [data[i:i + self.sequence_length] for i in range(data.shape[0] - self.sequence_length + 1)]
         indices = np.random.permutation(len(sequences))
         split_point = int(self.train_gaussian_percentage * len(sequences))
@@ -84,7 +83,7 @@ class AUTOENCODER(Base,deepBase, PyTorchUtils):
                                            sampler=SubsetRandomSampler(indices[-split_point:]), pin_memory=True)
 
         self.aed = AutoEncoderModule(X.shape[1], self.sequence_length, self.hidden_size, seed=self.seed, gpu=self.gpu)
-        self.to_device(self.aed)  # .double()
+        self.to_device(self.aed)
         optimizer = torch.optim.Adam(self.aed.parameters(), lr=self.lr)
 
         self.aed.train()
@@ -92,7 +91,7 @@ class AUTOENCODER(Base,deepBase, PyTorchUtils):
             logging.debug(f'Epoch {epoch+1}/{self.num_epochs}.')
             for ts_batch in train_loader:
                 output = self.aed(self.to_var(ts_batch))
-                loss = nn.MSELoss(size_average=False)(output, self.to_var(ts_batch.float()))
+                loss = nn.MSELoss(size_average=False)(output, self.to_var(ts_batch))
                 self.aed.zero_grad()
                 loss.backward()
                 optimizer.step()
@@ -101,34 +100,16 @@ class AUTOENCODER(Base,deepBase, PyTorchUtils):
         error_vectors = []
         for ts_batch in train_gaussian_loader:
             output = self.aed(self.to_var(ts_batch))
-            error = nn.L1Loss(reduce=False)(output, self.to_var(ts_batch.float()))
+            error = nn.L1Loss(reduce=False)(output, self.to_var(ts_batch))
             error_vectors += list(error.view(-1, X.shape[1]).data.cpu().numpy())
 
         self.mean = np.mean(error_vectors, axis=0)
         self.cov = np.cov(error_vectors, rowvar=False)
 
-    def predict(self, X):
-        """Return outliers with -1 and inliers with 1, with the outlierness score calculated from the `decision_function(X)`,
-        and the threshold `contamination`.
-        Parameters
-        ----------
-        X : dataframe of shape (n_samples, n_features)
-            The input samples.
-
-        Returns
-        -------
-        ranking : numpy array of shape (n_samples,)
-            The outlierness of the input samples.
-        """
-        anomalies = self.decision_function(X)
-        ranking = np.sort(anomalies)
-        threshold = ranking[int((1 - self.contamination) * len(ranking))]
-        self.threshold = threshold
-        mask = (anomalies >= threshold)
-        ranking[mask] = -1
-        ranking[np.logical_not(mask)] = 1
-        return ranking
-
+        # threshold_ comes from the training scores, not from each scored batch
+        self.decision_scores_ = self.decision_function(X)
+        self._process_decision_scores()
+        return self
 
 
     def decision_function(self, X: pd.DataFrame) -> np.array:
@@ -146,9 +127,7 @@ class AUTOENCODER(Base,deepBase, PyTorchUtils):
         anomaly_scores : numpy array of shape (n_samples,)
             The anomaly score of the input samples.
         """
-        X.interpolate(inplace=True)
-        X.bfill(inplace=True)
-        data = X.values
+        data = impute(X)
         sequences = [data[i:i + self.sequence_length] for i in range(data.shape[0] - self.sequence_length + 1)]
         data_loader = DataLoader(dataset=sequences, batch_size=self.batch_size, shuffle=False, drop_last=False)
 
@@ -159,7 +138,7 @@ class AUTOENCODER(Base,deepBase, PyTorchUtils):
         errors = []
         for idx, ts in enumerate(data_loader):
             output = self.aed(self.to_var(ts))
-            error = nn.L1Loss(reduce=False)(output, self.to_var(ts.float()))
+            error = nn.L1Loss(reduce=False)(output, self.to_var(ts))
             score = -mvnormal.logpdf(error.view(-1, X.shape[1]).data.cpu().numpy())
             scores.append(score.reshape(ts.size(0), self.sequence_length))
             if self.details:
@@ -188,6 +167,14 @@ class AUTOENCODER(Base,deepBase, PyTorchUtils):
 
         return scores
 
+    def _row_bytes(self, n_features):
+        # every row is in sequence_length windows, each kept in the lattices
+        details = 4 * n_features if self.details else 0
+        return 8 * self.sequence_length * (2 + details)
+
+    def _chunk_overlap(self):
+        return self.sequence_length - 1, self.sequence_length - 1
+
 
 class AutoEncoderModule(nn.Module, PyTorchUtils):
     def __init__(self, n_features: int, sequence_length: int, hidden_size: int, seed: int, gpu: int):
@@ -209,7 +196,7 @@ class AutoEncoderModule(nn.Module, PyTorchUtils):
 
     def forward(self, ts_batch, return_latent: bool=False):
         flattened_sequence = ts_batch.view(ts_batch.size(0), -1)
-        enc = self._encoder(flattened_sequence.float())
+        enc = self._encoder(flattened_sequence)
         dec = self._decoder(enc)
         reconstructed_sequence = dec.view(ts_batch.size())
         return (reconstructed_sequence, enc) if return_latent else reconstructed_sequence
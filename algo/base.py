@@ -1,8 +1,100 @@
+import inspect
+import numbers
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+import numpy as np
+
+from utils.persistence import load_detector, save_detector
+from utils.sketch import QuantileSketch
+from utils.utilities import check_parameter, fingerprint, get_float_dtype
+
+
+def memoize_scores(decision_function):
+    """
+    Decorator keeping the scores of the last input of ``decision_function``,
+    so that scoring the same batch again, e.g. ``predict`` followed by
+    ``decision_function``, returns them without recomputing. Every newly
+    scored batch is added to the score sketch of the detector.
+    """
+    if getattr(decision_function, '_memoized', False):
+        return decision_function
+
+    @wraps(decision_function)
+    def wrapper(self, X, *args, **kwargs):
+        if args or kwargs or self.__dict__.get('_chunking'):
+            return decision_function(self, X, *args, **kwargs)
+        key = fingerprint(X)
+        memo = self.__dict__.get('_scores_memo')
+        if memo is None or memo[0] != key:
+            memo = (key, np.asarray(decision_function(self, X)))
+            self._scores_memo = memo
+            self._update_sketch(memo[1])
+        # a copy, so that callers cannot alter the memoised scores
+        return memo[1].copy()
+
+    wrapper._memoized = True
+    return wrapper
+
+
+def clears_scores(fit):
+    """
+    Decorator dropping the memoised scores and the score sketch before the
+    detector is fitted again.
+    """
+    if getattr(fit, '_clears_scores', False):
+        return fit
+
+    @wraps(fit)
+    def wrapper(self, *args, **kwargs):
+        for name in ('_scores_memo', 'sketch_', 'training_sketch_', 'stream_threshold_'):
+            self.__dict__.pop(name, None)
+        return fit(self, *args, **kwargs)
+
+    wrapper._clears_scores = True
+    return wrapper
+
+
 class Base(object):
     """
     Abstract class for all outlier detection algorithms.
 
+    The ``decision_function`` of every subclass is wrapped by
+    ``memoize_scores`` and its ``fit`` by ``clears_scores``.
+
+    Attributes
+    ----------
+    features : list of str or None
+        The feature columns the detector uses, queried with
+        ``query_data(columns=clf.features)`` so that no other column is
+        transferred. Every column is used if None.
+    sketch_ : QuantileSketch
+        Bounded-memory sketch of every batch scored since the detector was
+        fitted, created on the first scores. Copies of the detector scoring
+        other batches merge theirs with ``merge_sketch``.
+    training_sketch_ : QuantileSketch
+        Sketch of ``decision_scores_``, kept apart from ``sketch_`` so that
+        merged copies count the training scores once.
+    stream_threshold_ : float
+        The contamination threshold of the scores in ``training_sketch_``
+        and ``sketch_`` together, refreshed on every scored batch.
+
     """
+    features = None
+    # whether lower scores are more abnormal, as for the sklearn detectors
+    _inverted_scores = False
+    # whether the score of a row only depends on the row and on the rows
+    # within _chunk_overlap of it, so that the input can be scored in chunks
+    _chunkable = True
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # methods only, e.g. LocalOutlierFactor.decision_function is a property
+        if inspect.isfunction(inspect.getattr_static(cls, 'decision_function')):
+            cls.decision_function = memoize_scores(cls.decision_function)
+        if inspect.isfunction(inspect.getattr_static(cls, 'fit')):
+            cls.fit = clears_scores(cls.fit)
+
     def __init__(self):
         pass
 
@@ -16,21 +108,39 @@ class Base(object):
         """
         pass
 
-    def predict(self, X):
-
-        """Return outliers with -1 and inliers with 1, with the outlierness score calculated from the `decision_function(X)',
-        and the threshold `contamination'.
+    def predict(self, X, batch=False, stream=False):
+        """Return outliers with -1 and inliers with 1, by comparing the outlierness
+        score calculated from the `decision_function(X)' with the threshold
+        `threshold_' fitted on the training data. Labels are in the order of X.
         Parameters
         ----------
         X : dataframe of shape (n_samples, n_features)
             The input samples.
+        batch : bool, optional (default=False)
+            If True, label the `contamination' share of highest scores of
+            this batch as outliers instead. Detectors without a fitted
+            `threshold_' always label this way.
+        stream : bool, optional (default=False)
+            If True, label against `stream_threshold_' instead, which tracks
+            the scores of every batch scored so far. Scores below it are the
+            outliers of detectors whose lower scores are more abnormal.
 
         Returns
         -------
         ranking : numpy array of shape (n_samples,)
             The outlierness of the input samples.
         """
-        pass
+        scores = self.decision_function(X)
+        if stream:
+            threshold = self.__dict__.get('stream_threshold_')
+            if threshold is None:
+                raise ValueError('%s has no stream threshold, it needs a numeric '
+                                 'contamination' % type(self).__name__)
+            scores = np.asarray(scores).ravel()
+            if self._inverted_scores:
+                return np.where(scores<threshold, -1, 1)
+            return np.where(scores>threshold, -1, 1)
+        return self._labels(scores, batch=batch)
 
     def decision_function(self,X):
         """Predict raw anomaly scores of X using the fitted detector.
@@ -49,5 +159,304 @@ class Base(object):
         """
         pass
 
+    def decision_function_chunked(self, X, max_bytes=2 ** 28, n_jobs=1):
+        """Predict raw anomaly scores of X like `decision_function(X)', scoring
+        it in chunks so that the temporaries of a chunk fit in `max_bytes'.
+        The chunk size is derived from the memory cost per row the detector
+        declares. Chunks of sequence models are extended by the rows the
+        windows around their first and last rows need, so that the scores do
+        not change.
+        Parameters
+        ----------
+        X : dataframe or numpy array of shape (n_samples, n_features)
+            The input samples.
+        max_bytes : int, optional (default=2 ** 28)
+            The memory budget for the temporaries of each chunk.
+        n_jobs : int, optional (default=1)
+            The number of chunks scored at once in a thread pool, each within
+            `max_bytes'.
+
+        Returns
+        -------
+        anomaly_scores : numpy array of shape (n_samples,)
+            The anomaly score of the input samples.
+        """
+        check_parameter(n_jobs, low=1, param_name='n_jobs', include_left=True)
+        n_samples = X.shape[0]
+        before, after = self._chunk_overlap()
+        chunk_rows = int(max_bytes // max(self._row_bytes(X.shape[1]), 1)) - before - after
+        if not self._chunkable or chunk_rows >= n_samples:
+            return self.decision_function(X)
+        chunk_rows = max(chunk_rows, 1)
+
+        key = fingerprint(X)
+        memo = self.__dict__.get('_scores_memo')
+        if memo is not None and memo[0] == key:
+            return memo[1].copy()
+
+        scores = np.empty(n_samples, dtype=get_float_dtype())
+
+        def score_chunk(start):
+            end = min(start + chunk_rows, n_samples)
+            lower, upper = max(start - before, 0), min(end + after, n_samples)
+            chunk = X.iloc[lower:upper] if hasattr(X, 'iloc') else X[lower:upper]
+            scores[start:end] = np.asarray(self.decision_function(chunk)).ravel()[start - lower:end - lower]
+
+        # the chunks are not memoised one by one, but the whole input below
+        self._chunking = True
+        try:
+            starts = range(0, n_samples, chunk_rows)
+            if n_jobs > 1:
+                with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                    list(executor.map(score_chunk, starts))
+            else:
+                for start in starts:
+                    score_chunk(start)
+        finally:
+            del self._chunking
+
+        self._scores_memo = (key, scores)
+        self._update_sketch(scores)
+        return scores.copy()
+
+    def fit_predict_score(self, X, fit_cache=None):
+        """Fit detector, and return the labels and the outlierness scores of X
+        from a single scoring pass. Detectors keeping the scores of the training
+        data in ``decision_scores_`` are not scored again.
+        Parameters
+        ----------
+        X : dataframe of shape (n_samples, n_features)
+            The input samples.
+        fit_cache : FitCache, optional (default=None)
+            Cache loading the detector instead of fitting it if it was fitted
+            on the same data with the same parameters before.
+
+        Returns
+        -------
+        labels : numpy array of shape (n_samples,)
+            Outliers with -1 and inliers with 1, in the order of X.
+        anomaly_scores : numpy array of shape (n_samples,)
+            The anomaly score of the input samples.
+        """
+        if fit_cache is None:
+            self.fit(X)
+        else:
+            fit_cache.fit(self, X)
+        scores = getattr(self, 'decision_scores_', None)
+        if scores is None:
+            scores = self.decision_function(X)
+        scores = np.asarray(scores).ravel()
+        return self._labels(scores), scores
+
+    def fit_blocks(self, blocks):
+        """Fit detector on the (timestamps, values) blocks of
+        `utils.utilities.iter_query_data'. By default the blocks are gathered
+        and passed to `fit'; detectors able to fit incrementally hold one
+        block at a time instead, reading the blocks more than once.
+        Parameters
+        ----------
+        blocks : callable
+            Returns a new iterator over the (timestamps, values) blocks on
+            every call, e.g. ``lambda: iter_query_data(...)``.
+        """
+        values = [block for _, block in blocks()]
+        if not values:
+            raise ValueError('No block to fit %s on' % type(self).__name__)
+        return self.fit(np.concatenate(values))
+
+    def score_blocks(self, blocks, stream=False):
+        """Score the (timestamps, values) blocks of
+        `utils.utilities.iter_query_data' one at a time, so that only the
+        scores of the current block are held.
+        Parameters
+        ----------
+        blocks : iterable
+            The (timestamps, values) blocks to score.
+        stream : bool, optional (default=False)
+            Whether to label against `stream_threshold_', see `predict'.
+
+        Yields
+        ------
+        timestamps : numpy array of shape (n_block,)
+            The time stamps of the block.
+        labels : numpy array of shape (n_block,)
+            Outliers with -1 and inliers with 1.
+        anomaly_scores : numpy array of shape (n_block,)
+            The anomaly score of the block.
+        """
+        for timestamps, values in blocks:
+            scores = np.asarray(self.decision_function(values)).ravel()
+            # the scores are memoised, predict does not compute them again
+            yield timestamps, self.predict(values, stream=stream), scores
+
+    def _block_scores(self, blocks):
+        """The scores of every block of `blocks()' in order, e.g. the
+        `decision_scores_' of a detector fitted by `fit_blocks'. The blocks
+        are not memoised one by one."""
+        self._chunking = True
+        try:
+            return np.concatenate([np.asarray(self.decision_function(values)).ravel()
+                                   for _, values in blocks()])
+        finally:
+            del self._chunking
+
+    def save(self, path):
+        """Save the fitted detector into the directory `path', in a versioned
+        format. Big arrays and tensors are stored as `.npy' files, which
+        `load' can memory-map.
+        Parameters
+        ----------
+        path : str
+            Directory of the saved detector, replaced if it exists.
+        """
+        # the scores of the last batch are not part of the model
+        memo = self.__dict__.pop('_scores_memo', None)
+        try:
+            save_detector(self, path)
+        finally:
+            if memo is not None:
+                self._scores_memo = memo
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a detector saved by `save'.
+        Parameters
+        ----------
+        path : str
+            Directory of the saved detector.
+        mmap : bool, optional (default=True)
+            Whether to memory-map the big arrays, so that every process
+            loading the detector shares one copy.
+
+        Returns
+        -------
+        detector : Base
+            The fitted detector.
+        """
+        detector = load_detector(path, mmap=mmap)
+        if not isinstance(detector, cls):
+            raise TypeError('%s holds a %s, not a %s' % (path, type(detector).__name__, cls.__name__))
+        return detector
+
+    def _labels(self, scores, batch=False):
+        """Label scores above `threshold_' as outliers, or in batch mode the
+        `contamination' share of highest scores, lowest for detectors whose
+        lower scores are more abnormal, in linear time. The detector is left
+        unchanged.
+        Parameters
+        ----------
+        scores : numpy array of shape (n_samples,)
+            The anomaly scores.
+        batch : bool, optional (default=False)
+            Whether to threshold relative to this batch of scores.
+
+        Returns
+        -------
+        labels : numpy array of shape (n_samples,)
+            Outliers with -1 and inliers with 1.
+        """
+        scores = np.asarray(scores).ravel()
+        threshold = getattr(self, 'threshold_', None)
+        if batch or threshold is None:
+            if len(scores) == 0:
+                return np.ones(0, dtype=int)
+            contamination = self._outlier_share()
+            if contamination is None:
+                raise ValueError('%s needs a numeric contamination to label a '
+                                 'batch' % type(self).__name__)
+            if self._inverted_scores:
+                scores = -scores
+            # the score ranked (1 - contamination) * n, without sorting
+            k = min(int((1-contamination)*len(scores)), len(scores)-1)
+            threshold = np.partition(scores, k)[k]
+            return np.where(scores>=threshold, -1, 1)
+        return np.where(scores>threshold, -1, 1)
+
+    def _process_decision_scores(self):
+        """Internal function to calculate key attributes:
+        - threshold_: used to decide the binary label
+        - labels_: binary labels of training data
+        Returns
+        -------
+        self
+        """
+
+        self.threshold_ = np.percentile(self.decision_scores_,
+                                        100 * (1 - self.contamination))
+        # the stream starts over, next to the training scores
+        self.sketch_ = None
+        self.training_sketch_ = QuantileSketch().update(self.decision_scores_)
+        self._refresh_stream_threshold()
+        self.labels_ = (self.decision_scores_ > self.threshold_).astype(
+            'int').ravel()
+
+        # calculate for predict_proba()
+
+        self._mu = np.mean(self.decision_scores_)
+        self._sigma = np.std(self.decision_scores_)
+
+        return self
+
+    def _row_bytes(self, n_features):
+        """The bytes of the temporaries of `decision_function' per scored row,
+        by default a copy of the row and its score. Detectors allocating more,
+        e.g. distances to every cluster center, override it."""
+        return 8 * (2 * n_features + 1)
+
+    def _chunk_overlap(self):
+        """The number of rows before and after a chunk needed to score its first
+        and last rows."""
+        return 0, 0
+
+    def merge_sketch(self, other):
+        """Merge the scores seen by another detector, e.g. a copy scoring other
+        batches in a parallel worker, into `sketch_' and refresh
+        `stream_threshold_'. Only the scored batches are merged, the training
+        scores both copies share count once.
+        Parameters
+        ----------
+        other : Base or QuantileSketch
+            The detector or the sketch to merge.
+
+        Returns
+        -------
+        self
+        """
+        other = getattr(other, 'sketch_', other)
+        if other is None:
+            return self
+        if self.__dict__.get('sketch_') is None:
+            self.sketch_ = QuantileSketch()
+        self.sketch_.merge(other)
+        self._refresh_stream_threshold()
+        return self
+
+    def _update_sketch(self, scores):
+        if self.__dict__.get('sketch_') is None:
+            self.sketch_ = QuantileSketch()
+        self.sketch_.update(scores)
+        self._refresh_stream_threshold()
+
+    def _refresh_stream_threshold(self):
+        # computed once per batch, so that reading it costs nothing
+        q = self._stream_quantile()
+        sketches = [sketch for sketch in (self.__dict__.get('training_sketch_'),
+                                          self.__dict__.get('sketch_')) if sketch is not None]
+        if q is not None and sketches:
+            self.stream_threshold_ = sketches[0].quantile(q, *sketches[1:])
 
+    def _outlier_share(self):
+        """The expected share of outliers, the numeric `contamination' of the
+        detector, else None."""
+        contamination = getattr(self, 'contamination', None)
+        if not isinstance(contamination, numbers.Real):
+            return None
+        return contamination
 
+    def _stream_quantile(self):
+        """The quantile of the scores separating the outliers, None if the
+        detector has no expected share of outliers."""
+        share = self._outlier_share()
+        if share is None:
+            return None
+        return share if self._inverted_scores else 1 - share
@@ -2,8 +2,8 @@ import numpy as np
 from algo.base import Base
 from scipy.spatial.distance import cdist
 from sklearn.cluster import KMeans
+from sklearn.utils import check_array
 import warnings
-from numpy import percentile
 
 
 class CBLOF(Base):
@@ -74,17 +74,16 @@ class CBLOF(Base):
         self.random_state = random_state
         self.n_jobs = n_jobs
         self.contamination=contamination
-        self.threshold = None
 
     # noinspection PyIncorrectDocstring
     def fit(self, X,y=None):
         """Fit detector.
         Parameters
         ----------
-        X : dataframe of shape (n_samples, n_features)
+        X : dataframe or numpy array of shape (n_samples, n_features)
             The input samples.
         """
-        X=X.to_numpy()
+        X = check_array(X)
         n_samples, n_features = X.shape
 
         self._validate_estimator(default=KMeans(
@@ -126,46 +125,6 @@ class CBLOF(Base):
         if self.clustering_estimator_ is None:
             raise ValueError("clustering algorithm cannot be None")
 
-    def _process_decision_scores(self):
-        """Internal function to calculate key attributes:
-        - threshold_: used to decide the binary label
-        - labels_: binary labels of training data
-        Returns
-        -------
-        self
-        """
-
-        self.threshold_ = percentile(self.decision_scores_,
-                                     100 * (1 - self.contamination))
-        self.labels_ = (self.decision_scores_ > self.threshold_).astype(
-            'int').ravel()
-
-        self._mu = np.mean(self.decision_scores_)
-        self._sigma = np.std(self.decision_scores_)
-
-        return self
-
-    def predict(self, X):
-        """Return outliers with -1 and inliers with 1, with the outlierness score calculated from the `decision_function(X)',
-        and the threshold `contamination'.
-        Parameters
-        ----------
-        X : dataframe of shape (n_samples, n_features)
-            The input samples.
-
-        Returns
-        -------
-        ranking : numpy array of shape (n_samples,)
-            The outlierness of the input samples.
-        """
-        anomalies = self.decision_function(X)
-        ranking = np.sort(anomalies)
-        threshold = ranking[int((1-self.contamination)*len(ranking))]
-        self.threshold = threshold
-        mask = (anomalies>=threshold)
-        ranking[mask]=-1
-        ranking[np.logical_not(mask)]=1
-        return ranking
 
     def decision_function(self, X):
         """Predict raw anomaly score of X using the fitted detector.
@@ -174,7 +133,7 @@ class CBLOF(Base):
         larger anomaly scores.
         Parameters
         ----------
-        X : dataframe of shape (n_samples, n_features)
+        X : dataframe or numpy array of shape (n_samples, n_features)
             The training input samples. Sparse matrices are accepted only
             if they are supported by the base estimator.
         Returns
@@ -182,9 +141,14 @@ class CBLOF(Base):
         anomaly_scores : numpy array of shape (n_samples,)
             The anomaly score of the input samples.
         """
-        X=X.to_numpy()
+        X = check_array(X)
         labels = self.clustering_estimator_.predict(X)
         return self._decision_function(X, labels)
+
+    def _row_bytes(self, n_features):
+        # the row copies and the distances to the large cluster centers
+        return 8 * (3 * n_features + len(self._large_cluster_centers) + 3)
+
     def _set_cluster_centers(self, X, n_features):
         # Noted not all clustering algorithms have cluster_centers_
         if hasattr(self.clustering_estimator_, 'cluster_centers_'):
@@ -15,6 +15,7 @@ from .algorithm_utils import deepBase, PyTorchUtils
 from .autoencoder import AutoEncoderModule
 from .lstmencdec import LSTMEDModule
 from algo.base import Base
+from utils.preprocessing import impute
 
 
 class DAGMM(Base,deepBase, PyTorchUtils):
@@ -113,9 +114,7 @@ class DAGMM(Base,deepBase, PyTorchUtils):
         X : dataframe of shape (n_samples, n_features)
             The input samples.
         """
-        X.interpolate(inplace=True)
-        X.bfill(inplace=True)
-        data = X.values
+        data = impute(X)
         sequences = [data[i:i + self.sequence_length] for i in range(X.shape[0] - self.sequence_length + 1)]
         data_loader = DataLoader(dataset=sequences, batch_size=self.batch_size, shuffle=True, drop_last=True)
         self.hidden_size = 5 + int(X.shape[1] / 20)
@@ -128,7 +127,7 @@ class DAGMM(Base,deepBase, PyTorchUtils):
         for _ in trange(self.num_epochs):
             for input_data in data_loader:
                 input_data = self.to_var(input_data)
-                self.dagmm_step(input_data.float())
+                self.dagmm_step(input_data)
 
         self.dagmm.eval()
         n = 0
@@ -137,7 +136,7 @@ class DAGMM(Base,deepBase, PyTorchUtils):
         gamma_sum = 0
         for input_data in data_loader:
             input_data = self.to_var(input_data)
-            _, _, z, gamma = self.dagmm(input_data.float())
+            _, _, z, gamma = self.dagmm(input_data)
             phi, mu, cov = self.dagmm.compute_gmm_params(z, gamma)
 
             batch_gamma_sum = torch.sum(gamma, dim=0)
@@ -147,27 +146,12 @@ class DAGMM(Base,deepBase, PyTorchUtils):
             cov_sum += cov * batch_gamma_sum.unsqueeze(-1).unsqueeze(-1)  # keep sums of the numerator only
 
             n += input_data.size(0)
-    def predict(self, X):
-        """Return outliers with -1 and inliers with 1, with the outlierness score calculated from the `decision_function(X)',
-        and the threshold `contamination'.
-        Parameters
-        ----------
-        X : dataframe of shape (n_samples, n_features)
-            The input samples.
 
-        Returns
-        -------
-        ranking : numpy array of shape (n_samples,)
-            The outlierness of the input samples.
-        """
-        anomalies =self.decision_function(X)
-        ranking = np.sort(anomalies)
-        threshold = ranking[int((1-self.contamination)*len(ranking))]
-        self.threshold = threshold
-        mask = (anomalies>=threshold)
-        ranking[mask]=-1
-        ranking[np.logical_not(mask)]=1
-        return ranking
+        # the energies of the training data set threshold_ for every later batch
+        self.decision_scores_ = self.decision_function(X)
+        self._process_decision_scores()
+        return self
+
 
     def decision_function(self, X: pd.DataFrame):
         """Predict raw anomaly score of X using the fitted detector.
@@ -188,9 +172,7 @@ class DAGMM(Base,deepBase, PyTorchUtils):
             The anomaly score of the input samples.
         """
         self.dagmm.eval()
-        X.interpolate(inplace=True)
-        X.bfill(inplace=True)
-        data = X.values
+        data = impute(X)
         sequences = [data[i:i + self.sequence_length] for i in range(len(data) - self.sequence_length + 1)]
         data_loader = DataLoader(dataset=sequences, batch_size=1, shuffle=False)
         test_energy = np.full((self.sequence_length, X.shape[0]), np.nan)
@@ -201,7 +183,7 @@ class DAGMM(Base,deepBase, PyTorchUtils):
         csn_errors = np.full((self.sequence_length, X.shape[0]), np.nan)
 
         for i, sequence in enumerate(data_loader):
-            enc, dec, z, gamma = self.dagmm(self.to_var(sequence).float())
+            enc, dec, z, gamma = self.dagmm(self.to_var(sequence))
             sample_energy, _ = self.dagmm.compute_energy(z, size_average=False)
             idx = (i % self.sequence_length, np.arange(i, i + self.sequence_length))
             test_energy[idx] = sample_energy.data.numpy()
@@ -222,6 +204,13 @@ class DAGMM(Base,deepBase, PyTorchUtils):
 
         return test_energy
 
+    def _row_bytes(self, n_features):
+        # the energy, errors, encodings and decodings of every window of a row
+        return 8 * self.sequence_length * (3 + self.hidden_size + n_features)
+
+    def _chunk_overlap(self):
+        return self.sequence_length - 1, self.sequence_length - 1
+
 
 class DAGMMModule(nn.Module, PyTorchUtils):
     """Residual Block."""
@@ -323,7 +312,7 @@ class DAGMMModule(nn.Module, PyTorchUtils):
         # K x D x D
         cov_inverse = torch.cat(cov_inverse, dim=0)
         # K
-        det_cov = Variable(torch.from_numpy(np.float32(np.array(det_cov))))
+        det_cov = Variable(torch.from_numpy(np.array(det_cov, dtype=self.float_dtype)))
 
         # N x K
         exp_term_tmp = -0.5 * torch.sum(torch.sum(z_mu.unsqueeze(-1) * cov_inverse.unsqueeze(0), dim=-2) * z_mu, dim=-1)
@@ -5,9 +5,8 @@ import numpy as np
 from sklearn.utils import check_array
 from sklearn.utils.validation import check_is_fitted
 from sklearn.utils import column_or_1d
-from .base import Base
+from .base import Base, clears_scores
 from utils.utilities import check_parameter
-from numpy import percentile
 
 
 class HBOS(Base):
@@ -64,7 +63,6 @@ class HBOS(Base):
         self.alpha = alpha
         self.tol = tol
         self.contamination=contamination
-        self.threshold = None
 
         check_parameter(alpha, 0, 1, param_name='alpha')
         check_parameter(tol, 0, 1, param_name='tol')
@@ -74,7 +72,7 @@ class HBOS(Base):
 
         Parameters
         ----------
-        X : dataframe of shape (n_samples, n_features)
+        X : dataframe or numpy array of shape (n_samples, n_features)
             The input samples.
         """
         # validate inputs X and y (optional)
@@ -103,27 +101,52 @@ class HBOS(Base):
         self._process_decision_scores()
         return self
 
-    def _process_decision_scores(self):
-        """Internal function to calculate key attributes:
-        - threshold_: used to decide the binary label
-        - labels_: binary labels of training data
-        Returns
-        -------
-        self
-        """
-
-        self.threshold_ = percentile(self.decision_scores_,
-                                     100 * (1 - self.contamination))
-        self.labels_ = (self.decision_scores_ > self.threshold_).astype(
-            'int').ravel()
-
-        # calculate for predict_proba()
+    @clears_scores
+    def fit_blocks(self, blocks):
+        """Fit detector on the blocks of `utils.utilities.iter_query_data'
+        one block at a time, like `fit' on the whole range. The blocks are
+        read three times: for the range of the bins, for the histograms and
+        for the scores of the training data.
 
-        self._mu = np.mean(self.decision_scores_)
-        self._sigma = np.std(self.decision_scores_)
+        Parameters
+        ----------
+        blocks : callable
+            Returns a new iterator over the (timestamps, values) blocks on
+            every call, e.g. ``lambda: iter_query_data(...)``.
+        """
+        lower = upper = None
+        for _, values in blocks():
+            values = check_array(values)
+            if lower is None:
+                lower, upper = values.min(axis=0), values.max(axis=0)
+            else:
+                lower = np.minimum(lower, values.min(axis=0))
+                upper = np.maximum(upper, values.max(axis=0))
+        if lower is None:
+            raise ValueError('No block to fit HBOS on')
 
+        n_features = lower.shape[0]
+        self.bin_edges_ = np.zeros([self.n_bins + 1, n_features])
+        for i in range(n_features):
+            # the edges np.histogram picks from the range of the feature
+            self.bin_edges_[:, i] = np.histogram_bin_edges(
+                [lower[i], upper[i]], bins=self.n_bins)
+
+        counts = np.zeros([self.n_bins, n_features])
+        n_samples = 0
+        for _, values in blocks():
+            values = check_array(values)
+            n_samples += values.shape[0]
+            for i in range(n_features):
+                counts[:, i] += np.histogram(values[:, i],
+                                             bins=self.bin_edges_[:, i])[0]
+        self.hist_ = counts / n_samples / np.diff(self.bin_edges_, axis=0)
+
+        self.decision_scores_ = self._block_scores(blocks)
+        self._process_decision_scores()
         return self
 
+
     def decision_function(self, X):
         """Predict raw anomaly score of X using the fitted detector.
 
@@ -133,7 +156,7 @@ class HBOS(Base):
 
         Parameters
         ----------
-        X : dataframe of shape (n_samples, n_features)
+        X : dataframe or numpy array of shape (n_samples, n_features)
             The training input samples. Sparse matrices are accepted only
             if they are supported by the base estimator.
         Returns
@@ -142,7 +165,6 @@ class HBOS(Base):
             The anomaly score of the input samples.
         """
         check_is_fitted(self, ['hist_', 'bin_edges_'])
-        X = X.to_numpy()
         X = check_array(X)
         outlier_scores = _calculate_outlier_scores(X, self.bin_edges_,
                                                    self.hist_,
@@ -150,27 +172,9 @@ class HBOS(Base):
                                                    self.alpha, self.tol)
         return invert_order(np.sum(outlier_scores, axis=1))
 
-    def predict(self, X):
-        """Return outliers with -1 and inliers with 1, with the outlierness score calculated from the `decision_function(X)',
-        and the threshold `contamination'.
-        Parameters
-        ----------
-        X : dataframe of shape (n_samples, n_features)
-            The input samples.
-
-        Returns
-        -------
-        ranking : numpy array of shape (n_samples,)
-            The outlierness of the input samples.
-        """
-        anomalies = self.decision_function(X)
-        ranking = np.sort(anomalies)
-        threshold = ranking[int((1-self.contamination)*len(ranking))]
-        self.threshold = threshold
-        mask = (anomalies>=threshold)
-        ranking[mask]=-1
-        ranking[np.logical_not(mask)]=1
-        return ranking
+    def _row_bytes(self, n_features):
+        # the outlier score of every feature and the bin indices
+        return 8 * (4 * n_features + 1)
 
 
 def _calculate_outlier_scores(X, bin_edges, hist, n_bins, alpha,
@@ -208,7 +212,9 @@ def _calculate_outlier_scores(X, bin_edges, hist, n_bins, alpha,
     """
 
     n_samples, n_features = X.shape[0], X.shape[1]
-    outlier_scores = np.zeros(shape=(n_samples, n_features))
+    # float32 inputs keep float32 scores
+    outlier_scores = np.zeros(shape=(n_samples, n_features),
+                              dtype=np.result_type(X.dtype, np.float32))
 
     for i in range(n_features):
 
@@ -1,3 +1,4 @@
+import numpy as np
 from sklearn.ensemble.iforest import IsolationForest
 from algo.base import Base
 
@@ -115,3 +116,16 @@ class IFOREST(IsolationForest,Base):
            Data (TKDD) 6.1 (2012): 3.
     """
 
+    # lower scores are more abnormal
+    _inverted_scores = True
+
+    def predict(self, X, batch=False, stream=False):
+        """Return outliers with -1 and inliers with 1, see Base.predict."""
+        return Base.predict(self, X, batch=batch, stream=stream)
+
+    def _labels(self, scores, batch=False):
+        if batch:
+            return super(IFOREST, self)._labels(scores, batch=True)
+        # the labels of IsolationForest.predict, lower scores are more abnormal
+        threshold = self._threshold_ if self.behaviour == 'old' else 0
+        return np.where(scores < threshold, -1, 1)
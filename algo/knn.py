@@ -4,13 +4,12 @@ from __future__ import division
 from __future__ import print_function
 
 import numpy as np
-from sklearn.neighbors import NearestNeighbors
-from sklearn.neighbors import BallTree
 from sklearn.utils import check_array
 from sklearn.utils.validation import check_is_fitted
-from numpy import percentile
 
 from .base import Base
+from .neighbors import NeighborIndex, check_approx_neighbors, search_algorithm
+from utils.sketch import QuantileSketch
 
 
 class KNN(Base):
@@ -47,23 +46,24 @@ class KNN(Base):
         Range of parameter space to use by default for `radius_neighbors`
         queries.
 
-    algorithm : {'auto', 'ball_tree', 'kd_tree', 'brute'}, optional
+    algorithm : {'auto', 'ball_tree', 'kd_tree', 'brute', 'approx'}, optional
         Algorithm used to compute the nearest neighbors:
 
         - 'ball_tree' will use BallTree
         - 'kd_tree' will use KDTree
-        - 'brute' will use a brute-force search.
-        - 'auto' will attempt to decide the most appropriate algorithm
-          based on the values passed to :meth:`fit` method.
-
-        Note: fitting on sparse input will override the setting of
-        this parameter, using brute force.
+        - 'brute' will use a blocked brute-force search.
+        - 'approx' will use the approximate :class:`algo.neighbors.RPForest`,
+          for Minkowski metrics.
+        - 'auto' will attempt to decide the most appropriate exact algorithm
+          from the number of samples and features and the metric, see
+          :class:`algo.neighbors.NeighborIndex`.
 
     leaf_size : int, optional (default = 30)
-        Leaf size passed to BallTree or KDTree.  This can affect the
-        speed of the construction and query, as well as the memory
+        Leaf size passed to BallTree, KDTree or RPForest.  This can affect
+        the speed of the construction and query, as well as the memory
         required to store the tree.  The optimal value depends on the
-        nature of the problem.
+        nature of the problem. With 'approx' it must be at least
+        ``n_neighbors + 1``.
 
     metric : string or callable, default 'minkowski'
         metric to use for distance computation. Any metric from scikit-learn
@@ -104,7 +104,14 @@ class KNN(Base):
     n_jobs : int, optional (default = 1)
         The number of parallel jobs to run for neighbors search.
         If ``-1``, then the number of jobs is set to the number of CPU cores.
-        Affects only kneighbors and kneighbors_graph methods.
+        Affects the threads querying blocks of rows of the index.
+
+    approx_params : dict, optional (default = None)
+        Keyword arguments of the approximate index trading recall for speed,
+        e.g. ``{'n_trees': 20, 'n_iter': 2, 'random_state': 0}``, see
+        :class:`algo.neighbors.NeighborIndex`. Passing them, ``{}`` for the
+        defaults, selects the approximate index with 'auto'; the search is
+        exact otherwise.
 
     Attributes
     ----------
@@ -124,12 +131,21 @@ class KNN(Base):
         The binary labels of the training data. 0 stands for inliers
         and 1 for outliers/anomalies. It is generated by applying
         ``threshold_`` on ``decision_scores_``.
+
+    index_ : NeighborIndex
+        The neighbour index of the training data, answering both the
+        neighbours of the training samples and of the scored samples. Its
+        ``algorithm_``, ``build_time_`` and ``query_time_`` tell which search
+        structure was picked and what it costs.
+
+    timestamps_ : numpy array of shape (n_samples,) or None
+        The time stamps of the training samples, if given to ``fit``.
     """
 
     def __init__(self, contamination=0.1, n_neighbors=5, method='largest',
                  radius=1.0, algorithm='auto', leaf_size=30,
                  metric='minkowski', p=2, metric_params=None, n_jobs=1,
-                 **kwargs):
+                 approx_params=None):
         super(KNN, self).__init__()
         self.n_neighbors = n_neighbors
         self.method = method
@@ -140,47 +156,143 @@ class KNN(Base):
         self.p = p
         self.metric_params = metric_params
         self.n_jobs = n_jobs
+        self.approx_params = approx_params
         self.contamination=contamination
 
-        self.neigh_ = NearestNeighbors(n_neighbors=self.n_neighbors,
-                                       radius=self.radius,
-                                       algorithm=self.algorithm,
-                                       leaf_size=self.leaf_size,
-                                       metric=self.metric,
-                                       p=self.p,
-                                       metric_params=self.metric_params,
-                                       n_jobs=self.n_jobs,
-                                       **kwargs)
-        self.threshold = None
-
-    def fit(self, X):
+    def fit(self, X, y=None, timestamps=None):
         """Fit detector. y is optional for unsupervised methods.
 
         Parameters
         ----------
         X : dataframe of shape (n_samples, n_features)
             The input samples.
+
+        y : Ignored
+            Not used, present for API consistency by convention.
+
+        timestamps : numpy array of shape (n_samples,), optional
+            The time stamps of the samples, needed by ``expire``.
         """
 
         # validate inputs X and y (optional)
-        X = X.to_numpy()
-
-        if self.metric_params is not None:
-            self.tree_ = BallTree(X, leaf_size=self.leaf_size,
-                                  metric=self.metric,
-                                  **self.metric_params)
-        else:
-            self.tree_ = BallTree(X, leaf_size=self.leaf_size,
-                                  metric=self.metric)
-        self.neigh_.fit(X)
-
-        dist_arr, _ = self.neigh_.kneighbors(n_neighbors=self.n_neighbors,
-                                             return_distance=True)
-        dist = self._get_dist_by_method(dist_arr)
-
-        self.decision_scores_ = dist.ravel()
-        self._process_decision_scores()
+        X = check_array(X)
+        if search_algorithm(self.algorithm, self.approx_params) == 'approx':
+            check_approx_neighbors(self.n_neighbors, self.leaf_size)
+
+        self.index_ = self._index().fit(X)
+
+        # the neighbours of every training sample but itself, kept so that
+        # update and expire only search again for the samples they affect
+        self._neigh_dist, self._neigh_ind = self.index_.query(k=self.n_neighbors)
+        self.timestamps_ = self._check_timestamps(timestamps, X.shape[0])
+        self._refresh_scores()
+
+        return self
+
+    def update(self, X_new, timestamps=None):
+        """Add samples to the training data without refitting. They are
+        appended to the index as a new segment, their neighbours searched,
+        and only the training samples having one of them among their
+        neighbours scored again, so that ``decision_scores_`` and
+        ``threshold_`` are those a fit on all the samples gives. The batches
+        scored since the fit stay in ``sketch_``.
+
+        Parameters
+        ----------
+        X_new : dataframe of shape (n_new_samples, n_features)
+            The new samples.
+
+        timestamps : numpy array of shape (n_new_samples,), optional
+            The time stamps of the new samples, required if the detector was
+            fitted with time stamps.
+
+        Returns
+        -------
+        self
+        """
+        check_is_fitted(self, ['index_', 'decision_scores_'])
+        X_new = check_array(X_new)
+        if (timestamps is None) != (self.timestamps_ is None):
+            raise ValueError('timestamps must be given to update if and only '
+                             'if they were given to fit')
+        timestamps = self._check_timestamps(timestamps, X_new.shape[0])
+        n_samples = self.index_.n_samples_
+
+        # the training samples closer to a new sample than to a neighbour
+        new = self._index().fit(X_new)
+        changed = []
+        offset = 0
+        for samples in self.index_.samples():
+            dist, ind = new.query(samples, k=min(self.n_neighbors, X_new.shape[0]))
+            closer = np.flatnonzero(dist[:, 0] < self._neigh_dist[offset:offset + len(samples), -1])
+            rows = closer + offset
+            self._neigh_dist[rows], self._neigh_ind[rows] = _merge_neighbors(
+                self._neigh_dist[rows], self._neigh_ind[rows], dist[closer],
+                ind[closer] + n_samples, self.n_neighbors)
+            changed.append(rows)
+            offset += len(samples)
+        changed = np.concatenate(changed)
+
+        self.index_.append(X_new)
+        dist, ind = self.index_.query(k=self.n_neighbors, rows=np.arange(
+            n_samples, n_samples + X_new.shape[0]))
+        self._neigh_dist = np.concatenate([self._neigh_dist, dist])
+        self._neigh_ind = np.concatenate([self._neigh_ind, ind])
+        if timestamps is not None:
+            self.timestamps_ = np.concatenate([self.timestamps_, timestamps])
+
+        removed = self.decision_scores_[changed]
+        self.decision_scores_ = np.concatenate([self.decision_scores_,
+                                                self._get_dist_by_method(dist)])
+        self.decision_scores_[changed] = self._get_dist_by_method(self._neigh_dist[changed])
+        self._update_scores(removed, np.concatenate([
+            self.decision_scores_[changed], self.decision_scores_[n_samples:]]))
+        return self
+
+    def expire(self, before_ts):
+        """Drop the training samples stamped before ``before_ts``, e.g. to keep
+        a sliding window of the last hours. Only the segments of the index
+        holding them are rebuilt, and only the samples which lost a neighbour
+        searched and scored again, so that ``decision_scores_`` and
+        ``threshold_`` are those a fit on the remaining samples gives. The
+        batches scored since the fit stay in ``sketch_``.
+
+        Parameters
+        ----------
+        before_ts : datetime64, str or number
+            The oldest time stamp kept, comparable to the time stamps given to
+            ``fit``.
 
+        Returns
+        -------
+        self
+        """
+        check_is_fitted(self, ['index_', 'decision_scores_'])
+        if self.timestamps_ is None:
+            raise ValueError('The detector was fitted without timestamps')
+        expired = self.timestamps_ < np.asarray(before_ts).astype(self.timestamps_.dtype)
+        if not expired.any():
+            return self
+        kept = ~expired
+        if kept.sum() <= self.n_neighbors:
+            raise ValueError('Expiring would keep %d samples, n_neighbors=%d '
+                             'needs more' % (kept.sum(), self.n_neighbors))
+
+        self.index_.remove(expired)
+        # the positions of the samples after the removal, -1 if expired
+        position = np.where(kept, np.cumsum(kept) - 1, -1)
+        self._neigh_dist = self._neigh_dist[kept]
+        self._neigh_ind = position[self._neigh_ind[kept]]
+        self.timestamps_ = self.timestamps_[kept]
+        removed = self.decision_scores_[expired]
+        self.decision_scores_ = self.decision_scores_[kept]
+        rows = np.flatnonzero((self._neigh_ind < 0).any(axis=1))
+        if len(rows):
+            self._neigh_dist[rows], self._neigh_ind[rows] = self.index_.query(
+                k=self.n_neighbors, rows=rows)
+            removed = np.concatenate([removed, self.decision_scores_[rows]])
+            self.decision_scores_[rows] = self._get_dist_by_method(self._neigh_dist[rows])
+        self._update_scores(removed, self.decision_scores_[rows])
         return self
 
     def decision_function(self, X):
@@ -200,51 +312,67 @@ class KNN(Base):
         anomaly_scores : numpy array of shape (n_samples,)
             The anomaly score of the input samples.
         """
-        X = X.to_numpy()
-        check_is_fitted(self, ['tree_', 'decision_scores_',
+        check_is_fitted(self, ['index_', 'decision_scores_',
                                'threshold_', 'labels_'])
 
-        X = check_array(X)
-
-        # initialize the output score
-        pred_scores = np.zeros([X.shape[0], 1])
-
-        for i in range(X.shape[0]):
-            x_i = X[i, :]
-            x_i = np.asarray(x_i).reshape(1, x_i.shape[0])
-
-            # get the distance of the current point
-            dist_arr, _ = self.tree_.query(x_i, k=self.n_neighbors)
-            dist = self._get_dist_by_method(dist_arr)
-            pred_score_i = dist[-1]
-
-            # record the current item
-            pred_scores[i, :] = pred_score_i
-
-        return pred_scores.ravel()
-
-    def predict(self,X):
-        """Return outliers with -1 and inliers with 1, with the outlierness score calculated from the `decision_function(X)',
-        and the threshold `contamination'.
-        Parameters
-        ----------
-        X : dataframe of shape (n_samples, n_features)
-            The input samples.
-
-        Returns
-        -------
-        ranking : numpy array of shape (n_samples,)
-            The outlierness of the input samples.
-        """
-        anomalies = self.decision_function(X)
-        ranking = np.sort(anomalies)
-        threshold = ranking[int((1-self.contamination)*len(ranking))]
-        self.threshold = threshold
-        mask = (anomalies>=threshold)
-        ranking[mask]=-1
-        ranking[np.logical_not(mask)]=1
-        return ranking
+        # one query over blocks of rows, on n_jobs threads
+        dist_arr, _ = self.index_.query(X, k=self.n_neighbors)
+        return self._get_dist_by_method(dist_arr)
+
+    def _index(self):
+        return NeighborIndex(algorithm=search_algorithm(self.algorithm, self.approx_params),
+                             leaf_size=self.leaf_size,
+                             metric=self.metric, p=self.p,
+                             metric_params=self.metric_params,
+                             n_jobs=self.n_jobs, **(self.approx_params or {}))
+
+    def _check_timestamps(self, timestamps, n_samples):
+        if timestamps is None:
+            return None
+        timestamps = np.asarray(timestamps)
+        if timestamps.shape != (n_samples,):
+            raise ValueError('Expected %d timestamps, got an array of shape %s'
+                             % (n_samples, timestamps.shape))
+        return timestamps
+
+    def _refresh_scores(self):
+        self.decision_scores_ = self._get_dist_by_method(self._neigh_dist).ravel()
+        # kept sorted, so that update and expire find threshold_ without
+        # going over every score again
+        self._sorted_scores = np.sort(self.decision_scores_)
+        self._score_sums = (self.decision_scores_.sum(),
+                            np.square(self.decision_scores_).sum())
+        self._process_decision_scores()
 
+    def _update_scores(self, removed, added):
+        """Take the training scores ``removed`` out of the sorted scores and
+        put ``added`` in, then refresh what is derived from them."""
+        # the scores expired or scored again drop memoised scores too
+        self.__dict__.pop('_scores_memo', None)
+        scores = self._sorted_scores
+        removed, added = np.sort(removed), np.sort(added)
+        if len(removed):
+            # equal scores are taken from consecutive positions
+            positions = (np.searchsorted(scores, removed) + np.arange(len(removed))
+                         - np.searchsorted(removed, removed))
+            scores = np.delete(scores, positions)
+        self._sorted_scores = np.insert(scores, np.searchsorted(scores, added), added)
+        total, squares = self._score_sums
+        self._score_sums = (total - removed.sum() + added.sum(),
+                            squares - np.square(removed).sum() + np.square(added).sum())
+
+        # np.percentile of decision_scores_, read off the sorted scores
+        n_samples = len(self._sorted_scores)
+        position = (1 - self.contamination) * (n_samples - 1)
+        lower = int(np.floor(position))
+        upper = min(lower + 1, n_samples - 1)
+        low, high = self._sorted_scores[lower], self._sorted_scores[upper]
+        self.threshold_ = low + (high - low) * (position - lower)
+        self.labels_ = (self.decision_scores_ > self.threshold_).astype('int')
+        self._mu = self._score_sums[0] / n_samples
+        self._sigma = np.sqrt(max(self._score_sums[1] / n_samples - self._mu ** 2, 0))
+        self.training_sketch_ = QuantileSketch.from_sorted(self._sorted_scores)
+        self._refresh_stream_threshold()
 
     def _get_dist_by_method(self, dist_arr):
         """Internal function to decide how to process passed in distance array
@@ -267,23 +395,12 @@ class KNN(Base):
         elif self.method == 'median':
             return np.median(dist_arr, axis=1)
 
-    def _process_decision_scores(self):
-        """Internal function to calculate key attributes:
-        - threshold_: used to decide the binary label
-        - labels_: binary labels of training data
-        Returns
-        -------
-        self
-        """
-
-        self.threshold_ = percentile(self.decision_scores_,
-                                     100 * (1 - self.contamination))
-        self.labels_ = (self.decision_scores_ > self.threshold_).astype(
-            'int').ravel()
-
-        # calculate for predict_proba()
-
-        self._mu = np.mean(self.decision_scores_)
-        self._sigma = np.std(self.decision_scores_)
 
-        return self
\ No newline at end of file
+def _merge_neighbors(dist, ind, new_dist, new_ind, k):
+    """The k nearest of two sets of neighbours of the same samples, the first
+    set first among equal distances."""
+    dist = np.concatenate([dist, new_dist], axis=1)
+    ind = np.concatenate([ind, new_ind], axis=1)
+    nearest = np.argsort(dist, axis=1, kind='mergesort')[:, :k]
+    rows = np.arange(dist.shape[0])[:, None]
+    return dist[rows, nearest], ind[rows, nearest]
@@ -1,5 +1,8 @@
+import numpy as np
 from sklearn.neighbors import LocalOutlierFactor
+from sklearn.utils import check_array
 from algo.base import Base
+from algo.neighbors import NeighborIndex, check_approx_neighbors, search_algorithm
 
 class LOF(LocalOutlierFactor,Base):
 
@@ -21,11 +24,14 @@ class LOF(LocalOutlierFactor,Base):
         Number of neighbors to use by default for :meth:`kneighbors` queries.
         If n_neighbors is larger than the number of samples provided,
         all samples will be used.
-    algorithm : {'auto', 'ball_tree', 'kd_tree', 'brute'}, optional
+    algorithm : {'auto', 'ball_tree', 'kd_tree', 'brute', 'approx'}, optional
         Algorithm used to compute the nearest neighbors:
         - 'ball_tree' will use :class:`BallTree`
         - 'kd_tree' will use :class:`KDTree`
         - 'brute' will use a brute-force search.
+        - 'approx' will use the approximate :class:`algo.neighbors.RPForest`,
+          for Minkowski metrics. ``leaf_size`` must then be at least
+          ``n_neighbors + 1``.
         - 'auto' will attempt to decide the most appropriate algorithm
           based on the values passed to :meth:`fit` method.
         Note: fitting on sparse input will override the setting of
@@ -84,6 +90,12 @@ class LOF(LocalOutlierFactor,Base):
         ``-1`` means using all processors. See :term:`Glossary <n_jobs>`
         for more details.
         Affects only :meth:`kneighbors` and :meth:`kneighbors_graph` methods.
+    approx_params : dict, optional (default=None)
+        Keyword arguments of the approximate index trading recall for speed,
+        e.g. ``{'n_trees': 20, 'n_iter': 2, 'random_state': 0}``, see
+        :class:`algo.neighbors.NeighborIndex`. Passing them, ``{}`` for the
+        defaults, selects the approximate index with 'auto'; the search is
+        exact otherwise.
     Attributes
     ----------
     negative_outlier_factor_ : numpy array, shape (n_samples,)
@@ -104,8 +116,100 @@ class LOF(LocalOutlierFactor,Base):
         contamination parameter different than "auto" is provided. In that
         case, the offset is defined in such a way we obtain the expected
         number of outliers in training.
+    index_ : NeighborIndex
+        The approximate neighbour index, with 'approx' only.
     References
     ----------
     .. [1] Breunig, M. M., Kriegel, H. P., Ng, R. T., & Sander, J. (2000, May).
            LOF: identifying density-based local outliers. In ACM sigmod record.
-    """
\ No newline at end of file
+    """
+
+    # lower scores are more abnormal
+    _inverted_scores = True
+
+    def __init__(self, n_neighbors=20, algorithm='auto', leaf_size=30,
+                 metric='minkowski', p=2, metric_params=None,
+                 contamination=0.1, novelty=False, n_jobs=None,
+                 approx_params=None):
+        super(LOF, self).__init__(n_neighbors=n_neighbors, algorithm=algorithm,
+                                  leaf_size=leaf_size, metric=metric, p=p,
+                                  metric_params=metric_params,
+                                  contamination=contamination,
+                                  novelty=novelty, n_jobs=n_jobs)
+        self.approx_params = approx_params
+
+    def fit(self, X, y=None):
+        """Fit the local outlier factor detector on X, see
+        LocalOutlierFactor.fit. With 'approx', the neighbours come from an
+        approximate index.
+        Parameters
+        ----------
+        X : dataframe of shape (n_samples, n_features)
+            The input samples.
+        """
+        self.__dict__.pop('index_', None)
+        if search_algorithm(self.algorithm, self.approx_params) != 'approx':
+            return super(LOF, self).fit(X, y)
+        # the steps of LocalOutlierFactor.fit, with the neighbours of the
+        # training samples taken from the approximate index
+        X = check_array(X)
+        check_approx_neighbors(self.n_neighbors, self.leaf_size)
+        self.index_ = NeighborIndex(algorithm='approx', leaf_size=self.leaf_size,
+                                    metric=self.metric, p=self.p,
+                                    metric_params=self.metric_params,
+                                    n_jobs=self.n_jobs,
+                                    **(self.approx_params or {})).fit(X)
+        self._fit_X = X
+        self.n_samples_fit_ = X.shape[0]
+        self.n_neighbors_ = max(1, min(self.n_neighbors, X.shape[0] - 1))
+        self._distances_fit_X_, neighbors = self.kneighbors(
+            n_neighbors=self.n_neighbors_)
+        self._lrd = self._local_reachability_density(self._distances_fit_X_,
+                                                     neighbors)
+        self.negative_outlier_factor_ = -np.mean(
+            self._lrd[neighbors] / self._lrd[:, np.newaxis], axis=1)
+        if self.contamination == 'auto':
+            self.offset_ = -1.5
+        else:
+            self.offset_ = np.percentile(self.negative_outlier_factor_,
+                                         100. * self.contamination)
+        return self
+
+    def kneighbors(self, X=None, n_neighbors=None, return_distance=True):
+        """Find the k nearest neighbours of X, or of every training sample
+        among the others if X is None, see KNeighborsMixin.kneighbors."""
+        index = self.__dict__.get('index_')
+        if index is None:
+            return super(LOF, self).kneighbors(X, n_neighbors, return_distance)
+        dist, ind = index.query(X, k=n_neighbors or self.n_neighbors)
+        return (dist, ind) if return_distance else ind
+
+    def decision_function(self, X):
+        """Shifted opposite of the Local Outlier Factor of X, negative for
+        outliers, as LocalOutlierFactor.decision_function. Only available
+        with novelty=True.
+        Parameters
+        ----------
+        X : dataframe of shape (n_samples, n_features)
+            The input samples.
+
+        Returns
+        -------
+        anomaly_scores : numpy array of shape (n_samples,)
+            The anomaly score of the input samples, lower is more abnormal.
+        """
+        # a method, unlike sklearn's property, so that Base memoises it
+        if not self.novelty:
+            raise AttributeError('decision_function is not available when '
+                                 'novelty=False, use novelty=True')
+        return self.score_samples(X) - self.offset_
+
+    def predict(self, X, batch=False, stream=False):
+        """Return outliers with -1 and inliers with 1, see Base.predict."""
+        return Base.predict(self, X, batch=batch, stream=stream)
+
+    def _labels(self, scores, batch=False):
+        if batch:
+            return super(LOF, self)._labels(scores, batch=True)
+        # the labels of LocalOutlierFactor.predict, lower scores are more abnormal
+        return np.where(scores < 0, -1, 1)
@@ -7,6 +7,7 @@ from tqdm import trange
 
 from .algorithm_utils import deepBase, PyTorchUtils
 from algo.base import Base
+from utils.preprocessing import impute
 
 
 class LSTMAD(Base,deepBase, PyTorchUtils):
@@ -44,6 +45,9 @@ class LSTMAD(Base,deepBase, PyTorchUtils):
         The percentage of outliers
 
     """
+    # the hidden state runs over the whole input, so a chunk starting from
+    # a fresh state scores its rows differently
+    _chunkable = False
 
     def __init__(self, len_in=1, len_out=10, num_epochs=100, lr=1e-3, batch_size=1,
                  seed: int=None, gpu: int=None, details=True,contamination=0.05):
@@ -66,15 +70,14 @@ class LSTMAD(Base,deepBase, PyTorchUtils):
         X : dataframe of shape (n_samples, n_features)
             The input samples.
         """
-        X.interpolate(inplace=True)
-        X.bfill(inplace=True)
+        X = impute(X)
         self.batch_size = 1
         self._build_model(X.shape[-1], self.batch_size)
 
         self.model.train()
         split_point = int(0.75 * len(X))
-        X_train = X.loc[:split_point, :]
-        X_train_gaussian = X.loc[split_point:, :]
+        X_train = X[:split_point + 1]
+        X_train_gaussian = X[split_point:]
 
         input_data_train, target_data_train = self._input_and_target_data(X_train)
         self._train_model(input_data_train, target_data_train)
@@ -87,27 +90,11 @@ class LSTMAD(Base,deepBase, PyTorchUtils):
         self.mean = np.mean(norm, axis=0)
         self.cov = np.cov(norm.T)
 
-    def predict(self, X):
-        """Return outliers with -1 and inliers with 1, with the outlierness score calculated from the `decision_function(X)',
-        and the threshold `contamination'.
-        Parameters
-        ----------
-        X : dataframe of shape (n_samples, n_features)
-            The input samples.
+        # the training scores set threshold_, shared by every later batch
+        self.decision_scores_ = self.decision_function(X)
+        self._process_decision_scores()
+        return self
 
-        Returns
-        -------
-        ranking : numpy array of shape (n_samples,)
-            The outlierness of the input samples.
-        """
-        anomalies =self.decision_function(X)
-        ranking = np.sort(anomalies)
-        threshold = ranking[int((1-self.contamination)*len(ranking))]
-        self.threshold = threshold
-        mask = (anomalies>=threshold)
-        ranking[mask]=-1
-        ranking[np.logical_not(mask)]=1
-        return ranking
 
     def decision_function(self, X):
         """Predict raw anomaly score of X using the fitted detector.
@@ -126,8 +113,7 @@ class LSTMAD(Base,deepBase, PyTorchUtils):
         anomaly_scores : numpy array of shape (n_samples,)
             The anomaly score of the input samples.
         """
-        X.interpolate(inplace=True)
-        X.bfill(inplace=True)
+        X = impute(X)
         self.model.eval()
         input_data, target_data = self._input_and_target_data_eval(X)
 
@@ -176,7 +162,6 @@ class LSTMAD(Base,deepBase, PyTorchUtils):
     def _build_model(self, d, batch_size):
         self.model = LSTMSequence(d, batch_size, len_in=self.len_in, len_out=self.len_out)
         self.to_device(self.model)
-        self.model.double()
 
         self.loss = torch.nn.MSELoss()
         self.optimizer = torch.optim.Adam(self.model.parameters(), lr=self.lr)
@@ -216,10 +201,11 @@ class LSTMSequence(torch.nn.Module):
 
     def forward(self, input):
         outputs = []
-        h_t = Variable(self.h_t.double(), requires_grad=False)
-        c_t = Variable(self.c_t.double(), requires_grad=False)
-        h_t2 = Variable(self.h_t2.double(), requires_grad=False)
-        c_t2 = Variable(self.c_t2.double(), requires_grad=False)
+        # the buffers take the dtype of the model
+        h_t = Variable(self.h_t, requires_grad=False)
+        c_t = Variable(self.c_t, requires_grad=False)
+        h_t2 = Variable(self.h_t2, requires_grad=False)
+        c_t2 = Variable(self.c_t2, requires_grad=False)
 
         for input_t in input.chunk(input.size(1), dim=1):
             h_t, c_t = self.lstm1(input_t.squeeze(dim=1), (h_t, c_t))
@@ -11,6 +11,7 @@ from tqdm import trange
 
 from .algorithm_utils import deepBase, PyTorchUtils
 from algo.base import Base
+from utils.preprocessing import impute
 
 
 class LSTMED(Base,deepBase, PyTorchUtils):
@@ -90,9 +91,7 @@ class LSTMED(Base,deepBase, PyTorchUtils):
         X : dataframe of shape (n_samples, n_features)
             The input samples.
         """
-        X.interpolate(inplace=True)
-        X.bfill(inplace=True)
-        data = X.values
+        data = impute(X)
         sequences = [data[i:i + self.sequence_length] for i in range(data.shape[0] - self.sequence_length + 1)]
         indices = np.random.permutation(len(sequences))
         split_point = int(self.train_gaussian_percentage * len(sequences))
@@ -112,7 +111,7 @@ class LSTMED(Base,deepBase, PyTorchUtils):
             logging.debug(f'Epoch {epoch+1}/{self.num_epochs}.')
             for ts_batch in train_loader:
                 output = self.lstmed(self.to_var(ts_batch))
-                loss = nn.MSELoss(size_average=False)(output, self.to_var(ts_batch.float()))
+                loss = nn.MSELoss(size_average=False)(output, self.to_var(ts_batch))
                 self.lstmed.zero_grad()
                 loss.backward()
                 optimizer.step()
@@ -121,34 +120,16 @@ class LSTMED(Base,deepBase, PyTorchUtils):
         error_vectors = []
         for ts_batch in train_gaussian_loader:
             output = self.lstmed(self.to_var(ts_batch))
-            error = nn.L1Loss(reduce=False)(output, self.to_var(ts_batch.float()))
+            error = nn.L1Loss(reduce=False)(output, self.to_var(ts_batch))
             error_vectors += list(error.view(-1, X.shape[1]).data.cpu().numpy())
 
         self.mean = np.mean(error_vectors, axis=0)
         self.cov = np.cov(error_vectors, rowvar=False)
 
-    def predict(self, X):
-
-        """Return outliers with -1 and inliers with 1, with the outlierness score calculated from the `decision_function(X)',
-        and the threshold `contamination'.
-        Parameters
-        ----------
-        X : dataframe of shape (n_samples, n_features)
-            The input samples.
-
-        Returns
-        -------
-        ranking : numpy array of shape (n_samples,)
-            The outlierness of the input samples.
-        """
-        anomalies =self.decision_function(X)
-        ranking = np.sort(anomalies)
-        threshold = ranking[int((1-self.contamination)*len(ranking))]
-        self.threshold = threshold
-        mask = (anomalies>=threshold)
-        ranking[mask]=-1
-        ranking[np.logical_not(mask)]=1
-        return ranking
+        # later batches are labelled against the training threshold_
+        self.decision_scores_ = self.decision_function(X)
+        self._process_decision_scores()
+        return self
 
 
     def decision_function(self, X: pd.DataFrame):
@@ -168,9 +149,7 @@ class LSTMED(Base,deepBase, PyTorchUtils):
         anomaly_scores : numpy array of shape (n_samples,)
             The anomaly score of the input samples.
         """
-        X.interpolate(inplace=True)
-        X.bfill(inplace=True)
-        data = X.values
+        data = impute(X)
         sequences = [data[i:i + self.sequence_length] for i in range(data.shape[0] - self.sequence_length + 1)]
         data_loader = DataLoader(dataset=sequences, batch_size=self.batch_size, shuffle=False, drop_last=False)
 
@@ -181,7 +160,7 @@ class LSTMED(Base,deepBase, PyTorchUtils):
         errors = []
         for idx, ts in enumerate(data_loader):
             output = self.lstmed(self.to_var(ts))
-            error = nn.L1Loss(reduce=False)(output, self.to_var(ts.float()))
+            error = nn.L1Loss(reduce=False)(output, self.to_var(ts))
             score = -mvnormal.logpdf(error.view(-1, X.shape[1]).data.cpu().numpy())
             scores.append(score.reshape(ts.size(0), self.sequence_length))
             if self.details:
@@ -210,6 +189,14 @@ class LSTMED(Base,deepBase, PyTorchUtils):
 
         return scores
 
+    def _row_bytes(self, n_features):
+        # every row is in sequence_length windows, each kept in the lattices
+        details = 4 * n_features if self.details else 0
+        return 8 * self.sequence_length * (2 + details)
+
+    def _chunk_overlap(self):
+        return self.sequence_length - 1, self.sequence_length - 1
+
 
 class LSTMEDModule(nn.Module, PyTorchUtils):
     def __init__(self, n_features: int, hidden_size: int,
@@ -241,7 +228,7 @@ class LSTMEDModule(nn.Module, PyTorchUtils):
         batch_size = ts_batch.shape[0]
 
         enc_hidden = self._init_hidden(batch_size)  # initialization with zero
-        _, enc_hidden = self.encoder(ts_batch.float(), enc_hidden)  # .float() here or .double() for the model
+        _, enc_hidden = self.encoder(ts_batch, enc_hidden)
 
         dec_hidden = enc_hidden
         output = self.to_var(torch.Tensor(ts_batch.size()).zero_())
@@ -249,7 +236,7 @@ class LSTMEDModule(nn.Module, PyTorchUtils):
             output[:, i, :] = self.hidden2output(dec_hidden[0][0, :])
 
             if self.training:
-                _, dec_hidden = self.decoder(ts_batch[:, i].unsqueeze(1).float(), dec_hidden)
+                _, dec_hidden = self.decoder(ts_batch[:, i].unsqueeze(1), dec_hidden)
             else:
                 _, dec_hidden = self.decoder(output[:, i].unsqueeze(1), dec_hidden)
 
@@ -20,6 +20,9 @@ class luminolDet(Base):
     define the threshold on the decision function.
 
     """
+    # the scores are those of the fitted series
+    _chunkable = False
+
     def __init__(self,contamination=0.1):
         self.contamination=contamination
 
@@ -41,32 +44,11 @@ class luminolDet(Base):
         self.ts=timestamp
         self.ts_value=value
         self.detector = anomaly_detector.AnomalyDetector(lts)
+        self.decision_scores_ = np.reshape(self.detector.get_all_scores().values,-1)
+        self._process_decision_scores()
 
         return self
 
-    def predict(self,ts):
-        """Return outliers with -1 and inliers with 1, with the outlierness score calculated from the `decision_function(X)',
-        and the threshold `contamination'.
-        Parameters
-        ----------
-        X : dataframe of shape (n_samples, n_features)
-            The input samples.
-
-        Returns
-        -------
-        ranking : numpy array of shape (n_samples,)
-            The outlierness of the input samples.
-        """
-        anomalies = np.reshape(self.detector.get_all_scores().values,-1)
-        self.decision=anomalies
-        ranking = np.sort(anomalies)
-        threshold = ranking[int((1-self.contamination)*len(ranking))]
-        self.threshold = threshold
-        mask = (anomalies>=threshold)
-        ranking[mask]=-1
-        ranking[np.logical_not(mask)]=1
-        return ranking
-
     def decision_function(self,ts):
         """Predict raw anomaly score of X using the fitted detector.
 
@@ -84,7 +66,8 @@ class luminolDet(Base):
         anomaly_scores : numpy array of shape (n_samples,)
             The anomaly score of the input samples.
         """
-        return self.decision
+        # luminol scores the fitted series only
+        return self.decision_scores_
 
 
 
@@ -0,0 +1,585 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from sklearn.metrics import pairwise_distances
+from sklearn.neighbors import BallTree, DistanceMetric, KDTree
+from sklearn.utils import check_array, check_random_state
+
+from utils.utilities import check_parameter
+
+# rows sent to a tree in one query call
+QUERY_ROWS = 4096
+
+# trees stop pruning well in more dimensions than this
+MAX_TREE_FEATURES = 15
+
+# the Minkowski exponent of the metrics the approximate index supports
+_APPROX_METRICS = {'euclidean': 2, 'l2': 2, 'manhattan': 1, 'l1': 1,
+                   'cityblock': 1, 'minkowski': None}
+
+
+def n_threads(n_jobs):
+    """The number of threads ``n_jobs`` stands for, -1 meaning every core."""
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max(os.cpu_count() + 1 + n_jobs, 1)
+    return max(n_jobs, 1)
+
+
+def search_algorithm(algorithm, approx_params):
+    """The search structure of the index of a detector. Exact search is the
+    default, the approximate index is only used when asked for, with
+    'approx' or by passing ``approx_params``, ``{}`` for its defaults: at its
+    default settings it does not beat exact search at a usable recall, see
+    test/run_time_neighbors.py for the trade-off."""
+    if approx_params is None or algorithm == 'approx':
+        return algorithm
+    if algorithm != 'auto':
+        raise ValueError("approx_params select the approximate search, "
+                         "which algorithm=%r excludes" % algorithm)
+    return 'approx'
+
+
+def check_approx_neighbors(n_neighbors, leaf_size):
+    """Raise when ``n_neighbors`` does not fit the leaves of the approximate
+    index, which answer a training sample with itself and its neighbours."""
+    if n_neighbors + 1 > leaf_size:
+        raise ValueError("n_neighbors=%s needs leaf_size >= %s with "
+                         "algorithm='approx', got leaf_size=%s"
+                         % (n_neighbors, n_neighbors + 1, leaf_size))
+
+
+class RPForest(object):
+    """Random projection forest with a neighbour graph, an approximate nearest
+    neighbour index for Minkowski distances. Each tree splits the samples at
+    the median of their projection on a random direction, one direction per
+    depth, until the leaves hold ``leaf_size`` to ``2 * leaf_size - 1``
+    samples. The samples sharing a leaf with a query in any tree are its
+    first candidates, which ``n_iter`` rounds then extend by the neighbours
+    of the nearest candidates in a graph linking every sample to its
+    approximate nearest neighbours. The graph is refined the same way, each
+    sample exploring the neighbours of its neighbours.
+
+    Parameters
+    ----------
+    X : numpy array of shape (n_samples, n_features)
+        The indexed samples.
+
+    n_trees : int, optional (default = 10)
+        The number of trees.
+
+    leaf_size : int, optional (default = 30)
+        The minimum number of samples in a leaf, and the largest k a query
+        can ask for.
+
+    n_iter : int, optional (default = 1)
+        The rounds of graph exploration, 0 to search the leaves only and not
+        build the graph.
+
+    p : float, optional (default = 2)
+        The exponent of the Minkowski distance.
+
+    random_state : int, RandomState instance or None, optional (default=None)
+        Draws the projection directions.
+
+    block_bytes : int, optional (default = 2 ** 26)
+        The size of the candidate blocks while building the graph.
+
+    Attributes
+    ----------
+    graph_ : numpy array of shape (n_samples, n_graph_neighbors) or None
+        The approximate nearest neighbours of every sample, itself included.
+    """
+
+    def __init__(self, X, n_trees=10, leaf_size=30, n_iter=1, p=2,
+                 random_state=None, block_bytes=2 ** 26):
+        check_parameter(n_trees, low=1, param_name='n_trees', include_left=True)
+        check_parameter(leaf_size, low=1, param_name='leaf_size', include_left=True)
+        check_parameter(n_iter, low=0, param_name='n_iter', include_left=True)
+        self.n_trees = n_trees
+        self.leaf_size = leaf_size
+        self.n_iter = n_iter
+        self.p = p
+        self._fit_X = X
+        random_state = check_random_state(random_state)
+        self.trees_ = [self._build(X, random_state) for _ in range(n_trees)]
+
+        self.graph_ = None
+        if n_iter > 0:
+            degree = self._degree
+            block_rows = max(int(block_bytes // (8 * self.n_candidates * X.shape[1])), 1)
+            graph = np.empty((X.shape[0], degree), dtype=np.intp)
+            for start in range(0, X.shape[0], block_rows):
+                rows = X[start:start + block_rows]
+                graph[start:start + block_rows] = self._nearest(rows, self._leaf_members(rows), degree)[1]
+            for _ in range(n_iter):
+                refined = np.empty_like(graph)
+                for start in range(0, X.shape[0], block_rows):
+                    end = start + block_rows
+                    refined[start:end] = self._nearest(X[start:end], self._explore(graph, graph[start:end]), degree)[1]
+                graph = refined
+            self.graph_ = graph
+
+    @property
+    def n_candidates(self):
+        """The most samples a query is compared to at once."""
+        leaves = sum(tree['max_leaf'] for tree in self.trees_)
+        if self.n_iter == 0:
+            return leaves
+        return max(leaves, self._degree * (self._degree + 1))
+
+    @property
+    def _degree(self):
+        return min(max(self.leaf_size // 2, 1), self._fit_X.shape[0])
+
+    def query(self, X, k=1):
+        """Find approximately the k nearest neighbours of X, as
+        ``BallTree.query``.
+
+        Parameters
+        ----------
+        X : numpy array of shape (n_samples, n_features)
+            The query samples.
+
+        k : int, optional (default = 1)
+            The number of neighbours, at most ``leaf_size``.
+
+        Returns
+        -------
+        dist : numpy array of shape (n_samples, k)
+            The distances to the neighbours.
+
+        ind : numpy array of shape (n_samples, k)
+            The indices of the neighbours in the indexed samples.
+        """
+        if k > min(self.leaf_size, self._fit_X.shape[0]):
+            raise ValueError('k=%s exceeds leaf_size=%s of the approximate '
+                             'index' % (k, self.leaf_size))
+        if self.graph_ is None:
+            return self._nearest(X, self._leaf_members(X), k)
+        n_nearest = max(k, self._degree)
+        dist, ind = self._nearest(X, self._leaf_members(X), n_nearest)
+        for _ in range(self.n_iter):
+            dist, ind = self._nearest(X, self._explore(self.graph_, ind[:, :self._degree]), n_nearest)
+        return dist[:, :k], ind[:, :k]
+
+    @staticmethod
+    def _explore(graph, ind):
+        # the candidates and their neighbours in the graph
+        return np.concatenate([ind, graph[ind].reshape(len(ind), -1)], axis=1)
+
+    def _nearest(self, X, candidates, k):
+        """The k nearest of the candidate samples of every row of X, in
+        increasing distance. Candidates -1 are padding."""
+        # a sample found several times is compared once
+        candidates = np.sort(candidates, axis=1)
+        candidates[:, 1:][candidates[:, 1:] == candidates[:, :-1]] = -1
+
+        diff = self._fit_X[np.maximum(candidates, 0)] - X[:, None, :]
+        if self.p == 2:
+            distances = np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
+        else:
+            distances = (np.abs(diff) ** self.p).sum(axis=2) ** (1. / self.p)
+        distances[candidates < 0] = np.inf
+
+        rows = np.arange(X.shape[0])[:, None]
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        nearest = nearest[rows, np.argsort(distances[rows, nearest], axis=1,
+                                           kind='mergesort')]
+        return distances[rows, nearest], candidates[rows, nearest]
+
+    def _build(self, X, random_state):
+        n_samples = X.shape[0]
+        depth = max(int(np.ceil(np.log2(max(n_samples / self.leaf_size, 1)))), 1)
+        directions = random_state.normal(size=(depth, X.shape[1]))
+        projections = X.dot(directions.T)
+
+        order = np.arange(n_samples)
+        threshold, left, right = [0.], [-1], [-1]
+        start, end = [0], [n_samples]
+        stack = [(0, 0)]
+        while stack:
+            node, level = stack.pop()
+            node_start, node_end = start[node], end[node]
+            if node_end - node_start < 2 * self.leaf_size or level == depth:
+                continue
+            # the lower half of the projections goes left
+            members = order[node_start:node_end]
+            middle = len(members) // 2
+            proj = projections[members, level]
+            split = np.argpartition(proj, middle)
+            order[node_start:node_end] = members[split]
+            threshold[node] = (proj[split[:middle]].max() + proj[split[middle]]) / 2
+            left[node], right[node] = len(left), len(left) + 1
+            for child in ((node_start, node_start + middle), (node_start + middle, node_end)):
+                threshold.append(0.)
+                left.append(-1)
+                right.append(-1)
+                start.append(child[0])
+                end.append(child[1])
+                stack.append((len(left) - 1, level + 1))
+
+        left, start, end = np.array(left), np.array(start), np.array(end)
+        leaves = left < 0
+        return {'directions': directions, 'threshold': np.array(threshold),
+                'left': left, 'right': np.array(right),
+                'start': start, 'end': end, 'order': order,
+                'max_leaf': int((end[leaves] - start[leaves]).max())}
+
+    def _leaf_members(self, X):
+        return np.concatenate([self._tree_leaf_members(tree, X) for tree in self.trees_], axis=1)
+
+    @staticmethod
+    def _tree_leaf_members(tree, X):
+        # descend all rows one level at a time, -1 pads the smaller leaves
+        projections = X.dot(tree['directions'].T)
+        node = np.zeros(X.shape[0], dtype=np.intp)
+        for level in range(projections.shape[1]):
+            rows = np.flatnonzero(tree['left'][node] >= 0)
+            if len(rows) == 0:
+                break
+            at = node[rows]
+            node[rows] = np.where(projections[rows, level] <= tree['threshold'][at],
+                                  tree['left'][at], tree['right'][at])
+        offsets = tree['start'][node][:, None] + np.arange(tree['max_leaf'])
+        members = tree['order'][np.minimum(offsets, len(tree['order']) - 1)]
+        return np.where(offsets < tree['end'][node][:, None], members, -1)
+
+
+class NeighborIndex(object):
+    """Nearest neighbour index over a fitted data set, answering both the
+    neighbours of new samples and of the fitted samples themselves.
+
+    Parameters
+    ----------
+    algorithm : {'auto', 'ball_tree', 'kd_tree', 'brute', 'approx'}, optional
+        The search structure. 'auto' picks brute force for metrics no tree
+        supports, for more than ``MAX_TREE_FEATURES`` features or for fewer
+        samples than two leaves, else a kd-tree if it supports the metric,
+        else a ball tree. These are exact, 'approx' is the approximate
+        :class:`RPForest`, for Minkowski metrics only, and is never picked
+        by 'auto'.
+
+    leaf_size : int, optional (default = 30)
+        Leaf size of the trees. For 'approx', bigger leaves raise the recall
+        and the cost of a query, and k can be at most ``leaf_size``.
+
+    metric : string or callable, default 'minkowski'
+        The distance metric.
+
+    p : integer, optional (default = 2)
+        Parameter for the Minkowski metric.
+
+    metric_params : dict, optional (default = None)
+        Additional keyword arguments for the metric function.
+
+    n_jobs : int, optional (default = 1)
+        The number of threads querying blocks of rows. If ``-1``, then the
+        number of threads is set to the number of CPU cores.
+
+    n_trees : int, optional (default = 10)
+        The number of trees of 'approx'. More trees raise the recall and the
+        cost of a query.
+
+    n_iter : int, optional (default = 1)
+        The rounds of neighbour graph exploration of 'approx'. More rounds
+        raise the recall and the cost of building and querying.
+
+    random_state : int, RandomState instance or None, optional (default=None)
+        Draws the projection directions of 'approx'.
+
+    block_bytes : int, optional (default = 2 ** 26)
+        The size of the distance blocks of brute force and approximate
+        queries.
+
+    Attributes
+    ----------
+    algorithm_ : str
+        The search structure picked at fit. Segments appended later pick
+        their own from their size with 'auto', and small segments of
+        'approx' are searched by brute force.
+
+    build_time_ : float
+        The seconds spent building the index, appending and removing samples
+        included.
+
+    query_time_ : float
+        The seconds spent in queries so far.
+
+    n_queries_ : int
+        The number of queries so far.
+
+    Notes
+    -----
+    The index is log-structured: ``fit`` indexes the samples as one segment,
+    ``append`` adds a segment per batch and ``remove`` drops or rebuilds the
+    segments of the removed samples, so that neither rebuilds the whole
+    index. The newest segments are merged while the newer one holds at least
+    half as many samples as the older one, which keeps O(log n) segments and
+    rebuilds each sample O(log n) times. Queries search every segment.
+    """
+
+    def __init__(self, algorithm='auto', leaf_size=30, metric='minkowski',
+                 p=2, metric_params=None, n_jobs=1, n_trees=10, n_iter=1,
+                 random_state=None, block_bytes=2 ** 26):
+        if algorithm not in ('auto', 'ball_tree', 'kd_tree', 'brute', 'approx'):
+            raise ValueError('Unknown algorithm %s' % algorithm)
+        if algorithm == 'approx' and (callable(metric) or metric not in _APPROX_METRICS):
+            raise ValueError('The approximate index supports the metrics %s, '
+                             'not %s' % (sorted(_APPROX_METRICS), metric))
+        self.algorithm = algorithm
+        self.leaf_size = leaf_size
+        self.metric = metric
+        self.p = p
+        self.metric_params = metric_params
+        self.n_jobs = n_jobs
+        self.n_trees = n_trees
+        self.n_iter = n_iter
+        self.random_state = random_state
+        self.block_bytes = block_bytes
+
+    def fit(self, X):
+        """Build the index over X.
+
+        Parameters
+        ----------
+        X : numpy array of shape (n_samples, n_features)
+            The indexed samples.
+
+        Returns
+        -------
+        self
+        """
+        X = check_array(X)
+        start = time.perf_counter()
+        self.algorithm_ = self._choose(X.shape[0], X.shape[1])
+        self._segments = [self._segment(X)]
+        self.build_time_ = time.perf_counter() - start
+        self.query_time_ = 0.
+        self.n_queries_ = 0
+        return self
+
+    @property
+    def n_samples_(self):
+        """The number of indexed samples."""
+        return sum(len(segment[0]) for segment in self._segments)
+
+    def samples(self):
+        """The indexed samples, one array per segment, in order."""
+        return [segment[0] for segment in self._segments]
+
+    def append(self, X):
+        """Index more samples, after the indexed ones.
+
+        Parameters
+        ----------
+        X : numpy array of shape (n_samples, n_features)
+            The new samples.
+
+        Returns
+        -------
+        self
+        """
+        X = check_array(X)
+        start = time.perf_counter()
+        self._segments.append(self._segment(X))
+        self._compact()
+        self.build_time_ += time.perf_counter() - start
+        return self
+
+    def remove(self, mask):
+        """Drop indexed samples. The samples after them move up.
+
+        Parameters
+        ----------
+        mask : numpy array of shape (n_samples,)
+            True for the samples to drop.
+
+        Returns
+        -------
+        self
+        """
+        mask = np.asarray(mask, dtype=bool)
+        start = time.perf_counter()
+        segments, offset = [], 0
+        for segment in self._segments:
+            drop = mask[offset:offset + len(segment[0])]
+            offset += len(segment[0])
+            if not drop.any():
+                segments.append(segment)
+            elif not drop.all():
+                segments.append(self._segment(segment[0][~drop]))
+        self._segments = segments
+        self._compact()
+        self.build_time_ += time.perf_counter() - start
+        return self
+
+    def query(self, X=None, k=1, rows=None):
+        """Find the k nearest neighbours of X, in increasing distance.
+
+        Parameters
+        ----------
+        X : numpy array of shape (n_samples, n_features), optional
+            The query samples. If None, the neighbours of the indexed samples
+            ``rows`` among the other indexed samples.
+
+        k : int, optional (default = 1)
+            The number of neighbours.
+
+        rows : numpy array of shape (n_samples,), optional
+            The positions of the indexed samples to query if X is None, every
+            indexed sample if None.
+
+        Returns
+        -------
+        dist : numpy array of shape (n_samples, k)
+            The distances to the neighbours.
+
+        ind : numpy array of shape (n_samples, k)
+            The positions of the neighbours in the indexed samples.
+        """
+        n_samples = self.n_samples_
+        if k + (X is None) > n_samples:
+            raise ValueError('Expected k <= %d, the number of other indexed '
+                             'samples, got %d' % (n_samples - (X is None), k))
+        start = time.perf_counter()
+        if X is None:
+            if rows is None:
+                rows = np.arange(n_samples)
+                samples = self.samples()
+                X = samples[0] if len(samples) == 1 else np.concatenate(samples)
+            else:
+                rows = np.asarray(rows, dtype=np.intp)
+                X = self._take(rows)
+            dist, ind = self._query(X, k, rows)
+        else:
+            dist, ind = self._query(check_array(X), k)
+        self.query_time_ += time.perf_counter() - start
+        self.n_queries_ += 1
+        return dist, ind
+
+    def _choose(self, n_samples, n_features):
+        if self.algorithm == 'approx':
+            # a few leaves are searched as fast exactly
+            return 'approx' if n_samples >= 2 * self.leaf_size else 'brute'
+        if self.algorithm != 'auto':
+            return self.algorithm
+        if callable(self.metric) or self.metric not in BallTree.valid_metrics:
+            return 'brute'
+        if n_features > MAX_TREE_FEATURES or n_samples < 2 * self.leaf_size:
+            return 'brute'
+        if self.metric in KDTree.valid_metrics:
+            return 'kd_tree'
+        return 'ball_tree'
+
+    def _metric_kwargs(self):
+        kwargs = dict(self.metric_params or {})
+        if self.metric == 'minkowski':
+            kwargs.setdefault('p', self.p)
+        return kwargs
+
+    def _segment(self, X):
+        """The samples, their search structure, None for brute force, and its
+        name."""
+        algorithm = self._choose(X.shape[0], X.shape[1])
+        if algorithm == 'brute':
+            return X, None, algorithm
+        if algorithm == 'approx':
+            p = _APPROX_METRICS[self.metric] or (self.metric_params or {}).get('p', self.p)
+            return X, RPForest(X, n_trees=self.n_trees, leaf_size=self.leaf_size,
+                               n_iter=self.n_iter, p=p,
+                               random_state=self.random_state,
+                               block_bytes=self.block_bytes), algorithm
+        tree = KDTree if algorithm == 'kd_tree' else BallTree
+        return X, tree(X, leaf_size=self.leaf_size, metric=self.metric,
+                       **self._metric_kwargs()), algorithm
+
+    def _compact(self):
+        while (len(self._segments) > 1 and
+               2 * len(self._segments[-1][0]) >= len(self._segments[-2][0])):
+            newer = self._segments.pop()
+            older = self._segments.pop()
+            self._segments.append(self._segment(np.concatenate([older[0], newer[0]])))
+
+    def _take(self, rows):
+        offsets = np.cumsum([0] + [len(segment[0]) for segment in self._segments])
+        which = np.searchsorted(offsets, rows, side='right') - 1
+        X = np.empty((len(rows), self._segments[0][0].shape[1]),
+                     dtype=self._segments[0][0].dtype)
+        for s in np.unique(which):
+            X[which == s] = self._segments[s][0][rows[which == s] - offsets[s]]
+        return X
+
+    def _query(self, X, k, rows=None):
+        n_samples = X.shape[0]
+        per_row = 0
+        for samples, structure, algorithm in self._segments:
+            if algorithm == 'brute':
+                per_row += 8 * len(samples)
+            elif algorithm == 'approx':
+                # the candidate rows gathered per query row
+                per_row += 8 * structure.n_candidates * X.shape[1]
+        block_rows = int(self.block_bytes // per_row) if per_row else QUERY_ROWS
+        n_jobs = n_threads(self.n_jobs)
+        block_rows = max(min(block_rows, -(-n_samples // n_jobs)), 1)
+
+        dist = np.empty((n_samples, k))
+        ind = np.empty((n_samples, k), dtype=np.intp)
+
+        def query_block(start):
+            end = min(start + block_rows, n_samples)
+            dist[start:end], ind[start:end] = self._query_block(
+                X[start:end], k, None if rows is None else rows[start:end])
+
+        starts = range(0, n_samples, block_rows)
+        if n_jobs > 1 and len(starts) > 1:
+            with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                list(executor.map(query_block, starts))
+        else:
+            for start in starts:
+                query_block(start)
+        return dist, ind
+
+    def _query_block(self, X, k, rows=None):
+        # one more neighbour if the sample itself is among them
+        n_neighbors = k + (rows is not None)
+        results, offset = [], 0
+        for samples, structure, algorithm in self._segments:
+            k_segment = min(n_neighbors, len(samples))
+            if structure is None:
+                dist, ind = self._brute(X, samples, k_segment)
+            else:
+                dist, ind = structure.query(X, k=k_segment)
+            results.append((dist, ind + offset))
+            offset += len(samples)
+        if len(results) == 1 and rows is None:
+            return results[0]
+
+        dist = np.concatenate([result[0] for result in results], axis=1)
+        ind = np.concatenate([result[1] for result in results], axis=1)
+        if rows is not None:
+            dist[ind == rows[:, None]] = np.inf
+        select = np.arange(X.shape[0])[:, None]
+        nearest = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        nearest = nearest[select, np.argsort(dist[select, nearest], axis=1, kind='mergesort')]
+        return dist[select, nearest], ind[select, nearest]
+
+    def _brute(self, X, samples, k):
+        if self.metric_params and not callable(self.metric):
+            # the parameters as the trees take them, e.g. V for mahalanobis
+            distances = DistanceMetric.get_metric(
+                self.metric, **self._metric_kwargs()).pairwise(X, samples)
+        else:
+            distances = pairwise_distances(X, samples, metric=self.metric,
+                                           **self._metric_kwargs())
+        rows = np.arange(X.shape[0])[:, None]
+        if k < distances.shape[1]:
+            ind = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        else:
+            ind = np.tile(np.arange(distances.shape[1]), (X.shape[0], 1))
+        order = np.argsort(distances[rows, ind], axis=1, kind='mergesort')
+        ind = ind[rows, order]
+        return distances[rows, ind], ind
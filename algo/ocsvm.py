@@ -1,3 +1,4 @@
+import numpy as np
 from sklearn.svm import OneClassSVM
 from algo.base import Base
 
@@ -80,3 +81,20 @@ class OCSVM(OneClassSVM,Base):
     >>> clf.score_samples(X)  # doctest: +ELLIPSIS
     array([1.7798..., 2.0547..., 2.0556..., 2.0561..., 1.7332...])
     """
+
+    # lower scores are more abnormal
+    _inverted_scores = True
+
+    def _outlier_share(self):
+        # nu bounds the share of training samples outside the boundary
+        return self.nu
+
+    def predict(self, X, batch=False, stream=False):
+        """Return outliers with -1 and inliers with 1, see Base.predict."""
+        return Base.predict(self, X, batch=batch, stream=stream)
+
+    def _labels(self, scores, batch=False):
+        if batch:
+            return super(OCSVM, self)._labels(scores, batch=True)
+        # the labels of OneClassSVM.predict, lower scores are more abnormal
+        return np.where(scores < 0, -1, 1)
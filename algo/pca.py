@@ -5,12 +5,12 @@ from __future__ import print_function
 
 import numpy as np
 from scipy.spatial.distance import cdist
-from sklearn.decomposition import PCA as sklearn_PCA
+from sklearn.decomposition import IncrementalPCA, PCA as sklearn_PCA
+from sklearn.preprocessing import StandardScaler
 from sklearn.utils.validation import check_is_fitted
 from sklearn.utils.validation import check_array
-from numpy import percentile
 
-from .base import Base
+from .base import Base, clears_scores
 from utils.utilities import check_parameter,standardizer
 
 
@@ -200,16 +200,15 @@ class PCA(Base):
         self.contamination=contamination
 
     # noinspection PyIncorrectDocstring
-    def fit(self, X):
+    def fit(self, X, y=None):
         """Fit detector.
 
         Parameters
         ----------
-        X : dataframe of shape (n_samples, n_features)
+        X : dataframe or numpy array of shape (n_samples, n_features)
             The input samples.
         """
         # validate inputs X and y (optional)
-        X = X.to_numpy()
         X = check_array(X)
         # PCA is recommended to use on the standardized data (zero mean and
         # unit variance).
@@ -225,6 +224,69 @@ class PCA(Base):
                                      random_state=self.random_state)
         self.detector_.fit(X=X, y=y)
 
+        self._select_components()
+
+        self.decision_scores_ = np.sum(
+            cdist(X, self.selected_components_) / self.selected_w_components_,
+            axis=1).ravel()
+
+        self._process_decision_scores()
+        return self
+
+    @clears_scores
+    def fit_blocks(self, blocks):
+        """Fit detector on the blocks of `utils.utilities.iter_query_data'
+        one block at a time with sklearn's IncrementalPCA, whose components
+        match those of `fit' up to the numerical error. The blocks are read
+        once for the scaler if ``standardization``, once for the components,
+        once for their signs and once for the scores of the training data. ``svd_solver``,
+        ``tol``, ``iterated_power`` and ``random_state`` are not used.
+
+        Parameters
+        ----------
+        blocks : callable
+            Returns a new iterator over the (timestamps, values) blocks on
+            every call, e.g. ``lambda: iter_query_data(...)``.
+        """
+        if self.standardization:
+            self.scaler_ = StandardScaler()
+            for _, values in blocks():
+                self.scaler_.partial_fit(check_array(values))
+
+        self.detector_ = IncrementalPCA(n_components=self.n_components,
+                                        whiten=self.whiten, copy=self.copy)
+        n_fitted = 0
+        for values in _merge_small_blocks(blocks(), self.n_components):
+            values = check_array(values)
+            if self.standardization:
+                values = self.scaler_.transform(values)
+            self.detector_.partial_fit(values)
+            n_fitted += 1
+        if not n_fitted:
+            raise ValueError('No block to fit PCA on')
+
+        # the scores depend on the signs of the components, which PCA picks
+        # so that the largest projection on each component is positive
+        largest = np.zeros(self.detector_.n_components_)
+        signs = np.ones(self.detector_.n_components_)
+        for _, values in blocks():
+            values = check_array(values)
+            if self.standardization:
+                values = self.scaler_.transform(values)
+            projections = self.detector_.transform(values)
+            rows = np.argmax(np.abs(projections), axis=0)
+            peaks = projections[rows, np.arange(projections.shape[1])]
+            larger = np.abs(peaks) > largest
+            largest[larger] = np.abs(peaks[larger])
+            signs[larger] = np.where(peaks[larger] < 0, -1., 1.)
+        self.detector_.components_ *= signs[:, np.newaxis]
+        self._select_components()
+
+        self.decision_scores_ = self._block_scores(blocks)
+        self._process_decision_scores()
+        return self
+
+    def _select_components(self):
         # copy the attributes from the sklearn PCA object
         self.n_components_ = self.detector_.n_components_
         self.components_ = self.detector_.components_
@@ -254,13 +316,6 @@ class PCA(Base):
         self.selected_w_components_ = self.w_components_[
                                       -1 * self.n_selected_components_:]
 
-        self.decision_scores_ = np.sum(
-            cdist(X, self.selected_components_) / self.selected_w_components_,
-            axis=1).ravel()
-
-        self._process_decision_scores()
-        return self
-
     def decision_function(self, X):
         """Predict raw anomaly score of X using the fitted detector.
 
@@ -270,7 +325,7 @@ class PCA(Base):
 
         Parameters
         ----------
-        X : dataframe of shape (n_samples, n_features)
+        X : dataframe or numpy array of shape (n_samples, n_features)
             The training input samples. Sparse matrices are accepted only
             if they are supported by the base estimator.
         Returns
@@ -278,7 +333,6 @@ class PCA(Base):
         anomaly_scores : numpy array of shape (n_samples,)
             The anomaly score of the input samples.
         """
-        X = X.to_numpy()
         check_is_fitted(self, ['components_', 'w_components_'])
 
         X = check_array(X)
@@ -289,49 +343,9 @@ class PCA(Base):
             cdist(X, self.selected_components_) / self.selected_w_components_,
             axis=1).ravel()
 
-    def predict(self, X):
-        """Return outliers with -1 and inliers with 1, with the outlierness score calculated from the `decision_function(X)',
-        and the threshold `contamination'.
-        Parameters
-        ----------
-        X : dataframe of shape (n_samples, n_features)
-            The input samples.
-
-        Returns
-        -------
-        ranking : numpy array of shape (n_samples,)
-            The outlierness of the input samples.
-        """
-        anomalies = self.decision_function(X)
-        ranking = np.sort(anomalies)
-        threshold = ranking[int((1-self.contamination)*len(ranking))]
-        self.threshold = threshold
-        mask = (anomalies>=threshold)
-        ranking[mask]=-1
-        ranking[np.logical_not(mask)]=1
-        return ranking
-
-    def _process_decision_scores(self):
-        """Internal function to calculate key attributes:
-        - threshold_: used to decide the binary label
-        - labels_: binary labels of training data
-        Returns
-        -------
-        self
-        """
-
-        self.threshold_ = percentile(self.decision_scores_,
-                                     100 * (1 - self.contamination))
-        self.labels_ = (self.decision_scores_ > self.threshold_).astype(
-            'int').ravel()
-
-        # calculate for predict_proba()
-
-        self._mu = np.mean(self.decision_scores_)
-        self._sigma = np.std(self.decision_scores_)
-
-        return self
-
+    def _row_bytes(self, n_features):
+        # the standardized copy and the distances to the selected components
+        return 8 * (2 * n_features + 2 * self.selected_components_.shape[0] + 1)
 
     @property
     def explained_variance_(self):
@@ -387,3 +401,22 @@ class PCA(Base):
         Decorator for scikit-learn PCA attributes.
         """
         return self.detector_.noise_variance_
+
+
+def _merge_small_blocks(blocks, min_rows=None):
+    """Yield the values of the (timestamps, values) blocks, each one merged
+    with the blocks after it until it holds ``min_rows`` rows, the number of
+    features if None, as IncrementalPCA needs. A block holds fewer rows only
+    if the whole range does."""
+    pending = None
+    for _, values in blocks:
+        if pending is None:
+            pending = values
+            min_rows = min_rows or values.shape[1]
+        elif len(pending) >= min_rows and len(values) >= min_rows:
+            yield pending
+            pending = values
+        else:
+            pending = np.concatenate([pending, values])
+    if pending is not None:
+        yield pending
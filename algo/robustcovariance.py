@@ -1,3 +1,4 @@
+import numpy as np
 from sklearn.covariance import EllipticEnvelope
 from algo.base import Base
 
@@ -82,3 +83,16 @@ class RCOV(EllipticEnvelope,Base):
        minimum covariance determinant estimator" Technometrics 41(3), 212
        (1999)
     '''
+
+    # lower scores are more abnormal
+    _inverted_scores = True
+
+    def predict(self, X, batch=False, stream=False):
+        """Return outliers with -1 and inliers with 1, see Base.predict."""
+        return Base.predict(self, X, batch=batch, stream=stream)
+
+    def _labels(self, scores, batch=False):
+        if batch:
+            return super(RCOV, self)._labels(scores, batch=True)
+        # the labels of EllipticEnvelope.predict, lower scores are more abnormal
+        return np.where(scores < 0, -1, 1)
@@ -1,9 +1,8 @@
 import numpy as np
-from sklearn.neighbors import NearestNeighbors
 from sklearn.utils import check_array
-from numpy import percentile
 
 from .base import Base
+from .neighbors import NeighborIndex, check_approx_neighbors, search_algorithm
 from utils.utilities import check_parameter
 
 class SOD(Base):
@@ -26,6 +25,14 @@ class SOD(Base):
         The amount of contamination of the data set, i.e.
         the proportion of outliers in the data set. Used when fitting to
         define the threshold on the decision function.
+    algorithm : {'auto', 'ball_tree', 'kd_tree', 'brute', 'approx'}, optional
+        The nearest neighbour search, see
+        :class:`algo.neighbors.NeighborIndex`. 'approx' is approximate.
+    approx_params : dict, optional (default=None)
+        Keyword arguments of the approximate index trading recall for speed,
+        e.g. ``{'n_trees': 20, 'n_iter': 2, 'leaf_size': 40}``. Passing
+        them, ``{}`` for the defaults, selects the approximate index with
+        'auto'; the search is exact otherwise.
 
     Attributes
     ----------
@@ -43,10 +50,15 @@ class SOD(Base):
         The binary labels of the training data. 0 stands for inliers
         and 1 for outliers/anomalies. It is generated by applying
         ``threshold_`` on ``decision_scores_``.
+    index_ : NeighborIndex
+        The neighbour index of the last scored batch.
     """
 
+    # the reference sets are shared nearest neighbours within the batch
+    _chunkable = False
+
     def __init__(self, contamination=0.1, n_neighbors=20, ref_set=10,
-                 alpha=0.8):
+                 alpha=0.8, algorithm='auto', approx_params=None):
         super(SOD, self).__init__()
         if isinstance(n_neighbors, int):
             check_parameter(n_neighbors, low=1, param_name='n_neighbors')
@@ -68,6 +80,8 @@ class SOD(Base):
         self.n_neighbors_ = n_neighbors
         self.ref_set_ = ref_set
         self.alpha_ = alpha
+        self.algorithm_ = algorithm
+        self.approx_params_ = approx_params
         self.decision_scores_ = None
         self.contamination=contamination
 
@@ -79,37 +93,12 @@ class SOD(Base):
             The input samples.
         """
 
-        X = X.to_numpy()
         X = check_array(X)
         self.decision_scores_ = self.decision_function(X)
         self._process_decision_scores()
 
         return self
 
-    def predict(self, X):
-        """Return outliers with -1 and inliers with 1, with the outlierness score calculated from the `decision_function(X)',
-        and the threshold `contamination'.
-        Parameters
-        ----------
-        X : dataframe of shape (n_samples, n_features)
-            The input samples.
-
-        Returns
-        -------
-        ranking : numpy array of shape (n_samples,)
-            The outlierness of the input samples.
-        """
-        X=np.array(X)
-        anomalies =self.decision_function(X)
-        ranking = np.sort(anomalies)
-        threshold = ranking[int((1-self.contamination)*len(ranking))]
-        self.threshold = threshold
-        mask = (anomalies>=threshold)
-        ranking[mask]=-1
-        ranking[np.logical_not(mask)]=1
-        return ranking
-
-
 
     def decision_function(self, X):
         """Predict raw anomaly score of X using the fitted detector.
@@ -140,10 +129,14 @@ class SOD(Base):
         snn_indices : numpy array of shape (n_shared_nearest_neighbors,)
             The indices of top k shared nearest neighbors for each observation.
         """
-        knn = NearestNeighbors(n_neighbors=self.n_neighbors_)
-        knn.fit(X)
+        algorithm = search_algorithm(self.algorithm_, self.approx_params_)
+        if algorithm == 'approx':
+            check_approx_neighbors(self.n_neighbors_,
+                                   (self.approx_params_ or {}).get('leaf_size', 30))
+        self.index_ = NeighborIndex(algorithm=algorithm,
+                                    **(self.approx_params_ or {})).fit(X)
         # Get the knn index
-        ind = knn.kneighbors(return_distance=False)
+        _, ind = self.index_.query(k=self.n_neighbors_)
         _count = np.zeros(shape=(ind.shape[0], self.ref_set_), dtype=np.uint16)
         # Count the distance
         for i in range(ind.shape[0]):
@@ -182,25 +175,3 @@ class SOD(Base):
                     np.dot(var_inds, np.square(obs - means)) / rel_dim)
 
         return anomaly_scores
-    def _process_decision_scores(self):
-        """Internal function to calculate key attributes:
-        - threshold_: used to decide the binary label
-        - labels_: binary labels of training data
-        Returns
-        -------
-        self
-        """
-
-        self.threshold_ = percentile(self.decision_scores_,
-                                     100 * (1 - self.contamination))
-        self.labels_ = (self.decision_scores_ > self.threshold_).astype(
-            'int').ravel()
-
-        # calculate for predict_proba()
-
-        self._mu = np.mean(self.decision_scores_)
-        self._sigma = np.std(self.decision_scores_)
-
-        return self
-
-
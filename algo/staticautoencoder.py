@@ -2,11 +2,11 @@ from .base import Base
 import tensorflow as tf
 from tensorflow.keras import layers,losses
 import numpy as np
-from sklearn import preprocessing
+from utils.preprocessing import Preprocessor
 import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 class StaticAutoEncoder(Base):
-    def __init__(self,hidden_neurons=None,epoch=100,dropout_rate=0.2,contamination=0.1,regularizer_weight=0.1,activation='relu',kernel_regularizer=0.01,loss_function='mse',optimizer='adam'):
+    def __init__(self,hidden_neurons=None,epoch=100,dropout_rate=0.2,contamination=0.1,regularizer_weight=0.1,activation='relu',kernel_regularizer=0.01,loss_function='mse',optimizer='adam',scaler='robust'):
         self.hidden_neurons=hidden_neurons
         self.epoch=epoch
         self.dropout_rate=dropout_rate
@@ -16,7 +16,7 @@ class StaticAutoEncoder(Base):
         self.kernel_regularizer=kernel_regularizer
         self.loss_function=loss_function
         self.optimizer=optimizer
-        self.threshold = None
+        self.scaler=scaler
 
         if self.hidden_neurons and  self.hidden_neurons != self.hidden_neurons[::-1]:
             print(self.hidden_neurons)
@@ -37,8 +37,9 @@ class StaticAutoEncoder(Base):
         X : dataframe of shape (n_samples, n_features)
             The input samples.
         """
-        scaler = preprocessing.RobustScaler().fit(X)
-        X_train = scaler.transform(X)
+        # scaled, unless the data set was by a shared Preprocessor already
+        self.preprocessor_ = Preprocessor(impute=False, scaler=self.scaler)
+        X_train = self.preprocessor_.fit_transform(X)
         if self.hidden_neurons is None:
             self.hidden_neurons=[X_train.shape[1]//2+1,X_train.shape[1]//4+1,X_train.shape[1]//4+1,X_train.shape[1]//2+1]
         self.batch_size=X_train.shape[0]//10
@@ -46,29 +47,11 @@ class StaticAutoEncoder(Base):
 
         self.model.fit(X_train,X_train,epochs=self.epoch,batch_size=self.batch_size)
 
+        # the reconstruction errors of the training data set threshold_
+        self.decision_scores_ = (np.square(self.model.predict(X_train)-X_train)).mean(axis=1)
+        self._process_decision_scores()
         return self
 
-    def predict(self, X):
-        """Return outliers with -1 and inliers with 1, with the outlierness score calculated from the `decision_function(X)',
-        and the threshold `contamination'.
-        Parameters
-        ----------
-        X : dataframe of shape (n_samples, n_features)
-            The input samples.
-
-        Returns
-        -------
-        ranking : numpy array of shape (n_samples,)
-            The outlierness of the input samples.
-        """
-        reconstruct_error= (np.square(self.model.predict(X)-X)).mean(axis=1)
-        ranking = np.sort(reconstruct_error)
-        threshold = ranking[int((1-self.contamination)*len(ranking))]
-        self.threshold = threshold
-        mask = (reconstruct_error>=threshold)
-        ranking[mask]=-1
-        ranking[np.logical_not(mask)]=1
-        return ranking
 
     def decision_function(self,X):
         """Predict raw anomaly score of X using the fitted detector.
@@ -87,6 +70,7 @@ class StaticAutoEncoder(Base):
         anomaly_scores : numpy array of shape (n_samples,)
             The anomaly score of the input samples.
         """
+        X = self.preprocessor_.transform(X)
         reconstruct_error= (np.square(self.model.predict(X)-X)).mean(axis=1)
         return reconstruct_error
 
@@ -100,4 +84,4 @@ def l21shrink(epsilon,x):
                 output[j, i] = x.numpy()[j, i] - epsilon * x.numpy()[j, i] / norm[i]
         else:
             output[:, i] = 0.
-    return output
\ No newline at end of file
+    return output
@@ -1,64 +1,115 @@
 import os
 import os.path
+import time
 import pandas as pd
 from string import digits
 import argparse
 
-from utils.utilities import connect_server
+from utils.utilities import connect_pool,open_session,bulk_insert,str2bool
+from utils.backends import SQLiteBackend,backend_of
 
-def read_File(Filename,db,tablename,cursor,connection,insert=False):
-    # use database
-    print(os.getcwd())
-    if not os.path.exists(Filename):
-        raise FileNotFoundError("%s not exist." %(Filename))
-    try:
-        cursor.execute('create database if not exists %s' %(db))
-    except Exception as err:
-        connection.close()
-        raise (err)
+def _parse_timestamps(column):
+    # integer time stamps are epoch milliseconds, as exported by TDengine
+    if column.dtype.kind in 'iu':
+        return column.values.astype('datetime64[ms]')
+    return pd.to_datetime(column).values.astype('datetime64[ms]')
 
-    try:
-        cursor.execute('use %s' %(db))
-    except Exception as err:
-        connection.close()
-        raise (err)
+# the column type of every dtype kind pandas parses, text is nchar
+_COLUMN_TYPES = {'b': 'bool', 'i': 'int', 'u': 'int', 'f': 'float'}
 
-    df=pd.read_csv(Filename)
-    df_value=df.dtypes
-    df_index=df_value.index
+def _infer_columns(Filename,chunk_rows,sample_rows):
+    # the dtypes pandas gives a column in every chunk, reconciled as they
+    # would be if the file was parsed at once: int and float give float,
+    # any other mix text
+    kinds, widths = {}, {}
+    for chunk in pd.read_csv(Filename,nrows=sample_rows,chunksize=chunk_rows):
+        names = chunk.columns
+        for name in names[1:]:
+            kind, previous = chunk[name].dtype.kind, kinds.get(name)
+            if previous is not None and kind != previous:
+                if {kind, previous} <= {'i', 'u', 'f'}:
+                    kind = 'f' if 'f' in (kind, previous) else 'i'
+                else:
+                    # the text of the numbers or booleans seen before
+                    widths[name] = max(widths.get(name, 1), 24)
+                    kind = 'O'
+            if kind == 'O':
+                lengths = chunk[name].dropna().astype(str).str.len()
+                widths[name] = max(widths.get(name, 1), int(lengths.max()) if len(lengths) else 1)
+            kinds[name] = kind
 
-    table_list=[]
-    for i in range(len(df_index)):
-        table_list.append(df_index[i])
-        table_list.append(df_value[i].name+', ')
-    table_list[0]='ts'
-    table_list[1]='timestamp, '
-    table_list_str=' '.join(table_list)[:-2]
     remove_digits = str.maketrans('', '', digits)
-    tabletitle = table_list_str.translate(remove_digits)
+    columns = [('ts', 'timestamp')]
+    for name in names[1:]:
+        column_type = _COLUMN_TYPES.get(kinds[name], 'nchar(%d)' % widths.get(name, 1))
+        columns.append((name.translate(remove_digits), column_type))
+    return columns
+
+def read_File(Filename,db,tablename,cursor,connection,insert=False,chunk_rows=100000,sample_rows=None,batch_rows=1000,n_jobs=1):
+    """
+    Stream a CSV file into a table. The schema is inferred from the whole
+    file, or from its first ``sample_rows`` rows, read ``chunk_rows`` rows at
+    a time. The file is then read again chunk by chunk and every chunk is
+    inserted with batched multi-row statements, each value as a literal of
+    its column type, so that the whole file is never held in memory.
+
+    Parameters
+    ----------
+    Filename: str
+        The CSV file, with the time stamps in its first column.
+    db: str
+        Database name.
+    tablename: str
+        Table to create and insert into.
+    cursor: taos.cursor.TDengineCursor
+        TDEnginine cursor name. Ignored if ``connection`` is a pool.
+    connection: taos.connection.TDengineConnection or utils.connection.ConnectionPool
+        TDEnginine connection name, or a pool to check sessions out of.
+    insert: bool, optional (default=False)
+        Whether the rows are newer than the rows already in the table. If
+        False, they are imported, which also accepts out of order rows.
+    chunk_rows: int, optional (default=100000)
+        The number of rows read from the file at once.
+    sample_rows: int or None, optional (default=None)
+        The number of rows the column types are inferred from, every row if
+        None. With a sample, the sample decides the schema: e.g. a column
+        whose sampled values are integers is created as ``int``, and later
+        decimals are truncated.
+    batch_rows: int, optional (default=1000)
+        The maximal number of rows per insert statement.
+    n_jobs: int, optional (default=1)
+        The number of statements executed concurrently. Only used if
+        ``connection`` is a pool.
 
-    try:
-        cursor.execute('create table if not exists %s (%s)' %(tablename,tabletitle))
-    except Exception as err:
-        connection.close()
-        raise (err)
+    Returns
+    -------
+    n_rows: int
+        The number of inserted rows.
+
+    """
+    if not os.path.exists(Filename):
+        raise FileNotFoundError("%s not exist." %(Filename))
+    columns=_infer_columns(Filename,chunk_rows,sample_rows)
 
-    if insert:
-        try:
-            cursor.execute('insert into  %s.%s file %s' % (db,tablename, Filename))
-        except Exception as err:
-            connection.close()
-            raise (err)
+    backend=backend_of(connection)
+    with open_session(connection,cursor) as session:
+        backend.create_database(session,db)
+        backend.create_table(session,'%s.%s' %(db,tablename),columns)
 
-    elif not insert:
-        try:
-            cursor.execute('import into %s.%s file %s' % (db,tablename, Filename))
-        except Exception as err:
-            connection.close()
-            raise (err)
+    start_time = time.time()
+    n_rows = 0
+    for chunk in pd.read_csv(Filename,chunksize=chunk_rows):
+        n_rows += bulk_insert(connection,cursor,'%s.%s' %(db,tablename),_parse_timestamps(chunk.iloc[:,0]),
+                              chunk.iloc[:,1:],batch_rows=batch_rows,n_jobs=n_jobs,out_of_order=not insert,
+                              column_types=[column_type for _, column_type in columns[1:]])
+        cost = time.time() - start_time
+        print('%d rows inserted in %.2f s (%.0f rows/s)' %(n_rows, cost, n_rows / max(cost, 1e-9)))
+    return n_rows
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Reading CSV to Tables")
+    parser.add_argument('--backend',default='tdengine',choices=['tdengine','sqlite'])
+    parser.add_argument('--sqlite_path',default=None)
     parser.add_argument('--host', default='127.0.0.1')
     parser.add_argument('--user', default='yli')
     parser.add_argument('--password', default='0906')
@@ -66,11 +117,19 @@ if __name__ == '__main__':
     parser.add_argument('--database',default='db')
     parser.add_argument('--table',default='tt')
     parser.add_argument('--file_name',default='demo2.csv')
-    parser.add_argument('--insert',default=False)
+    parser.add_argument('--insert',default=False,type=str2bool)
+    parser.add_argument('--chunk_rows',default=100000, type=int)
+    parser.add_argument('--sample_rows',default=None, type=int)
+    parser.add_argument('--batch_rows',default=1000, type=int)
+    parser.add_argument('--n_jobs',default=4, type=int)
 
     args = parser.parse_args()
-    connection,cursor=connect_server(args.host, args.user, args.password)
+    if args.backend == 'sqlite':
+        pool=SQLiteBackend(args.sqlite_path).pool(size=args.n_jobs)
+    else:
+        pool=connect_pool(args.host, args.user, args.password, size=args.n_jobs)
 
-    read_File(args.file_name, args.database, args.table, cursor, connection, insert=False)
+    read_File(args.file_name, args.database, args.table, None, pool, insert=args.insert,
+              chunk_rows=args.chunk_rows, sample_rows=args.sample_rows, batch_rows=args.batch_rows, n_jobs=args.n_jobs)
 
-    connection.close()
+    pool.close()
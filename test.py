@@ -4,11 +4,14 @@ import argparse
 import time
 import logging
 import getpass
-from utils.utilities import output_performance,insert_demo_data,connect_server,query_data
-from utils.importAlgorithm import algorithm_selection
+from utils.utilities import output_performance,insert_demo_data,demo_ground_truth,demo_timestamps,connect_pool,query_data,iter_query_data,align_ground_truth
+from utils.backends import SQLiteBackend
+from utils.importAlgorithm import algorithm_selection,available_algorithms
+from utils.cache import FitCache, QueryCache
+from utils.preprocessing import Preprocessor,impute
 from utils.plotUtils import visualize_distribution_static,visualize_distribution_time_serie,visualize_outlierscore,visualize_distribution
 import warnings
-from utils.utilities import str2bool
+from utils.utilities import str2bool,set_float_dtype
 warnings.simplefilter(action='ignore', category=FutureWarning)
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 warnings.simplefilter("ignore", UserWarning)
@@ -17,61 +20,114 @@ logging.disable(logging.WARNING)
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description="Anomaly Detection Platform Settings")
+    parser.add_argument('--backend',default='tdengine',choices=['tdengine','sqlite'])
+    parser.add_argument('--sqlite_path',default=None)
     parser.add_argument('--host', default='127.0.0.1')
     parser.add_argument('--user', default='yli')
+    parser.add_argument('--pool_size',default=2, type=int)
     parser.add_argument('--random_seed',default=42, type=int)
     parser.add_argument('--database',default='db')
     parser.add_argument('--table',default='t')
     parser.add_argument('--time_stamp',const=True,type=str2bool,nargs='?')
     parser.add_argument('--visualize_distribution',const=True,type=str2bool,nargs='?')
-    parser.add_argument('--algorithm',default='dagmm',choices=['iforest','lof','ocsvm','robustcovariance','staticautoencoder','luminol','cblof','knn','hbos','sod','pca','dagmm','autoencoder','lstm_ad','lstm_ed'])
+    parser.add_argument('--algorithm',default='dagmm',choices=available_algorithms())
     parser.add_argument('--contamination',default=0.05)
     parser.add_argument('--start_time',default='2019-07-20 00:00:00')
     parser.add_argument('--end_time',default='2019-08-20 00:00:00')
     parser.add_argument('--time_serie_name',default='ts')
     parser.add_argument('--ground_truth',const=True,type=str2bool,nargs='?')
+    parser.add_argument('--insert_demo',default=True,type=str2bool)
+    parser.add_argument('--cache_dir',default=None)
+    parser.add_argument('--cache_bytes',default=2 ** 30, type=int)
+    parser.add_argument('--fit_cache_dir',default=None)
+    parser.add_argument('--fit_cache_bytes',default=2 ** 32, type=int)
+    parser.add_argument('--interval',default=None)
+    parser.add_argument('--agg',default='avg')
+    parser.add_argument('--features',default=None)
+    parser.add_argument('--impute',default=True,type=str2bool)
+    parser.add_argument('--scaler',default=None,choices=['standard','robust'])
+    parser.add_argument('--dtype',default='float64',choices=['float32','float64'])
+    parser.add_argument('--chunk_rows',default=None,type=int)
 
 
 
     args = parser.parse_args()
+    if args.interval and args.ground_truth:
+        parser.error('--ground_truth labels raw rows, it cannot be used with --interval')
+    if args.chunk_rows and (args.time_stamp or args.interval or args.scaler or args.fit_cache_dir or args.visualize_distribution):
+        parser.error('--chunk_rows streams raw feature blocks, it cannot be used with --time_stamp, --interval, '
+                     '--scaler, --fit_cache_dir or --visualize_distribution')
+
+    #dtype of the features, from the queries through the detectors
+    set_float_dtype(args.dtype)
 
     #random seed setting
     rng = np.random.RandomState(args.random_seed)
     np.random.seed(args.random_seed)
 
-    password = getpass.getpass("Please input your password:")
-
     #connection configeration
-    conn,cursor=connect_server(args.host, args.user, password)
-
-    #read data
-    print('Load dataset and table')
-    start_time = time.clock()
-    if args.ground_truth:
-        ground_truth_whole=insert_demo_data(conn,cursor,args.database,args.table,args.start_time,args.end_time,args.time_stamp,args.ground_truth)
+    if args.backend == 'sqlite':
+        pool=SQLiteBackend(args.sqlite_path).pool(size=args.pool_size)
     else:
-        insert_demo_data(conn,cursor,args.database,args.table,args.start_time,args.end_time,args.time_stamp,args.ground_truth)
+        password = getpass.getpass("Please input your password:")
+        pool=connect_pool(args.host, args.user, password, size=args.pool_size)
 
+    #local cache of queried ranges
+    cache = QueryCache(args.cache_dir, max_bytes=args.cache_bytes) if args.cache_dir else None
+    #local cache of fitted detectors
+    fit_cache = FitCache(args.fit_cache_dir, max_bytes=args.fit_cache_bytes) if args.fit_cache_dir else None
 
-    if args.ground_truth:
+    #algorithm
 
-        data,ground_truth = query_data(conn,cursor,args.database,args.table,
-                                   args.start_time,args.end_time,args.time_serie_name,ground_truth_whole,time_serie=args.time_stamp,ground_truth_flag=args.ground_truth)
+    #--scaler scales the input once, the detectors do not scale it again
+    clf = algorithm_selection(args.algorithm,random_state=rng,contamination=args.contamination,prescaled=args.scaler is not None)
+    if args.features:
+        clf.features = args.features.split(',')
+
+    #read data
+    print('Load dataset and table')
+    start_time = time.clock()
+    if args.insert_demo:
+        ground_truth_whole=insert_demo_data(pool,None,args.database,args.table,args.start_time,args.end_time,args.time_stamp,args.ground_truth)
+        if cache is not None:
+            cache.invalidate(args.database,args.table)
+    elif args.ground_truth:
+        ground_truth_whole=demo_ground_truth()
+
+
+    if args.chunk_rows:
+        #fit and score block by block, the range is never held in memory
+        def blocks():
+            for timestamps,values in iter_query_data(pool,None,args.database,args.table,args.start_time,args.end_time,
+                                                     args.time_serie_name,chunk_rows=args.chunk_rows,columns=clf.features):
+                yield timestamps,(impute(values,copy=False) if args.impute else values)
+
+        print('Start processing:')
+        start_time = time.clock()
+        clf.fit_blocks(blocks)
+        timestamps,prediction_result,outlierness = [np.concatenate(parts) for parts in zip(*clf.score_blocks(blocks()))]
+        if args.ground_truth:
+            ground_truth = align_ground_truth(timestamps,ground_truth_whole,ground_truth_ts=demo_timestamps())
     else:
-        data = query_data(conn,cursor,args.database,args.table,
-                                   args.start_time,args.end_time,args.time_serie_name,time_serie=args.time_stamp,ground_truth_flag=args.ground_truth)
+        if args.ground_truth:
 
-    print('Loading cost: %.6f seconds' %(time.clock() - start_time))
-    print('Load data successful')
+            data,ground_truth = query_data(pool,None,args.database,args.table,
+                                       args.start_time,args.end_time,args.time_serie_name,ground_truth_whole,time_serie=args.time_stamp,ground_truth_flag=args.ground_truth,cache=cache,interval=args.interval,agg=args.agg.split(','),columns=clf.features)
+        else:
+            data = query_data(pool,None,args.database,args.table,
+                                       args.start_time,args.end_time,args.time_serie_name,time_serie=args.time_stamp,ground_truth_flag=args.ground_truth,cache=cache,interval=args.interval,agg=args.agg.split(','),columns=clf.features)
 
-    #algorithm
+        print('Loading cost: %.6f seconds' %(time.clock() - start_time))
+        print('Load data successful')
 
-    clf = algorithm_selection(args.algorithm,random_state=rng,contamination=args.contamination)
-    print('Start processing:')
-    start_time = time.clock()
-    clf.fit(data)
-    prediction_result = clf.predict(data)
-    outlierness = clf.decision_function(data)
+        print('Start processing:')
+        start_time = time.clock()
+        #impute, scale and cast once, the detectors consume the array as is
+        if args.time_stamp:
+            X = data
+        else:
+            X = Preprocessor(impute=args.impute,scaler=args.scaler).fit_transform(data)
+        prediction_result, outlierness = clf.fit_predict_score(X,fit_cache=fit_cache)
 
     if args.ground_truth:
         output_performance(args.algorithm,ground_truth,prediction_result,time.clock() - start_time,outlierness)
@@ -86,4 +142,4 @@ if __name__ == '__main__':
             visualize_outlierscore(outlierness,prediction_result,args.contamination)
 
 
-    conn.close()
\ No newline at end of file
+    pool.close()
\ No newline at end of file
@@ -1,70 +1,52 @@
-import numpy as np
-import numbers
-from sklearn.metrics import accuracy_score,precision_score,recall_score,f1_score
-import datetime
-import taos
-import pandas as pd
-from sklearn.metrics import roc_auc_score
-from sklearn.preprocessing import StandardScaler
+import os
+import sys
 import argparse
 import time
 
-def connect_server(host,user,password):
-    # Connect to TDengine server.
-    #
-    # parameters:
-    # @host     : TDengine server IP address
-    # @user     : Username used to connect to TDengine server
-    # @password : Password
-    # @database : Database to use when connecting to TDengine server
-    # @config   : Configuration directory
-    conn = taos.connect(host,user,password,config="/etc/taos")
-    cursor = conn.cursor()
-    return conn,cursor
-
-# @profile
-def insert_demo_data(conn,consur,database,table):
+import numpy as np
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.utilities import connect_pool,bulk_insert
+from utils.backends import SQLiteBackend,backend_of
 
-    # Create a database named db
-    try:
-        consur.execute('drop database if exists %s' %database)
-        consur.execute('create database if not exists %s' %database)
-    except Exception as err:
-        conn.close()
-        raise (err)
+# @profile
+def insert_demo_data(pool,database,table,n_rows,batch_rows,n_jobs):
 
-    # use database
-    try:
-        consur.execute('use %s' %database)
-    except Exception as err:
-        conn.close()
-        raise (err)
+    backend = backend_of(pool)
+    with pool.checkout() as session:
+        # Create a database named db
+        backend.create_database(session,database,drop=True)
 
-    # create table
-    try:
-        consur.execute('create table if not exists %s (ts timestamp, a float, b float, d float, e float, f float)' %table)
-    except Exception as err:
-        conn.close()
-        raise (err)
+        # create table
+        backend.create_table(session,'%s.%s' %(database,table),[('ts','timestamp')] + [(name,'float') for name in 'abdef'])
 
-    start_time = datetime.datetime(2018, 8, 1)
-    time_interval = datetime.timedelta(seconds=60)
+    # generate data
+    timestamps = np.datetime64('2018-08-01', 'ms') + np.arange(n_rows) * np.timedelta64(60, 's')
+    matrix = np.random.uniform(low=-4, high=4, size=(n_rows, 5))
 
-    current_time = time.clock()
+    current_time = time.time()
 
     # insert data
-    for i in range(100000):
-        try:
-            consur.execute("insert into %s values ('%s', %f, %f,%f,%f,%f)" % (
-            table,start_time,np.random.uniform(low=-4, high=4), np.random.uniform(low=-4, high=4), np.random.uniform(low=-4, high=4), np.random.uniform(low=-4, high=4), np.random.uniform(low=-4, high=4)))
-        except Exception as err:
-            conn.close()
-            raise (err)
-        start_time += time_interval
+    bulk_insert(pool,None,'%s.%s' %(database,table),timestamps,matrix,batch_rows=batch_rows,n_jobs=n_jobs)
 
-    print ('Total inserting cost: %.6f s' %(time.clock() - current_time))
+    cost = time.time() - current_time
+    print ('Total inserting cost: %.6f s (%.0f rows/s)' %(cost, n_rows / cost))
 
 if __name__ == '__main__':
-    conn,cursor=connect_server('127.0.0.1','yli','0906')
-    insert_demo_data(conn,cursor,'rtdb','rttable')
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Bulk insert throughput")
+    parser.add_argument('--backend',default='tdengine',choices=['tdengine','sqlite'])
+    parser.add_argument('--sqlite_path',default=None)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--user', default='yli')
+    parser.add_argument('--password', default='0906')
+    parser.add_argument('--rows', default=100000, type=int)
+    parser.add_argument('--batch_rows', default=1000, type=int)
+    parser.add_argument('--n_jobs', default=4, type=int)
+    args = parser.parse_args()
+
+    if args.backend == 'sqlite':
+        pool=SQLiteBackend(args.sqlite_path).pool(size=args.n_jobs)
+    else:
+        pool=connect_pool(args.host,args.user,args.password,size=args.n_jobs)
+    insert_demo_data(pool,'rtdb','rttable',args.rows,args.batch_rows,args.n_jobs)
+    pool.close()
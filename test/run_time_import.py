@@ -0,0 +1,54 @@
+import os
+import sys
+import argparse
+import subprocess
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# frameworks which only the modules needing them may import
+HEAVY_MODULES = ['taos', 'torch', 'tensorflow', 'seaborn', 'matplotlib', 'luminol']
+
+CHECK = """
+import sys, time
+start = time.perf_counter()
+import %s
+cost = time.perf_counter() - start
+print(cost)
+print(','.join(m for m in %r if m in sys.modules))
+"""
+
+def import_cost(module, repeat):
+    """
+    Import a module in fresh interpreters, and return the best import time
+    and the heavy frameworks it loaded.
+    """
+    costs = []
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, '-c', CHECK % (module, HEAVY_MODULES)], cwd=ROOT,
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if process.returncode != 0:
+            raise ImportError(process.stderr.decode().strip().splitlines()[-1])
+        cost, loaded = process.stdout.decode().splitlines()[-2:]
+        costs.append(float(cost))
+    return min(costs), [m for m in loaded.split(',') if m]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Import time budget")
+    parser.add_argument('--modules', default='utils.utilities,utils.importAlgorithm,utils.plotUtils,algo.knn,algo.hbos,algo.lof,algo.iforest')
+    parser.add_argument('--budget', default=1.5, type=float)
+    parser.add_argument('--repeat', default=3, type=int)
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules.split(','):
+        try:
+            cost, loaded = import_cost(module, args.repeat)
+        except ImportError as err:
+            failed = True
+            print ('%-24s import failed: %s' %(module, err))
+            continue
+        over = cost > args.budget or loaded
+        failed = failed or over
+        print ('%-24s %.3f s%s%s' %(module, cost, ' loads %s' %', '.join(loaded) if loaded else '', '  FAILED' if over else ''))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,60 @@
+import os
+import sys
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from algo.neighbors import NeighborIndex
+
+def recall(approx_ind,exact_ind):
+    # share of the exact neighbours the approximate search found
+    hits = sum(len(np.intersect1d(a,e)) for a,e in zip(approx_ind,exact_ind))
+    return hits / exact_ind.size
+
+def benchmark(n_rows,n_queries,n_features,k,settings,seed,min_recall):
+
+    rng = np.random.RandomState(seed)
+    # correlated features, as in the monitoring tables
+    mixing = rng.normal(size=(n_features,n_features))
+    X = rng.normal(size=(n_rows,n_features)).dot(mixing)
+    Q = rng.normal(size=(n_queries,n_features)).dot(mixing)
+
+    exact = NeighborIndex().fit(X)
+    _, exact_ind = exact.query(Q,k=k)
+    exact_time = exact.build_time_+exact.query_time_
+    print ('exact (%s, the default): build %.3f s, query %.3f s' %(exact.algorithm_,exact.build_time_,exact.query_time_))
+
+    # the approximate index is only used when approx_params are passed,
+    # these are the recall and speed-up each of them trades
+    print ('%-45s %8s %10s %10s' %('approx_params','recall@%d' %k,'query x','total x'))
+    chosen = None
+    for n_trees,leaf_size,n_iter in settings:
+        params = {'n_trees':n_trees,'leaf_size':leaf_size,'n_iter':n_iter}
+        index = NeighborIndex(algorithm='approx',random_state=seed,**params).fit(X)
+        _, ind = index.query(Q,k=k)
+        r = recall(ind,exact_ind)
+        speedup = exact.query_time_/index.query_time_
+        total = exact_time/(index.build_time_+index.query_time_)
+        print ('%-45s %8.3f %10.1f %10.1f' %(params,r,speedup,total))
+        if r >= min_recall and total > 1 and (chosen is None or total > chosen[1]):
+            chosen = (params,total)
+
+    if chosen is None:
+        print ('No approx_params reach recall %.2f faster than exact search, keep the default' %min_recall)
+    else:
+        print ('Fastest approx_params with recall >= %.2f: %s (%.1fx)' %(min_recall,chosen[0],chosen[1]))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Approximate against exact nearest neighbour search")
+    parser.add_argument('--rows', default=100000, type=int)
+    parser.add_argument('--queries', default=2000, type=int)
+    parser.add_argument('--features', default=32, type=int)
+    parser.add_argument('--k', default=10, type=int)
+    parser.add_argument('--seed', default=0, type=int)
+    parser.add_argument('--min_recall', default=0.95, type=float, help="The recall approx_params should keep")
+    args = parser.parse_args()
+
+    # (n_trees, leaf_size, n_iter), from fast to accurate
+    settings = [(5,30,0),(10,30,0),(5,30,1),(10,30,1),(10,30,2),(20,50,2)]
+    benchmark(args.rows,args.queries,args.features,args.k,settings,args.seed,args.min_recall)
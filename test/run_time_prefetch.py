@@ -0,0 +1,70 @@
+import os
+import sys
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.utilities import connect_pool,bulk_insert,query_data,prefetch_query_data
+from utils.backends import SQLiteBackend,backend_of
+
+def insert_demo_data(pool,database,table,n_rows):
+
+    backend = backend_of(pool)
+    with pool.checkout() as session:
+        backend.create_database(session,database,drop=True)
+        backend.create_table(session,'%s.%s' %(database,table),[('ts','timestamp')] + [(name,'float') for name in 'abdef'])
+
+    timestamps = np.datetime64('2018-08-01', 'ms') + np.arange(n_rows) * np.timedelta64(60, 's')
+    bulk_insert(pool,None,'%s.%s' %(database,table),timestamps,np.random.uniform(low=-4, high=4, size=(n_rows, 5)))
+    return timestamps[0], timestamps[-1]
+
+def serial_windows(pool,database,table,start_time,end_time,window):
+    span = pd.Timedelta(window).to_timedelta64().astype('timedelta64[ms]')
+    lower = start_time
+    while lower <= end_time:
+        upper = min(lower + span - np.timedelta64(1,'ms'), end_time)
+        yield lower, upper, query_data(pool,None,database,table,lower,upper,'ts',ground_truth_flag=False)
+        lower = upper + np.timedelta64(1,'ms')
+
+# @profile
+def score_windows(pool,database,table,start_time,end_time,window,compute,prefetch):
+
+    current_time = time.time()
+
+    if prefetch:
+        windows = prefetch_query_data(pool,None,database,table,start_time,end_time,'ts',window,prefetch=prefetch,ground_truth_flag=False)
+    else:
+        windows = serial_windows(pool,database,table,start_time,end_time,window)
+
+    n_windows = 0
+    for _, _, X in windows:
+        # stands in for fitting and scoring the window
+        time.sleep(compute)
+        n_windows += 1
+
+    print ('prefetch=%d: %d windows in %.6f s' %(prefetch, n_windows, time.time() - current_time))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Windowed scoring with and without prefetching")
+    parser.add_argument('--backend',default='tdengine',choices=['tdengine','sqlite'])
+    parser.add_argument('--sqlite_path',default=None)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--user', default='yli')
+    parser.add_argument('--password', default='0906')
+    parser.add_argument('--rows', default=200000, type=int)
+    parser.add_argument('--window', default='1D')
+    parser.add_argument('--compute', default=0.02, type=float)
+    parser.add_argument('--prefetch', default=2, type=int)
+    args = parser.parse_args()
+
+    if args.backend == 'sqlite':
+        pool=SQLiteBackend(args.sqlite_path).pool(size=2)
+    else:
+        pool=connect_pool(args.host,args.user,args.password,size=2)
+    start_time, end_time = insert_demo_data(pool,'rtdb','rttable',args.rows)
+    for prefetch in (0, args.prefetch):
+        score_windows(pool,'rtdb','rttable',start_time,end_time,args.window,args.compute,prefetch)
+    pool.close()
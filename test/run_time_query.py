@@ -1,59 +1,37 @@
-import numpy as np
-import numbers
-from sklearn.metrics import accuracy_score,precision_score,recall_score,f1_score
-import datetime
-import taos
-import pandas as pd
-from sklearn.metrics import roc_auc_score
-from sklearn.preprocessing import StandardScaler
+import os
+import sys
 import argparse
 import time
 
-def connect_server(host,user,password):
-    # Connect to TDengine server.
-    #
-    # parameters:
-    # @host     : TDengine server IP address
-    # @user     : Username used to connect to TDengine server
-    # @password : Password
-    # @database : Database to use when connecting to TDengine server
-    # @config   : Configuration directory
-    conn = taos.connect(host,user,password,config="/etc/taos")
-    cursor = conn.cursor()
-    return conn,cursor
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.utilities import connect_pool,query_data
+from utils.backends import SQLiteBackend
 
-@profile
-def query_demo_data(conn,consur,database,table):
+# @profile
+def query_demo_data(pool,database,table,start_time,end_time):
 
+    current_time = time.time()
 
-    # use database
-    try:
-        consur.execute('use %s' %database)
-    except Exception as err:
-        conn.close()
-        raise (err)
+    # query data
+    timestamps, values = query_data(pool,None,database,table,start_time,end_time,'ts',ground_truth_flag=False,as_frame=False)
 
-
-
-    current_time = time.clock()
-
-    # insert data
-    cursor.execute("select * from %s.%s where %s >= \'%s\' and %s <= \'%s\' " % (
-    database, table, 'ts', '2018-08-01 00:00:00', 'ts', '2018-08-15 00:00:00'))
-
-    # Column names are in c1.description list
-    cols = cursor.description
-    # Use fetchall to fetch data in a list
-    data = cursor.fetchall()
-
-    cursor.execute("select * from %s.%s where %s >= \'%s\' and %s <= \'%s\' " % (
-    database, table, 'ts', '2018-08-01 00:00:00', 'ts', '2018-08-15 00:00:00'))
-
-    tmp = pd.DataFrame(list(data))
-
-
-    print ('Total query cost: %.6f s' %(time.clock() - current_time))
+    cost = time.time() - current_time
+    print ('Total query cost: %.6f s (%.0f rows/s)' %(cost, len(timestamps) / cost))
 
 if __name__ == '__main__':
-    conn,cursor=connect_server('127.0.0.1','yli','0906')
-    query_demo_data(conn,cursor,'rtdb','rttable')
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Range query throughput")
+    parser.add_argument('--backend',default='tdengine',choices=['tdengine','sqlite'])
+    parser.add_argument('--sqlite_path',default=None)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--user', default='yli')
+    parser.add_argument('--password', default='0906')
+    parser.add_argument('--start_time', default='2018-08-01 00:00:00')
+    parser.add_argument('--end_time', default='2018-08-15 00:00:00')
+    args = parser.parse_args()
+
+    if args.backend == 'sqlite':
+        pool=SQLiteBackend(args.sqlite_path).pool(size=1)
+    else:
+        pool=connect_pool(args.host,args.user,args.password,size=1)
+    query_demo_data(pool,'rtdb','rttable',args.start_time,args.end_time)
+    pool.close()
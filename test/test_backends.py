@@ -0,0 +1,118 @@
+import datetime
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import utils.utilities
+from utils import backends
+from utils.backends import SQLiteBackend, TDengineBackend, backend_of, format_ts, get_backend, interval_ms
+from utils.utilities import bulk_insert, fetch_columns, query_data
+
+def _demo(backend, n_rows=600):
+    pool = backend.pool(size=2)
+    with pool.checkout() as session:
+        backend.create_database(session, 'db', drop=True)
+        backend.create_table(session, 'db.t', [('ts', 'timestamp'), ('a', 'double'), ('b', 'double')])
+    rng = np.random.RandomState(0)
+    timestamps = np.datetime64('2019-08-01', 'ms') + np.arange(n_rows) * np.timedelta64(7, 's')
+    matrix = rng.normal(size=(n_rows, 2))
+    bulk_insert(pool, None, 'db.t', timestamps, matrix)
+    return pool, timestamps, matrix
+
+def test_helpers():
+    assert format_ts(np.datetime64('2019-08-01T01:02:03.004')) == '2019-08-01 01:02:03.004'
+    assert format_ts(datetime.datetime(2019, 8, 1)) == '2019-08-01 00:00:00.000'
+    assert interval_ms('10s') == 10000 and interval_ms(' 2h ') == 7200000
+    assert interval_ms(datetime.timedelta(minutes=1)) == 60000
+    assert interval_ms(np.timedelta64(5, 'ms')) == 5
+    for interval in ('10x', '0s'):
+        with pytest.raises(ValueError):
+            interval_ms(interval)
+    with pytest.raises(ValueError):
+        get_backend('mysql')
+    assert isinstance(get_backend('sqlite'), SQLiteBackend)
+    # connections without a backend are taken as taos connections
+    assert isinstance(backend_of(object()), TDengineBackend)
+
+def test_statements():
+    backend = get_backend('sqlite')
+    assert backend.range_query('db.t', 'ts', '2019-08-01', '', columns=['a']) == \
+        "select ts, a from db.t where ts >= '2019-08-01 00:00:00.000' order by ts"
+    assert backend.insert_statement('db.t', ['(1)', '(2)']) == 'insert or ignore into db.t values (1),(2)'
+    assert TDengineBackend().insert_statement('db.t', ['(1)', '(2)'], out_of_order=True) == 'import into db.t values (1) (2)'
+    with pytest.raises(ValueError):
+        backend.interval_query('db.t', 'ts', ['a'], '1m', ['median'])
+
+def test_range_queries_are_sorted_and_keep_the_first_row():
+    pool, timestamps, matrix = _demo(get_backend('sqlite'))
+    # out of order rows, the second row of a time stamp is ignored as on the server
+    bulk_insert(pool, None, 'db.t', timestamps[::-1][:10] + np.timedelta64(1, 'ms'), matrix[:10])
+    bulk_insert(pool, None, 'db.t', timestamps[:1], matrix[1:2] + 100)
+    ts, values = query_data(pool, None, 'db', 't', '', '', 'ts', ground_truth_flag=False, as_frame=False)
+    assert len(ts) == len(timestamps) + 10
+    assert np.all(np.diff(ts.astype(np.int64)) > 0)
+    assert np.array_equal(values[0], matrix[0])
+
+def test_count_and_ranges():
+    backend = get_backend('sqlite')
+    pool, timestamps, matrix = _demo(backend)
+    start, end = timestamps[100], timestamps[199]
+    with pool.checkout() as session:
+        session.execute(backend.count_query('db.t', 'ts', start))
+        assert session.fetchall() == [(100,)]
+        session.execute(backend.range_query('db.t', 'ts', start, end, lower_op='>', upper_op='<', limit=50))
+        names, ts, values = fetch_columns(session)
+    assert names == ['ts', 'a', 'b']
+    assert np.array_equal(ts, timestamps[101:151])
+    assert np.array_equal(values, matrix[101:151])
+
+@pytest.mark.parametrize('interval', ['1m', '5m', np.timedelta64(90, 's')])
+def test_interval_aggregates(interval):
+    pool, timestamps, matrix = _demo(get_backend('sqlite'))
+    ts, values = query_data(pool, None, 'db', 't', timestamps[30], timestamps[-1], 'ts', ground_truth_flag=False,
+                            as_frame=False, interval=interval, agg=['avg', 'max', 'count'], columns=['a'])
+    ms = interval_ms(interval)
+    epoch = timestamps[30:].astype(np.int64)
+    buckets = epoch // ms * ms
+    assert np.array_equal(ts.astype(np.int64), np.unique(buckets))
+    for row, bucket in zip(values, np.unique(buckets)):
+        a = matrix[30:, 0][buckets == bucket]
+        assert np.allclose(row, [a.mean(), a.max(), len(a)])
+
+def test_databases_persist_on_disk(tmpdir):
+    backend = get_backend('sqlite', path=str(tmpdir))
+    pool, timestamps, matrix = _demo(backend, n_rows=50)
+    pool.close()
+    # another process opening the same directory
+    reopened = get_backend('sqlite', path=str(tmpdir))
+    assert reopened.databases == ['db']
+    ts, values = query_data(reopened.pool(size=1), None, 'db', 't', '', '', 'ts', ground_truth_flag=False, as_frame=False)
+    assert np.array_equal(ts, timestamps) and np.array_equal(values, matrix)
+
+def test_in_memory_backends_are_separate():
+    first, _, _ = _demo(get_backend('sqlite'), n_rows=20)
+    second, _, _ = _demo(get_backend('sqlite'), n_rows=30)
+    for pool, n_rows in ((first, 20), (second, 30)):
+        ts, _ = query_data(pool, None, 'db', 't', '', '', 'ts', ground_truth_flag=False, as_frame=False)
+        assert len(ts) == n_rows
+
+def test_results_are_fetched_block_by_block(monkeypatch):
+    pool, timestamps, matrix = _demo(get_backend('sqlite'), n_rows=100)
+    bulk_insert(pool, None, 'db.t', timestamps[-1:] + np.timedelta64(1, 's'), np.array([[np.nan, 1.]]))
+    with pool.checkout() as session:
+        session.execute('select * from db.t order by ts')
+        blocks = list(backends.fetch_blocks(session, block_rows=30))
+    assert [len(block[0]) for block in blocks] == [30, 30, 30, 11]
+    assert all(len(block) == 3 for block in blocks)
+    # the blocks fill the columns as a single fetch does
+    monkeypatch.setattr(utils.utilities, 'fetch_blocks', lambda cursor: backends.fetch_blocks(cursor, block_rows=7))
+    with pool.checkout() as session:
+        session.execute('select * from db.t order by ts')
+        names, ts, values = fetch_columns(session, dtype=np.float32)
+    assert values.dtype == np.float32 and values.flags['C_CONTIGUOUS']
+    assert np.array_equal(ts[:100], timestamps)
+    assert np.array_equal(values[:100], matrix.astype(np.float32))
+    assert np.isnan(values[100, 0]) and values[100, 1] == 1
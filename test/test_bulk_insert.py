@@ -0,0 +1,66 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.backends import SQLiteCursor, get_backend
+from utils.utilities import bulk_insert, query_data
+
+def _table(pool, columns=(('ts', 'timestamp'), ('a', 'double'), ('b', 'double'))):
+    backend = pool.backend
+    with pool.checkout() as session:
+        backend.create_database(session, 'db', drop=True)
+        backend.create_table(session, 'db.t', list(columns))
+
+def _rows(n_rows, seed=0):
+    rng = np.random.RandomState(seed)
+    timestamps = np.datetime64('2019-08-01', 'ms') + np.arange(n_rows) * np.timedelta64(1, 's')
+    return timestamps, rng.normal(size=(n_rows, 2))
+
+def _statements(monkeypatch):
+    statements = []
+    execute = SQLiteCursor.execute
+    monkeypatch.setattr(SQLiteCursor, 'execute', lambda self, sql: statements.append(sql) or execute(self, sql))
+    return statements
+
+@pytest.mark.parametrize('n_jobs', [1, 3])
+def test_rows_round_trip(n_jobs):
+    pool = get_backend('sqlite').pool(size=3)
+    _table(pool)
+    timestamps, matrix = _rows(2500)
+    matrix[7, 1] = np.nan
+    assert bulk_insert(pool, None, 'db.t', timestamps, matrix, batch_rows=400, n_jobs=n_jobs) == 2500
+    ts, values = query_data(pool, None, 'db', 't', '', '', 'ts', ground_truth_flag=False, as_frame=False)
+    assert np.array_equal(ts, timestamps)
+    # 17 significant digits round-trip float64, NaN goes through NULL
+    np.testing.assert_array_equal(values, matrix)
+
+def test_statements_are_batched_and_bounded(monkeypatch):
+    pool = get_backend('sqlite').pool(size=1)
+    _table(pool)
+    statements = _statements(monkeypatch)
+    timestamps, matrix = _rows(1000)
+    bulk_insert(pool, None, 'db.t', timestamps, matrix, batch_rows=300)
+    assert len(statements) == 4
+    del statements[:]
+    bulk_insert(pool, None, 'db.t', timestamps, matrix, batch_rows=1000, max_statement_bytes=8000)
+    assert len(statements) > 1
+    assert all(len(sql) <= 8000 for sql in statements)
+
+def test_column_types():
+    pool = get_backend('sqlite').pool(size=1)
+    _table(pool, [('ts', 'timestamp'), ('n', 'int'), ('flag', 'bool'), ('name', 'nchar(8)')])
+    timestamps = np.datetime64('2019-08-01', 'ms') + np.arange(3) * np.timedelta64(1, 's')
+    matrix = np.array([[1, True, "it's"], [2, False, 'b'], [None, True, 'c']], dtype=object)
+    bulk_insert(pool, None, 'db.t', timestamps, matrix, column_types=['int', 'bool', 'nchar(8)'])
+    with pool.checkout() as session:
+        session.execute('select n, flag, name from db.t order by ts')
+        assert session.fetchall() == [(1, 1, "it's"), (2, 0, 'b'), (None, 1, 'c')]
+
+def test_column_count_is_checked():
+    pool = get_backend('sqlite').pool(size=1)
+    timestamps, matrix = _rows(3)
+    with pytest.raises(ValueError):
+        bulk_insert(pool, None, 'db.t', timestamps, matrix, column_types=['double'])
@@ -0,0 +1,103 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.backends import get_backend
+from utils.connection import Session
+
+def _pool(**kwargs):
+    return get_backend('sqlite').pool(**kwargs)
+
+def test_exhausted_pool_times_out():
+    pool = _pool(size=1, timeout=0.05)
+    with pool.checkout():
+        with pytest.raises(RuntimeError, match='No connection available'):
+            with pool.checkout():
+                pass
+    # the session is free again once returned
+    with pool.checkout() as session:
+        session.execute('select 1')
+        assert session.fetchall() == [(1,)]
+
+def test_waiting_checkout_gets_the_returned_session():
+    pool = _pool(size=1, timeout=5)
+    got = []
+    with pool.checkout() as first:
+        waiter = threading.Thread(target=lambda: got.append(pool._acquire()))
+        waiter.start()
+        waiter.join(0.1)
+        assert waiter.is_alive()
+    waiter.join()
+    assert got == [first]
+    assert pool._n_open == 1
+
+def test_sessions_are_reused():
+    pool = _pool(size=2)
+    with pool.checkout() as first:
+        pass
+    with pool.checkout() as second:
+        assert second is first
+    assert pool._n_open == 1
+
+def test_failed_statement_recycles_the_cursor():
+    pool = _pool(size=1)
+    with pool.checkout() as session:
+        conn, cursor = session.conn, session.cursor
+        with pytest.raises(Exception):
+            session.execute('select * from no_such_table')
+        assert session.failed
+        # a new cursor on the same connection
+        assert session.conn is conn and session.cursor is not cursor
+        session.execute('select 1')
+        assert session.fetchall() == [(1,)]
+
+def test_cursor_of_the_caller_is_kept():
+    conn = get_backend('sqlite').connect()
+    cursor = conn.cursor()
+    session = Session(conn, cursor, owned=False)
+    with pytest.raises(Exception):
+        session.execute('select * from no_such_table')
+    assert session.cursor is cursor
+
+def test_unhealthy_session_is_replaced():
+    pool = _pool(size=1)
+    with pool.checkout() as session:
+        with pytest.raises(Exception):
+            session.execute('select * from no_such_table')
+        # the connection goes away as well, the health check fails
+        session.conn.close()
+    with pool.checkout() as replacement:
+        assert replacement is not session
+        replacement.execute('select 1')
+        assert replacement.fetchall() == [(1,)]
+    assert pool._n_open == 1
+
+def test_failed_but_healthy_session_is_kept():
+    pool = _pool(size=1)
+    with pool.checkout() as session:
+        with pytest.raises(Exception):
+            session.execute('select * from no_such_table')
+    with pool.checkout() as again:
+        assert again is session
+        assert not again.failed
+
+def test_idle_sessions_are_checked_again():
+    pool = _pool(size=1, check_interval=0)
+    with pool.checkout() as session:
+        pass
+    session.conn.close()
+    with pool.checkout() as replacement:
+        assert replacement is not session
+
+def test_closed_pool_refuses_checkouts():
+    pool = _pool(size=1)
+    with pool.checkout():
+        pass
+    pool.close()
+    assert pool._n_open == 0
+    with pytest.raises(RuntimeError, match='closed'):
+        with pool.checkout():
+            pass
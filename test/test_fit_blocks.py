@@ -0,0 +1,42 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from algo.base import Base
+from algo.hbos import HBOS
+from algo.pca import PCA
+from algo.robustcovariance import RCOV
+
+def _data(seed):
+    rng = np.random.RandomState(seed)
+    X = rng.normal(size=(3001,4)).dot(rng.normal(size=(4,4)))
+    X[:30] += 6
+    return np.arange(len(X)).astype('datetime64[ms]'), X
+
+def _blocks(timestamps, X, rows):
+    # a new iterator on every call, as with iter_query_data
+    return lambda: ((timestamps[i:i + rows], X[i:i + rows]) for i in range(0, len(X), rows))
+
+@pytest.mark.parametrize('rows', [1, 500, 5000])
+@pytest.mark.parametrize('make', [HBOS, PCA, lambda: RCOV(random_state=0)], ids=['hbos', 'pca', 'rcov'])
+def test_fit_blocks_matches_fit(make, rows):
+    timestamps, X = _data(0)
+    whole = make().fit(X)
+    streamed = make().fit_blocks(_blocks(timestamps, X, rows))
+    assert np.allclose(streamed.decision_function(X), whole.decision_function(X))
+    # the default gathers the blocks, the others fit one block at a time
+    assert (type(streamed).fit_blocks is Base.fit_blocks) == isinstance(streamed, RCOV)
+
+@pytest.mark.parametrize('make', [HBOS, PCA], ids=['hbos', 'pca'])
+def test_score_blocks_matches_predict(make):
+    timestamps, X = _data(1)
+    detector = make().fit_blocks(_blocks(timestamps, X, 700))
+    parts = list(detector.score_blocks(_blocks(timestamps, X, 700)()))
+    assert len(parts) == 5
+    ts, labels, scores = [np.concatenate(part) for part in zip(*parts)]
+    assert np.array_equal(ts, timestamps)
+    assert np.allclose(scores, detector.decision_function(X))
+    assert np.array_equal(labels, detector.predict(X))
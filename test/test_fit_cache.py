@@ -0,0 +1,96 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from algo.hbos import HBOS
+from algo.knn import KNN
+from algo.robustcovariance import RCOV
+from algo.sod import SOD
+from utils.cache import FitCache
+
+def _data(seed=0):
+    return np.random.RandomState(seed).normal(size=(1000, 3))
+
+def _count_fits(monkeypatch):
+    # the fits of KNN which are not answered by the cache
+    fits = []
+    fit = KNN.fit
+    monkeypatch.setattr(KNN, 'fit', lambda self, X, *args, **kwargs: fits.append(1) or fit(self, X, *args, **kwargs))
+    return fits
+
+def test_equal_detector_on_the_same_data_is_loaded(tmpdir, monkeypatch):
+    cache, X = FitCache(str(tmpdir)), _data()
+    fits = _count_fits(monkeypatch)
+    first = cache.fit(KNN(n_neighbors=7), X)
+    second = cache.fit(KNN(n_neighbors=7), X)
+    assert fits == [1]
+    assert np.array_equal(second.decision_scores_, first.decision_scores_)
+    assert np.array_equal(second.decision_function(X[:50]), first.decision_function(X[:50]))
+
+@pytest.mark.parametrize('other', [
+    lambda: KNN(n_neighbors=8),
+    lambda: KNN(n_neighbors=7, method='mean'),
+    lambda: KNN(n_neighbors=7, approx_params={'random_state': 0}),
+    lambda: HBOS(),
+], ids=['n_neighbors', 'method', 'approx_params', 'class'])
+def test_other_parameters_miss(other, tmpdir):
+    cache, X = FitCache(str(tmpdir)), _data()
+    assert cache.key(KNN(n_neighbors=7), X) == cache.key(KNN(n_neighbors=7), X.copy())
+    assert cache.key(other(), X) != cache.key(KNN(n_neighbors=7), X)
+
+def test_other_data_misses(tmpdir):
+    cache, X = FitCache(str(tmpdir)), _data()
+    key = cache.key(HBOS(), X)
+    changed = X.copy()
+    changed[500, 1] += 1e-9
+    assert cache.key(HBOS(), changed) != key
+    assert cache.key(HBOS(), X.astype(np.float32)) != key
+    # the column names of a frame are part of the key
+    frame = pd.DataFrame(X, columns=['a', 'b', 'c'])
+    assert cache.key(HBOS(), frame) != cache.key(HBOS(), frame.rename(columns={'c': 'd'}))
+
+def test_parameters_stored_with_an_underscore(tmpdir):
+    cache, X = FitCache(str(tmpdir)), _data()
+    assert cache.key(SOD(n_neighbors=20), X) != cache.key(SOD(n_neighbors=21), X)
+    assert cache.key(SOD(alpha=0.8), X) != cache.key(SOD(alpha=0.7), X)
+
+def test_random_states_are_keyed_on_their_whole_state(tmpdir):
+    cache, X = FitCache(str(tmpdir)), _data()
+    assert cache.key(RCOV(random_state=np.random.RandomState(1)), X) == \
+        cache.key(RCOV(random_state=np.random.RandomState(1)), X)
+    assert cache.key(RCOV(random_state=np.random.RandomState(1)), X) != \
+        cache.key(RCOV(random_state=np.random.RandomState(2)), X)
+    drawn = np.random.RandomState(1)
+    drawn.randint(10)
+    assert cache.key(RCOV(random_state=drawn), X) != cache.key(RCOV(random_state=np.random.RandomState(1)), X)
+    gaussian = np.random.RandomState(1)
+    gaussian.standard_normal()
+    state = gaussian.get_state()
+    # the same position in the key stream, one cached gaussian apart
+    pending = np.random.RandomState(1)
+    pending.set_state(state[:3] + (0, 0.0))
+    assert cache.key(RCOV(random_state=gaussian), X) != cache.key(RCOV(random_state=pending), X)
+
+def test_least_recently_used_detectors_are_evicted(tmpdir, monkeypatch):
+    cache = FitCache(str(tmpdir))
+    data = [_data(seed) for seed in range(3)]
+    cache.fit(KNN(), data[0])
+    cache.max_bytes = int(2.5 * cache.size())
+    cache.fit(KNN(), data[1])
+    cache.fit(KNN(), data[0])
+    cache.fit(KNN(), data[2])
+    assert cache.size() <= cache.max_bytes
+    fits = _count_fits(monkeypatch)
+    hits = []
+    # the second data set was the least recently used one
+    for X in (data[0], data[2], data[1]):
+        n_fits = len(fits)
+        cache.fit(KNN(), X)
+        hits.append(len(fits) == n_fits)
+    assert hits == [True, True, False]
+    cache.clear()
+    assert cache.size() == 0
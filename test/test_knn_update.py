@@ -0,0 +1,55 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from algo.knn import KNN
+
+def _data(seed, n_samples=3000, n_features=3):
+    rng = np.random.RandomState(seed)
+    X = rng.normal(size=(n_samples, n_features))
+    # duplicates, whose neighbours tie
+    X[100:105] = X[99]
+    timestamps = np.datetime64('2019-08-01T00:00', 'ms') + np.arange(n_samples) * np.timedelta64(60, 's')
+    return X, timestamps
+
+@pytest.mark.parametrize('method', ['largest', 'mean', 'median'])
+def test_update_and_expire_match_a_fresh_fit(method):
+    X, timestamps = _data(0)
+    detector = KNN(method=method).fit(X[:1000], timestamps=timestamps[:1000])
+    for start in range(1000, 3000, 500):
+        detector.update(X[start:start + 500], timestamps=timestamps[start:start + 500])
+        detector.expire(timestamps[start - 500])
+        fresh = KNN(method=method).fit(X[start - 500:start + 500])
+        assert np.allclose(detector.decision_scores_, fresh.decision_scores_)
+        assert np.isclose(detector.threshold_, fresh.threshold_)
+        assert np.array_equal(detector.labels_, fresh.labels_)
+        assert np.allclose(detector.decision_function(X[:200]), fresh.decision_function(X[:200]))
+
+def test_update_keeps_the_scored_batches():
+    X, timestamps = _data(1)
+    detector = KNN(contamination=0.1).fit(X[:1000], timestamps=timestamps[:1000])
+    detector.decision_function(X[2000:2500])
+    detector.update(X[1000:1500], timestamps=timestamps[1000:1500])
+    detector.expire(timestamps[500])
+    assert len(detector.sketch_) == 500
+    assert len(detector.training_sketch_) == 1000
+    # the scores of the batch are those of the updated detector
+    fresh = KNN(contamination=0.1).fit(X[500:1500])
+    assert np.allclose(detector.decision_function(X[2000:2500]), fresh.decision_function(X[2000:2500]))
+
+def test_update_rescores_only_the_affected_samples():
+    X, timestamps = _data(2)
+    detector = KNN().fit(X[:2000], timestamps=timestamps[:2000])
+    scored = []
+    get_dist_by_method = detector._get_dist_by_method
+    detector._get_dist_by_method = lambda dist: scored.append(len(dist)) or get_dist_by_method(dist)
+    # samples far from every training sample are nobody's neighbour
+    detector.update(X[2000:2010] + 100, timestamps=timestamps[2000:2010])
+    assert scored == [10, 0]
+    # the oldest samples are the neighbours of a few others only
+    del scored[:]
+    detector.expire(timestamps[10])
+    assert sum(scored) < 100
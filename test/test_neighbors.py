@@ -0,0 +1,161 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from sklearn.metrics import pairwise_distances
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from algo.knn import KNN
+from algo.lof import LOF
+from algo.neighbors import NeighborIndex, search_algorithm
+from algo.sod import SOD
+
+def _data(seed, n_samples=600, n_features=3):
+    return np.random.RandomState(seed).normal(size=(n_samples, n_features))
+
+def _brute(X, samples, k, exclude_self=False, metric='euclidean'):
+    distances = pairwise_distances(X, samples, metric=metric)
+    if exclude_self:
+        np.fill_diagonal(distances, np.inf)
+    ind = np.argsort(distances, axis=1, kind='mergesort')[:, :k]
+    return np.take_along_axis(distances, ind, axis=1), ind
+
+@pytest.mark.parametrize('algorithm', ['auto', 'kd_tree', 'ball_tree', 'brute'])
+@pytest.mark.parametrize('metric', ['minkowski', 'manhattan', 'chebyshev'])
+def test_query_matches_brute_force(algorithm, metric):
+    X, Q = _data(0), _data(1, 50)
+    index = NeighborIndex(algorithm=algorithm, metric=metric).fit(X)
+    dist, ind = index.query(Q, k=5)
+    brute_dist, brute_ind = _brute(Q, X, 5, metric='euclidean' if metric == 'minkowski' else metric)
+    assert np.allclose(dist, brute_dist)
+    assert np.array_equal(ind, brute_ind)
+    # 'auto' picks the kd-tree for few features and metrics it supports
+    assert index.algorithm_ == ('kd_tree' if algorithm == 'auto' else algorithm)
+
+@pytest.mark.parametrize('algorithm', ['kd_tree', 'ball_tree', 'brute'])
+def test_query_of_the_indexed_samples_excludes_themselves(algorithm):
+    X = _data(2)
+    index = NeighborIndex(algorithm=algorithm, block_bytes=2 ** 12).fit(X)
+    dist, ind = index.query(k=4)
+    brute_dist, brute_ind = _brute(X, X, 4, exclude_self=True)
+    assert np.allclose(dist, brute_dist)
+    assert np.array_equal(ind, brute_ind)
+    # only some of the indexed samples
+    rows = np.array([5, 0, 599, 5])
+    dist, ind = index.query(k=4, rows=rows)
+    assert np.allclose(dist, brute_dist[rows]) and np.array_equal(ind, brute_ind[rows])
+
+def test_duplicates_are_their_own_neighbours():
+    X = _data(3)
+    X[10:13] = X[9]
+    dist, ind = NeighborIndex().fit(X).query(k=3)
+    for row in range(9, 13):
+        # the three other copies, but not the sample itself
+        assert np.array_equal(dist[row], np.zeros(3))
+        assert sorted(ind[row]) == sorted(set(range(9, 13)) - {row})
+
+def test_too_many_neighbours():
+    index = NeighborIndex().fit(_data(4, n_samples=10))
+    index.query(_data(5, n_samples=2), k=10)
+    with pytest.raises(ValueError):
+        index.query(k=10)
+    with pytest.raises(ValueError):
+        index.query(_data(5, n_samples=2), k=11)
+
+def test_threads_give_the_same_neighbours():
+    X, Q = _data(6, n_samples=2000), _data(7, n_samples=300)
+    single = NeighborIndex(algorithm='brute', block_bytes=2 ** 14).fit(X).query(Q, k=3)
+    threaded = NeighborIndex(algorithm='brute', block_bytes=2 ** 14, n_jobs=3).fit(X).query(Q, k=3)
+    assert np.array_equal(single[1], threaded[1])
+
+def _check_segments(index):
+    # every segment holds more than twice the samples of the next one
+    sizes = [len(samples) for samples in index.samples()]
+    assert all(older > 2 * newer for older, newer in zip(sizes, sizes[1:]))
+    assert len(sizes) <= np.log2(max(index.n_samples_, 1)) + 1
+
+def test_appended_batches_are_compacted():
+    X = _data(8, n_samples=3000)
+    index = NeighborIndex().fit(X[:1000])
+    for start in range(1000, 3000, 50):
+        index.append(X[start:start + 50])
+        _check_segments(index)
+    assert index.n_samples_ == 3000
+    assert np.array_equal(np.concatenate(index.samples()), X)
+    Q = _data(9, n_samples=40)
+    dist, ind = index.query(Q, k=6)
+    brute_dist, brute_ind = _brute(Q, X, 6)
+    assert np.allclose(dist, brute_dist) and np.array_equal(ind, brute_ind)
+    dist, ind = index.query(k=6)
+    brute_dist, brute_ind = _brute(X, X, 6, exclude_self=True)
+    assert np.allclose(dist, brute_dist) and np.array_equal(ind, brute_ind)
+
+def test_compaction_merges_the_newest_segments():
+    index = NeighborIndex().fit(_data(10, n_samples=100))
+    index.append(_data(11, n_samples=20))
+    assert [len(samples) for samples in index.samples()] == [100, 20]
+    # 40 samples are at least half of the 20 before them, then of the 100
+    index.append(_data(12, n_samples=30))
+    assert [len(samples) for samples in index.samples()] == [150]
+
+def test_removed_samples_move_the_others_up():
+    X = _data(13, n_samples=2000)
+    index = NeighborIndex().fit(X[:1000])
+    for start in range(1000, 2000, 100):
+        index.append(X[start:start + 100])
+    mask = np.zeros(2000, dtype=bool)
+    mask[:300] = True
+    mask[1500:1510] = True
+    index.remove(mask)
+    _check_segments(index)
+    kept = X[~mask]
+    assert index.n_samples_ == len(kept)
+    assert np.array_equal(np.concatenate(index.samples()), kept)
+    dist, ind = index.query(k=5)
+    brute_dist, brute_ind = _brute(kept, kept, 5, exclude_self=True)
+    assert np.allclose(dist, brute_dist) and np.array_equal(ind, brute_ind)
+    # segments without removed samples are kept as they are
+    before = index.samples()
+    index.remove(np.r_[np.zeros(len(kept) - 5, dtype=bool), np.ones(5, dtype=bool)])
+    assert index.samples()[0] is before[0]
+
+def _recall(ind, exact_ind):
+    return sum(len(np.intersect1d(a, e)) for a, e in zip(ind, exact_ind)) / exact_ind.size
+
+def test_approximate_index_recall():
+    X, Q = _data(14, n_samples=3000, n_features=8), _data(15, n_samples=200, n_features=8)
+    index = NeighborIndex(algorithm='approx', n_trees=20, n_iter=2, leaf_size=50, random_state=0).fit(X)
+    assert index.algorithm_ == 'approx'
+    dist, ind = index.query(Q, k=10)
+    assert _recall(ind, _brute(Q, X, 10)[1]) > 0.9
+    # the distances are exact for the neighbours found, in increasing order
+    assert np.allclose(dist, np.take_along_axis(pairwise_distances(Q, X), ind, axis=1))
+    assert np.all(np.diff(dist, axis=1) >= 0)
+    dist, ind = index.query(k=10)
+    assert not (ind == np.arange(len(X))[:, None]).any()
+    assert _recall(ind, _brute(X, X, 10, exclude_self=True)[1]) > 0.9
+
+def test_approximate_search_is_opt_in():
+    X = _data(16, n_samples=500)
+    # exact unless asked for, whatever the size of the data
+    assert NeighborIndex().fit(_data(17, n_samples=20000, n_features=40)).algorithm_ == 'brute'
+    assert search_algorithm('auto', None) == 'auto'
+    assert search_algorithm('auto', {}) == 'approx'
+    assert search_algorithm('approx', None) == 'approx'
+    with pytest.raises(ValueError):
+        search_algorithm('kd_tree', {'n_trees': 5})
+    for make in (KNN, SOD, lambda **kwargs: LOF(novelty=True, **kwargs)):
+        exact = make().fit(X)
+        assert getattr(exact, 'index_', None) is None or exact.index_.algorithm_ != 'approx'
+        assert make(approx_params={'random_state': 0}).fit(X).index_.algorithm_ == 'approx'
+
+def test_approximate_leaves_hold_the_neighbours():
+    X = _data(18, n_samples=500)
+    with pytest.raises(ValueError, match='n_neighbors=40 needs leaf_size >= 41'):
+        KNN(n_neighbors=40, algorithm='approx').fit(X)
+    KNN(n_neighbors=40, leaf_size=41, algorithm='approx').fit(X)
+    # small data sets are searched exactly
+    assert NeighborIndex(algorithm='approx').fit(X[:50]).algorithm_ == 'brute'
+    with pytest.raises(ValueError):
+        NeighborIndex(algorithm='approx', metric='cosine')
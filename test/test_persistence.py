@@ -0,0 +1,95 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from algo.hbos import HBOS
+from algo.knn import KNN
+from algo.lof import LOF
+from algo.ocsvm import OCSVM
+from algo.pca import PCA
+from algo.robustcovariance import RCOV
+from algo.sod import SOD
+from utils.persistence import FORMAT_VERSION, META, load_detector, save_detector
+
+DETECTORS = [KNN, lambda: KNN(approx_params={'random_state': 0}), HBOS, PCA, SOD,
+             lambda: LOF(novelty=True), lambda: RCOV(random_state=0), OCSVM]
+IDS = ['knn', 'knn-approx', 'hbos', 'pca', 'sod', 'lof', 'rcov', 'ocsvm']
+
+def _data():
+    rng = np.random.RandomState(0)
+    X = rng.normal(size=(2000, 4))
+    X[:20] += 5
+    return X, rng.normal(size=(300, 4)) * 2
+
+@pytest.mark.parametrize('mmap', [True, False])
+@pytest.mark.parametrize('make', DETECTORS, ids=IDS)
+def test_round_trip_gives_identical_scores(make, mmap, tmpdir):
+    X, Y = _data()
+    detector = make().fit(X)
+    path = os.path.join(str(tmpdir), 'detector')
+    detector.save(path)
+    loaded = type(detector).load(path, mmap=mmap)
+    assert type(loaded) is type(detector)
+    assert np.array_equal(loaded.decision_function(Y), detector.decision_function(Y))
+    assert np.array_equal(loaded.predict(Y), detector.predict(Y))
+    if hasattr(detector, 'decision_scores_'):
+        assert np.array_equal(loaded.decision_scores_, detector.decision_scores_)
+        assert loaded.threshold_ == detector.threshold_
+    # the big arrays are stored apart and memory-mapped on request
+    assert os.listdir(os.path.join(path, 'arrays'))
+    arrays = [value for value in vars(loaded).values() if isinstance(value, np.ndarray)]
+    if arrays:
+        assert any(isinstance(value, np.memmap) for value in arrays) == mmap
+
+def test_stream_state_survives(tmpdir):
+    X, Y = _data()
+    detector = KNN(contamination=0.05).fit(X)
+    detector.predict(Y[:100], stream=True)
+    path = os.path.join(str(tmpdir), 'knn')
+    detector.save(path)
+    loaded = KNN.load(path)
+    assert np.array_equal(loaded.predict(Y[100:], stream=True), detector.predict(Y[100:], stream=True))
+
+def test_loaded_detector_can_be_updated(tmpdir):
+    X, Y = _data()
+    timestamps = np.datetime64('2019-08-01', 'ms') + np.arange(2300) * np.timedelta64(1, 's')
+    detector = KNN().fit(X, timestamps=timestamps[:2000])
+    path = os.path.join(str(tmpdir), 'knn')
+    detector.save(path)
+    loaded = KNN.load(path)
+    for d in (detector, loaded):
+        d.update(Y, timestamps=timestamps[2000:])
+        d.expire(timestamps[300])
+    assert np.array_equal(loaded.decision_scores_, detector.decision_scores_)
+    # the saved arrays are copied on write, the artifact is unchanged
+    assert np.array_equal(KNN.load(path).decision_function(Y), KNN().fit(X).decision_function(Y))
+
+def test_shared_arrays_keep_their_identity(tmpdir):
+    array = np.arange(10000.)
+    path = os.path.join(str(tmpdir), 'pair')
+    save_detector({'a': array, 'b': array, 'small': np.arange(3.)}, path)
+    loaded = load_detector(path)
+    assert loaded['a'] is loaded['b']
+    assert len(os.listdir(os.path.join(path, 'arrays'))) == 1
+    assert np.array_equal(loaded['small'], np.arange(3.))
+
+def test_newer_formats_are_refused(tmpdir):
+    path = os.path.join(str(tmpdir), 'hbos')
+    HBOS().fit(_data()[0]).save(path)
+    with open(os.path.join(path, META)) as f:
+        meta = json.load(f)
+    meta['format'] = FORMAT_VERSION + 1
+    meta['versions']['numpy'] = '0.0'
+    with open(os.path.join(path, META), 'w') as f:
+        json.dump(meta, f)
+    with pytest.raises(ValueError, match='artifact format'):
+        HBOS.load(path)
+    meta['format'] = FORMAT_VERSION
+    with open(os.path.join(path, META), 'w') as f:
+        json.dump(meta, f)
+    with pytest.warns(UserWarning, match='numpy'):
+        HBOS.load(path)
@@ -0,0 +1,112 @@
+import copy
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from algo.base import Base
+from algo.hbos import HBOS
+from algo.robustcovariance import RCOV
+
+CONTAMINATION = 0.1
+
+def _data(seed):
+    rng = np.random.RandomState(seed)
+    return rng.normal(size=(2000,3)), rng.normal(size=(2000,3))
+
+@pytest.mark.parametrize('detector', [HBOS(contamination=CONTAMINATION), RCOV(contamination=CONTAMINATION)],
+                         ids=['hbos', 'rcov'])
+def test_stream_labels_contamination_share(detector):
+    X, Y = _data(0)
+    detector.fit(X)
+    labels = detector.predict(Y, stream=True)
+    assert set(np.unique(labels)) <= {-1, 1}
+    assert abs(np.mean(labels == -1) - CONTAMINATION) < 0.03
+
+@pytest.mark.parametrize('detector', [HBOS(contamination=CONTAMINATION), RCOV(contamination=CONTAMINATION)],
+                         ids=['hbos', 'rcov'])
+def test_stream_threshold_tracks_scored_batches(detector):
+    X, Y = _data(1)
+    detector.fit(X)
+    before = len(detector.sketch_) if detector.__dict__.get('sketch_') is not None else 0
+    detector.predict(Y, stream=True)
+    assert len(detector.sketch_) == before + len(Y)
+    # the outliers are on the abnormal side of the threshold
+    scores = detector.decision_function(Y)
+    outliers = detector.predict(Y, stream=True) == -1
+    if detector._inverted_scores:
+        assert scores[outliers].max() < scores[~outliers].min()
+    else:
+        assert scores[outliers].min() > scores[~outliers].max()
+
+@pytest.mark.parametrize('detector', [HBOS(contamination=CONTAMINATION), RCOV(contamination=CONTAMINATION)],
+                         ids=['hbos', 'rcov'])
+def test_batch_labels_leave_detector_unchanged(detector):
+    X, Y = _data(2)
+    detector.fit(X)
+    state = set(detector.__dict__)
+    labels = detector.predict(Y, batch=True)
+    # ties at the threshold are all flagged
+    assert np.sum(labels == -1) >= int(round(CONTAMINATION * len(Y)))
+    assert abs(np.mean(labels == -1) - CONTAMINATION) < 0.01
+    # only the memoised scores and the score sketch are kept
+    assert set(detector.__dict__) - state <= {'_scores_memo', 'sketch_', 'stream_threshold_'}
+
+class _ReconstructionStub(Base):
+    # fits and scores like the deep detectors, without torch: a linear
+    # reconstruction and the training scores setting threshold_
+    def __init__(self, contamination=CONTAMINATION):
+        super(_ReconstructionStub, self).__init__()
+        self.contamination = contamination
+
+    def fit(self, X):
+        self.mean_ = X.mean(axis=0)
+        self.components_ = np.linalg.svd(X - self.mean_, full_matrices=False)[2][:2]
+        self.decision_scores_ = self.decision_function(X)
+        self._process_decision_scores()
+        return self
+
+    def decision_function(self, X):
+        centered = np.asarray(X) - self.mean_
+        return np.square(centered - centered.dot(self.components_.T).dot(self.components_)).sum(axis=1)
+
+def _labels_against_training_threshold(detector):
+    X, Y = _data(3)
+    detector.fit(X)
+    # a calm batch and a batch holding the outliers
+    calm, wild = Y[:1000], Y[1000:] * 3
+    for batch in (calm, wild):
+        scores = detector.decision_function(batch)
+        assert np.array_equal(detector.predict(batch), np.where(scores > detector.threshold_, -1, 1))
+    assert np.mean(detector.predict(calm) == -1) < np.mean(detector.predict(wild) == -1)
+    return calm, wild
+
+def test_fitted_threshold_labels_every_batch_alike():
+    detector = _ReconstructionStub()
+    calm, wild = _labels_against_training_threshold(detector)
+    apart = np.concatenate([detector.predict(calm), detector.predict(wild)])
+    assert np.array_equal(apart, detector.predict(np.concatenate([calm, wild])))
+
+def test_deep_detector_keeps_training_threshold():
+    pytest.importorskip('torch')
+    from algo.autoencoder import AUTOENCODER
+    _labels_against_training_threshold(AUTOENCODER(num_epochs=1, sequence_length=5))
+
+def test_merged_copies_count_training_scores_once():
+    X, Y = _data(4)
+    # the stream drifts away from the training data
+    Y = Y * 2 + 1
+    single = _ReconstructionStub().fit(X)
+    first, second = copy.deepcopy(single), copy.deepcopy(single)
+    scores = np.concatenate([single.decision_scores_, single.decision_function(Y[:1000]),
+                             single.decision_function(Y[1000:])])
+    first.decision_function(Y[:1000])
+    second.decision_function(Y[1000:])
+    first.merge_sketch(second)
+    assert len(first.sketch_) == len(single.sketch_) == len(Y)
+    # the thresholds are at the same rank of every score, up to the sketch error
+    rank = lambda threshold: np.mean(scores <= threshold)
+    assert abs(rank(first.stream_threshold_) - rank(single.stream_threshold_)) < 0.01
+    assert abs(rank(single.stream_threshold_) - (1 - CONTAMINATION)) < 0.01
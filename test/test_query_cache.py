@@ -0,0 +1,148 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.backends import SQLiteCursor, get_backend
+from utils.cache import QueryCache
+from utils.utilities import insert_demo_data, query_data
+
+class _Table(object):
+    # a table with a row every 10 ms, the j-th column holding j * ts
+    def __init__(self, names=('ts', 'a', 'b')):
+        self.names = list(names)
+        self.fetched = []
+
+    def __call__(self, start, end, columns):
+        self.fetched.append((start, end, columns))
+        columns = self.names[1:] if columns is None else list(columns)
+        ts = np.arange(-(-start // 10) * 10, end + 1, 10)
+        values = np.stack([(self.names.index(c)) * ts.astype(np.float64) for c in columns], axis=1)
+        return [self.names[0]] + columns, ts.astype('datetime64[ms]'), values.reshape(len(ts), len(columns))
+
+def test_partial_ranges_are_topped_up(tmpdir):
+    cache, table = QueryCache(str(tmpdir)), _Table()
+    cache.query('db', 't', 1000, 2000, table)
+    names, ts, values = cache.query('db', 't', 500, 3000, table)
+    # only the gaps around the cached range are fetched
+    assert [(start, end) for start, end, _ in table.fetched] == [(1000, 2000), (500, 999), (2001, 3000)]
+    assert names == ['ts', 'a', 'b']
+    assert np.array_equal(ts.astype(np.int64), np.arange(500, 3001, 10))
+    assert np.array_equal(values, np.stack([ts.astype(np.int64), 2 * ts.astype(np.int64)], axis=1))
+    del table.fetched[:]
+    cache.query('db', 't', 700, 2500, table)
+    assert table.fetched == []
+
+def test_projections_come_from_the_cached_columns(tmpdir):
+    cache, table = QueryCache(str(tmpdir)), _Table()
+    cache.query('db', 't', 0, 1000, table)
+    names, ts, values = cache.query('db', 't', 200, 800, table, columns=['b'])
+    assert table.fetched == [(0, 1000, None)]
+    assert names == ['ts', 'b']
+    assert np.array_equal(values[:, 0], 2 * ts.astype(np.int64))
+
+def test_missing_columns_are_added_to_the_partitions(tmpdir):
+    cache, table = QueryCache(str(tmpdir)), _Table()
+    cache.query('db', 't', 0, 1000, table, columns=['a'])
+    names, ts, values = cache.query('db', 't', 0, 1500, table)
+    # the cached range only lacks 'b', the new range every column
+    assert table.fetched[1:] == [(1001, 1500, None), (0, 1000, ['b'])]
+    assert names == ['ts', 'a', 'b']
+    assert np.array_equal(values, np.stack([ts.astype(np.int64), 2 * ts.astype(np.int64)], axis=1))
+
+def test_least_recently_used_partitions_are_evicted(tmpdir):
+    table = _Table(('ts', 'a'))
+    cache = QueryCache(str(tmpdir), max_bytes=10 ** 9)
+    cache.query('db', 't', 0, 990, table)
+    one_partition = cache.size()
+    cache.max_bytes = 2 * one_partition
+    cache.query('db', 't', 1000, 1990, table)
+    # the first range is used again, the second one is the oldest
+    cache.query('db', 't', 0, 990, table)
+    cache.query('db', 't', 2000, 2990, table)
+    assert cache.size() <= cache.max_bytes
+    del table.fetched[:]
+    cache.query('db', 't', 0, 990, table)
+    cache.query('db', 't', 2000, 2990, table)
+    assert table.fetched == []
+    cache.query('db', 't', 1000, 1990, table)
+    assert [(start, end) for start, end, _ in table.fetched] == [(1000, 1990)]
+
+def test_schema_change_drops_the_table(tmpdir):
+    cache = QueryCache(str(tmpdir))
+    cache.query('db', 't', 0, 1000, _Table())
+    changed = _Table(('ts', 'a', 'b', 'c'))
+    names, ts, values = cache.query('db', 't', 500, 1500, changed)
+    # the whole range is fetched again with the new columns
+    assert [(start, end) for start, end, _ in changed.fetched] == [(1001, 1500), (500, 1500)]
+    assert names == ['ts', 'a', 'b', 'c']
+    assert np.array_equal(values[:, 2], 3 * ts.astype(np.int64))
+
+def test_invalidate_and_clear(tmpdir):
+    cache, table = QueryCache(str(tmpdir)), _Table()
+    cache.query('db', 't', 0, 1000, table)
+    cache.query('db', 'u', 0, 1000, table)
+    cache.invalidate('db', 't')
+    del table.fetched[:]
+    cache.query('db', 't', 0, 1000, table)
+    cache.query('db', 'u', 0, 1000, table)
+    assert len(table.fetched) == 1
+    cache.clear()
+    assert cache.size() == 0
+
+def test_empty_ranges(tmpdir):
+    cache = QueryCache(str(tmpdir))
+    names, ts, values = cache.query('db', 't', 1, 9, _Table())
+    assert names == ['ts', 'a', 'b'] and len(ts) == 0 and values.shape == (0, 2)
+    with pytest.raises(ValueError):
+        cache.query('db', 't', 9, 1, _Table())
+
+@pytest.fixture
+def demo_pool():
+    pool = get_backend('sqlite').pool(size=1)
+    np.random.seed(0)
+    ground_truth = insert_demo_data(pool, None, 'db', 't', '', '', False, True)
+    return pool, ground_truth
+
+@pytest.mark.parametrize('columns', [None, ['b']])
+def test_cached_queries_match_the_server(demo_pool, tmpdir, monkeypatch, columns):
+    pool, ground_truth = demo_pool
+    cache = QueryCache(str(tmpdir))
+    statements = []
+    execute = SQLiteCursor.execute
+    monkeypatch.setattr(SQLiteCursor, 'execute', lambda self, sql: statements.append(sql) or execute(self, sql))
+    windows = [('2019-08-01 01:00:00', '2019-08-01 03:00:00'),
+               ('2019-08-01 00:30:00', '2019-08-01 05:00:00'),
+               ('2019-08-01 04:00:00', '2019-09-01 02:00:00')]
+    for start, end in windows:
+        cached = query_data(pool, None, 'db', 't', start, end, 'ts', ground_truth=ground_truth,
+                            as_frame=False, cache=cache, columns=columns)
+        uncached = query_data(pool, None, 'db', 't', start, end, 'ts', ground_truth=ground_truth,
+                              as_frame=False, columns=columns)
+        for a, b in zip(cached, uncached):
+            assert np.array_equal(a, b)
+    del statements[:]
+    for start, end in windows:
+        query_data(pool, None, 'db', 't', start, end, 'ts', ground_truth=ground_truth,
+                   as_frame=False, cache=cache, columns=columns)
+    assert statements == []
+
+@pytest.mark.parametrize('cached', [True, False])
+def test_rows_before_a_range_are_counted_once(demo_pool, tmpdir, monkeypatch, cached):
+    pool, ground_truth = demo_pool
+    cache = QueryCache(str(tmpdir)) if cached else None
+    statements = []
+    execute = SQLiteCursor.execute
+    monkeypatch.setattr(SQLiteCursor, 'execute', lambda self, sql: statements.append(sql) or execute(self, sql))
+    # consecutive windows, as a sliding detector queries them
+    bounds = np.datetime64('2019-08-01T01:00', 'ms') + np.arange(0, 6 * 3600000, 1800000) * np.timedelta64(1, 'ms')
+    for rep in range(2):
+        for start, end in zip(bounds[:-1], bounds[1:] - np.timedelta64(1, 'ms')):
+            _, _, labels = query_data(pool, None, 'db', 't', start, end, 'ts', ground_truth=ground_truth,
+                                   as_frame=False, cache=cache)
+            offset = int((start - np.datetime64('2019-08-01', 'ms')) // np.timedelta64(60, 's'))
+            assert np.array_equal(labels, ground_truth[offset:offset + 30])
+    # once for the first window, whose older rows the cache does not hold
+    assert sum('count(' in sql for sql in statements) == (1 if cached else len(bounds) - 1)
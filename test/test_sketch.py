@@ -0,0 +1,84 @@
+import copy
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.sketch import QuantileSketch
+
+K = 200
+# the rank error of the sketch is about 1 / k
+MAX_RANK_ERROR = 2. / K
+
+def _rank_error(quantile, values):
+    values = np.sort(values)
+    return max(abs(np.searchsorted(values, quantile(q)) / len(values) - q)
+               for q in np.linspace(0, 1, 101))
+
+def _scores(seed, n=100000):
+    # heavy tailed, as anomaly scores are
+    return np.random.RandomState(seed).standard_cauchy(n)
+
+@pytest.mark.parametrize('seed', range(3))
+def test_rank_error_is_bounded(seed):
+    scores = _scores(seed)
+    sketch = QuantileSketch(K, random_state=seed)
+    for batch in np.array_split(scores, 37):
+        sketch.update(batch)
+    assert len(sketch) == len(scores)
+    assert _rank_error(sketch.quantile, scores) <= MAX_RANK_ERROR
+    # every score is accounted for, in O(k log(n / k)) values
+    values, weights = sketch._weighted()
+    assert weights.sum() == len(scores)
+    assert len(values) < K * np.log2(len(scores) / K)
+
+@pytest.mark.parametrize('seed', range(3))
+def test_merged_sketches_keep_the_bound(seed):
+    scores = _scores(seed)
+    parts = [QuantileSketch(K, random_state=seed + i).update(batch)
+             for i, batch in enumerate(np.array_split(scores, 8))]
+    last = copy.deepcopy(parts[-1])
+    merged = parts[0]
+    for part in parts[1:]:
+        merged.merge(part)
+    assert len(merged) == len(scores)
+    assert _rank_error(merged.quantile, scores) <= MAX_RANK_ERROR
+    # the merged sketches are left unchanged
+    assert all(np.array_equal(a, b) for a, b in zip(parts[-1].levels, last.levels))
+
+def test_quantile_of_several_sketches_counts_them_all():
+    scores = _scores(0)
+    first = QuantileSketch(K, random_state=0).update(scores[:30000])
+    second = QuantileSketch(K, random_state=1).update(scores[30000:])
+    levels = copy.deepcopy(second.levels)
+    assert _rank_error(lambda q: first.quantile(q, second), scores) <= MAX_RANK_ERROR
+    # both sketches are left unchanged
+    assert len(first) == 30000 and len(second) == 70000
+    assert all(np.array_equal(a, b) for a, b in zip(second.levels, levels))
+
+def test_from_sorted_matches_the_bound():
+    scores = np.sort(_scores(1))
+    sketch = QuantileSketch.from_sorted(scores, K, random_state=0)
+    assert len(sketch) == len(scores)
+    assert _rank_error(sketch.quantile, scores) <= MAX_RANK_ERROR
+    assert sketch._weighted()[1].sum() == len(scores)
+    # small inputs are kept whole
+    small = QuantileSketch.from_sorted(scores[:K], K)
+    assert small.quantile(0.5) == np.sort(scores[:K])[K // 2 - 1]
+    # and the sketch goes on like any other
+    sketch.update(_scores(2, 1000))
+    assert len(sketch) == len(scores) + 1000
+
+def test_edge_cases():
+    sketch = QuantileSketch(K)
+    assert np.isnan(sketch.quantile(0.5)) and np.isnan(sketch.rank(0.))
+    sketch.update([1., np.nan, 2., 3.])
+    assert len(sketch) == 3
+    assert sketch.quantile(0.) == 1. and sketch.quantile(1.) == 3.
+    assert sketch.rank(2.5) == pytest.approx(2. / 3)
+    with pytest.raises(ValueError):
+        sketch.quantile(1.5)
+    with pytest.raises(ValueError):
+        QuantileSketch(1)
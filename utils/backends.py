@@ -0,0 +1,530 @@
+import datetime
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from urllib.request import pathname2url
+
+import numpy as np
+
+from utils.connection import ConnectionPool
+
+
+def format_ts(timestamp):
+    """
+    Format a time stamp as a SQL literal with millisecond precision.
+
+    Parameters
+    ----------
+    timestamp: numpy.datetime64, datetime or str
+        The time stamp.
+
+    Returns
+    -------
+    literal: str
+        The time stamp as 'YYYY-MM-DD hh:mm:ss.sss'.
+
+    """
+    return np.datetime_as_string(np.datetime64(timestamp, 'ms'), unit='ms').replace('T', ' ')
+
+
+# milliseconds per TDengine interval unit
+_INTERVAL_UNITS = {'a': 1, 's': 1000, 'm': 60000, 'h': 3600000, 'd': 86400000, 'w': 604800000}
+
+
+def interval_ms(interval):
+    """
+    Convert an aggregation interval into milliseconds.
+
+    Parameters
+    ----------
+    interval: str, datetime.timedelta or numpy.timedelta64
+        The interval, as a TDengine duration such as '10s', '1m' or '1h'
+        (units a, s, m, h, d and w) or as a time delta.
+
+    Returns
+    -------
+    ms: int
+        The interval in milliseconds.
+
+    """
+    if isinstance(interval, str):
+        match = re.match(r'^\s*(\d+)\s*([asmhdw])\s*$', interval)
+        if match is None:
+            raise ValueError('Unsupported interval %s, expected e.g. 10s, 1m or 1h' %interval)
+        ms = int(match.group(1)) * _INTERVAL_UNITS[match.group(2)]
+    elif isinstance(interval, (datetime.timedelta, np.timedelta64)):
+        ms = int(np.timedelta64(interval).astype('timedelta64[ms]').astype(np.int64))
+    else:
+        raise TypeError('interval should be a str or a time delta, got %s' %type(interval))
+    if ms <= 0:
+        raise ValueError('interval should be positive, got %s' %interval)
+    return ms
+
+
+class Backend(object):
+    """
+    Storage backend of the query and insert helpers. A backend opens
+    connections and builds the statements which differ between databases,
+    i.e. creating databases and tables, selecting a time range and inserting
+    rows. Connections and pools opened by a backend carry it as their
+    ``backend`` attribute, so the helpers pick the dialect up from ``conn``.
+
+    """
+    #: statement checking that a pooled connection is still alive
+    health_check = None
+    #: separator between the value tuples of a multi-row insert
+    row_separator = ' '
+    #: aggregate functions supported by interval queries
+    aggregates = ('avg', 'min', 'max', 'count', 'sum')
+
+    def connect(self):
+        """
+        Open a new connection.
+
+        Returns
+        -------
+        conn: DB-API connection
+            The connection.
+        """
+        raise NotImplementedError
+
+    def pool(self, size=4, **kwargs):
+        """
+        Create a pool of reusable connections of this backend.
+
+        Parameters
+        ----------
+        size: int, optional (default=4)
+            The maximal number of open connections.
+        kwargs: dict
+            Further arguments of utils.connection.ConnectionPool, e.g.
+            ``check_interval`` or ``timeout``.
+
+        Returns
+        -------
+        pool: utils.connection.ConnectionPool
+            The connection pool.
+        """
+        kwargs.setdefault('health_check', self.health_check)
+        return ConnectionPool(self.connect, size=size, backend=self, **kwargs)
+
+    def create_database(self, session, database, drop=False):
+        """
+        Create a database if it does not exist yet.
+
+        Parameters
+        ----------
+        session: utils.connection.Session
+            The session to execute statements with.
+        database: str
+            Database name.
+        drop: bool, optional (default=False)
+            Whether to drop an existing database first.
+        """
+        if drop:
+            session.execute('drop database if exists %s' %database)
+        session.execute('create database if not exists %s' %database)
+
+    def create_table(self, session, table, columns):
+        """
+        Create a table if it does not exist yet.
+
+        Parameters
+        ----------
+        session: utils.connection.Session
+            The session to execute statements with.
+        table: str
+            Table name, qualified with its database as 'db.table'.
+        columns: list of (str, str)
+            Names and types of the columns, the time serie column first,
+            e.g. ``[('ts', 'timestamp'), ('a', 'float')]``.
+        """
+        session.execute('create table if not exists %s (%s)' %(table, ', '.join('%s %s' %column for column in columns)))
+
+    def range_query(self, table, time_serie_name, start_time=None, end_time=None, lower_op='>=', upper_op='<=',
+                    order=False, limit=None, columns=None):
+        """
+        Build the statement selecting the rows of a time range.
+
+        Parameters
+        ----------
+        table: str
+            Table name, qualified with its database as 'db.table'.
+        time_serie_name: str
+            Time_serie column name in the table.
+        start_time: str, datetime or numpy.datetime64, optional (default=None)
+            Time range, start from. Unbounded if empty.
+        end_time: str, datetime or numpy.datetime64, optional (default=None)
+            Time range, end at. Unbounded if empty.
+        lower_op: str, optional (default='>=')
+            Comparison of the lower bound, '>=' or '>'.
+        upper_op: str, optional (default='<=')
+            Comparison of the upper bound, '<=' or '<'.
+        order: bool, optional (default=False)
+            Whether to sort the rows by time stamp.
+        limit: int, optional (default=None)
+            The maximal number of rows.
+        columns: list of str, optional (default=None)
+            The columns to select besides the time serie column. Every
+            column is selected if None.
+
+        Returns
+        -------
+        sql: str
+            The select statement.
+        """
+        select = '*' if columns is None else ', '.join([time_serie_name] + list(columns))
+        sql = 'select %s from %s' %(select, table) + self._where(time_serie_name, start_time, end_time, lower_op, upper_op)
+        if order:
+            sql += ' order by %s' %time_serie_name
+        if limit is not None:
+            sql += ' limit %d' %limit
+        return sql
+
+    def interval_query(self, table, time_serie_name, columns, interval, aggs, start_time=None, end_time=None):
+        """
+        Build the statement aggregating the rows of a time range into fixed
+        time buckets. The result has the bucket start as first column and
+        one '<column>_<agg>' column per aggregate per column.
+
+        Parameters
+        ----------
+        table: str
+            Table name, qualified with its database as 'db.table'.
+        time_serie_name: str
+            Time_serie column name in the table.
+        columns: list of str
+            The columns to aggregate.
+        interval: str, datetime.timedelta or numpy.timedelta64
+            The bucket width, e.g. '1m' or '1h'.
+        aggs: list of str
+            The aggregate functions, among ``aggregates``.
+        start_time: str, datetime or numpy.datetime64, optional (default=None)
+            Time range, start from. Unbounded if empty.
+        end_time: str, datetime or numpy.datetime64, optional (default=None)
+            Time range, end at. Unbounded if empty.
+
+        Returns
+        -------
+        sql: str
+            The select statement.
+        """
+        ms = interval_ms(interval)
+        select = self._aggregate_columns(columns, aggs)
+        return 'select %s from %s%s interval(%s)' %(select, table, self._where(time_serie_name, start_time, end_time),
+                                                      interval.strip() if isinstance(interval, str) else '%da' %ms)
+
+    def count_query(self, table, time_serie_name, before):
+        """
+        Build the statement counting the rows older than a time stamp.
+
+        Parameters
+        ----------
+        table: str
+            Table name, qualified with its database as 'db.table'.
+        time_serie_name: str
+            Time_serie column name in the table.
+        before: str, datetime or numpy.datetime64
+            The time stamp.
+
+        Returns
+        -------
+        sql: str
+            The select statement.
+        """
+        return "select count(*) from %s where %s < '%s'" %(table,time_serie_name,format_ts(before))
+
+    def insert_statement(self, table, rows, out_of_order=False):
+        """
+        Build a multi-row insert statement.
+
+        Parameters
+        ----------
+        table: str
+            Table name, qualified with its database as 'db.table'.
+        rows: list of str
+            The value tuples, e.g. "('2019-08-01 00:00:00.000',1.5,NULL)".
+        out_of_order: bool, optional (default=False)
+            Whether the rows may be older than the rows already stored.
+
+        Returns
+        -------
+        sql: str
+            The insert statement.
+        """
+        return 'insert into %s values ' %table + self.row_separator.join(rows)
+
+    def _where(self, time_serie_name, start_time, end_time, lower_op='>=', upper_op='<='):
+        conditions = []
+        if start_time:
+            conditions.append("%s %s '%s'" %(time_serie_name,lower_op,format_ts(start_time)))
+        if end_time:
+            conditions.append("%s %s '%s'" %(time_serie_name,upper_op,format_ts(end_time)))
+        if not conditions:
+            return ''
+        return ' where ' + ' and '.join(conditions)
+
+    def _aggregate_columns(self, columns, aggs):
+        for agg in aggs:
+            if agg not in self.aggregates:
+                raise ValueError('Unsupported aggregate %s, expected one of %s' %(agg, self.aggregates))
+        return ', '.join('%s(%s) as %s_%s' %(agg, column, column, agg) for column in columns for agg in aggs)
+
+
+class TDengineBackend(Backend):
+    """
+    TDengine server backend. The taos client is only imported once a
+    connection is opened.
+
+    Parameters
+    ----------
+    host: str, optional (default='127.0.0.1')
+        Host name as the address of the TDEngine Server.
+    user: str, optional (default=None)
+        User name of the TDEngine Server.
+    password: str, optional (default=None)
+        Password for the TDEngine Server.
+    config: str, optional (default="/etc/taos")
+        Configuration directory.
+
+    """
+    health_check = 'select server_status()'
+    row_separator = ' '
+
+    def __init__(self, host='127.0.0.1', user=None, password=None, config="/etc/taos"):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.config = config
+
+    def insert_statement(self, table, rows, out_of_order=False):
+        # rows older than the last stored one are only taken by import
+        verb = 'import' if out_of_order else 'insert'
+        return '%s into %s values ' %(verb, table) + self.row_separator.join(rows)
+
+    def connect(self):
+        import taos
+        return taos.connect(self.host, self.user, self.password, config=self.config)
+
+
+class SQLiteBackend(Backend):
+    """
+    Embedded SQLite backend, standing in for the server on machines without
+    it. Every database is a separate SQLite database, attached to each
+    connection under its name so that 'db.table' names resolve as on the
+    server. Statements are serialised, as SQLite has a single writer.
+
+    Parameters
+    ----------
+    path: str, optional (default=None)
+        Directory holding one file per database. The databases are kept in
+        memory, shared by the connections of this backend, if None.
+
+    """
+    health_check = 'select 1'
+    row_separator = ','
+
+    def __init__(self, path=None):
+        self.path = path
+        self.databases = []
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            # databases created by earlier processes
+            self.databases = sorted(name[:-3] for name in os.listdir(path) if name.endswith('.db') and name != 'main.db')
+        self._name = uuid.uuid4().hex
+        self._lock = threading.RLock()
+        # keeps the in-memory databases alive while no other connection is open
+        self._keeper = self.connect()
+
+    def connect(self):
+        conn = sqlite3.connect(self._uri('main'), uri=True, isolation_level=None, check_same_thread=False)
+        return SQLiteConnection(self, conn)
+
+    def create_database(self, session, database, drop=False):
+        with self._lock:
+            if database not in self.databases:
+                self.databases.append(database)
+            self._keeper.attach()
+        if drop:
+            session.execute("select name from %s.sqlite_master where type = 'table'" %database)
+            for name, in session.fetchall():
+                session.execute('drop table %s.%s' %(database,name))
+
+    def create_table(self, session, table, columns):
+        # the time stamp is the primary key, which indexes range queries
+        columns = [(columns[0][0], '%s primary key' %columns[0][1])] + list(columns[1:])
+        super(SQLiteBackend, self).create_table(session, table, columns)
+
+    def range_query(self, table, time_serie_name, start_time=None, end_time=None, lower_op='>=', upper_op='<=',
+                    order=False, limit=None, columns=None):
+        # TDengine always returns rows in time order, SQLite in insertion order
+        return super(SQLiteBackend, self).range_query(table, time_serie_name, start_time, end_time,
+                                                      lower_op=lower_op, upper_op=upper_op, order=True, limit=limit,
+                                                      columns=columns)
+
+    def interval_query(self, table, time_serie_name, columns, interval, aggs, start_time=None, end_time=None):
+        # bucket the epoch milliseconds of the text time stamps
+        ms = interval_ms(interval)
+        epoch = "(cast(strftime('%%s', %s) as integer) * 1000 + cast(substr(%s, 21, 3) as integer))" %(time_serie_name,time_serie_name)
+        return 'select %s / %d * %d as %s, %s from %s%s group by 1 order by 1' %(
+            epoch, ms, ms, time_serie_name, self._aggregate_columns(columns, aggs), table,
+            self._where(time_serie_name, start_time, end_time))
+
+    def insert_statement(self, table, rows, out_of_order=False):
+        # like TDengine, keep the first row of a time stamp
+        return 'insert or ignore into %s values ' %table + self.row_separator.join(rows)
+
+    def _uri(self, database):
+        if self.path is None:
+            return 'file:%s_%s?mode=memory&cache=shared' %(self._name,database)
+        return 'file:%s' %pathname2url(os.path.abspath(os.path.join(self.path, '%s.db' %database)))
+
+
+class SQLiteConnection(object):
+    """
+    Connection of a SQLiteBackend, which attaches the databases of the
+    backend before running statements.
+
+    Parameters
+    ----------
+    backend: SQLiteBackend
+        The backend of the connection.
+    conn: sqlite3.Connection
+        The underlying connection.
+
+    """
+    def __init__(self, backend, conn):
+        self.backend = backend
+        self.conn = conn
+        self._attached = set()
+
+    def cursor(self):
+        return SQLiteCursor(self)
+
+    def attach(self):
+        """
+        Attach the databases created on the backend since the last call.
+        """
+        for database in self.backend.databases:
+            if database not in self._attached:
+                self.conn.execute('attach database ? as %s' %database, (self.backend._uri(database),))
+                self._attached.add(database)
+
+    def close(self):
+        self.conn.close()
+
+
+class SQLiteCursor(object):
+    """
+    DB-API cursor of a SQLiteConnection. Results are fetched while the
+    backend is locked, so that readers never see a partial insert.
+
+    Parameters
+    ----------
+    connection: SQLiteConnection
+        The connection of the cursor.
+
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = None
+        self._rows = []
+
+    def execute(self, sql):
+        with self.connection.backend._lock:
+            self.connection.attach()
+            cursor = self.connection.conn.execute(sql)
+            self.description = cursor.description
+            self._rows = cursor.fetchall()
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def close(self):
+        self._rows = []
+
+
+def fetch_blocks(cursor, block_rows=65536):
+    """
+    Yield the result set of an executed query one block of columns at a
+    time. Taos cursors hand the blocks of the client library over as they
+    are, without building a tuple per row; other cursors, e.g. those of
+    SQLiteBackend, only fetch rows, which are transposed block by block.
+
+    Parameters
+    ----------
+    cursor: taos.cursor.TDengineCursor, SQLiteCursor or utils.connection.Session
+        Cursor on which a select has been executed.
+    block_rows: int, optional (default=65536)
+        The number of rows of the blocks transposed from row fetches.
+
+    Yields
+    ------
+    columns: list of sequences
+        The values of every column of the block, NULL values as None.
+
+    """
+    cursor = getattr(cursor, 'cursor', cursor)
+    if getattr(cursor, '_result', None) is not None:
+        try:
+            from taos.cinterface import taos_fetch_block as fetch_block
+        except ImportError:
+            from taos.cinterface import CTaosInterface
+            fetch_block = CTaosInterface.fetchBlock
+        while True:
+            columns, n_rows = fetch_block(cursor._result, cursor._fields)
+            if n_rows == 0:
+                return
+            yield columns
+    else:
+        rows = cursor.fetchall()
+        for start in range(0, len(rows), block_rows):
+            yield list(zip(*rows[start:start + block_rows]))
+
+
+BACKENDS ={'tdengine': TDengineBackend, 'sqlite': SQLiteBackend}
+
+
+def get_backend(name, **kwargs):
+    """
+    Create a backend by name.
+
+    Parameters
+    ----------
+    name: str
+        Backend name, 'tdengine' or 'sqlite'.
+    kwargs: dict
+        Arguments of the backend class.
+
+    Returns
+    -------
+    backend: Backend
+        The backend.
+
+    """
+    if name not in BACKENDS:
+        raise ValueError('Unknown backend %s, expected one of %s' %(name, sorted(BACKENDS)))
+    return BACKENDS[name](**kwargs)
+
+
+def backend_of(conn):
+    """
+    Return the backend of a connection or pool. Connections opened without a
+    backend, e.g. plain taos connections, are taken as TDengine connections.
+
+    Parameters
+    ----------
+    conn: DB-API connection or utils.connection.ConnectionPool
+        The connection or pool.
+
+    Returns
+    -------
+    backend: Backend
+        The backend.
+
+    """
+    backend = getattr(conn, 'backend', None)
+    return backend if backend is not None else TDengineBackend()
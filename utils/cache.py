@@ -0,0 +1,502 @@
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+
+from utils.persistence import FORMAT_VERSION, load_detector
+from utils.utilities import fingerprint
+
+
+class QueryCache(object):
+    """
+    Local on-disk cache of queried time ranges. Every table keeps a set of
+    disjoint partitions, each holding the rows of one fetched time range as
+    a sorted int64 time stamp index ``ts.npy`` and one memory-mapped ``.npy``
+    file per column. A query only fetches the sub-ranges not covered by a
+    partition yet and the columns the covering partitions lack, so that
+    column projections are served from the partitions of the whole table.
+    Least recently used partitions are evicted once the cache outgrows
+    ``max_bytes``.
+
+    Cached ranges are assumed not to change on the server afterwards.
+
+    Parameters
+    ----------
+    root: str
+        Directory holding the cache.
+    max_bytes: int, optional (default=2 ** 30)
+        The disk budget of the cache in bytes.
+
+    """
+    INDEX = 'index.json'
+
+    def __init__(self, root, max_bytes=2 ** 30):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def query(self, database, table, start, end, fetch, columns=None):
+        """
+        Return the rows of ``database.table`` within [start, end], fetching
+        only the missing sub-ranges and columns.
+
+        Parameters
+        ----------
+        database: str
+            Database name.
+        table: str
+            Table name.
+        start: int
+            Time range, start from, as epoch milliseconds (inclusive).
+        end: int
+            Time range, end at, as epoch milliseconds (inclusive).
+        fetch: callable
+            ``fetch(start, end, columns)`` returns ``(names, timestamps, values)``
+            of the given feature columns, every column if None, for an
+            inclusive range of epoch milliseconds, as ``fetch_columns`` does.
+        columns: list of str, optional (default=None)
+            The feature columns to return. Every column is returned if None.
+
+        Returns
+        -------
+        names: list of str
+            Column names, the time serie first.
+        timestamps: numpy array of shape (n_samples,)
+            The time stamps as datetime64[ms].
+        values: numpy array of shape (n_samples, n_features)
+            The feature matrix.
+
+        """
+        if start > end:
+            raise ValueError('start %s is after end %s' % (start, end))
+        key_dir = self._key_dir(database, table)
+        index = self._read_index(key_dir)
+
+        def fetch_columns(lower, upper, wanted):
+            names, timestamps, values = fetch(lower, upper, wanted)
+            if wanted is None:
+                if index['names'] is not None and index['names'] != list(names):
+                    raise _SchemaChanged()
+                index['names'] = list(names)
+            index['time_serie'] = names[0]
+            return list(names[1:]), timestamps, values
+
+        try:
+            for gap_start, gap_end in self._missing(index['partitions'], start, end):
+                index['partitions'].append(self._write_partition(
+                    key_dir, gap_start, gap_end, *fetch_columns(gap_start, gap_end, columns)))
+
+            covering = [p for p in index['partitions'] if p['end'] >= start and p['start'] <= end]
+            for partition in covering:
+                wanted = columns
+                if wanted is None and index['names'] is not None:
+                    wanted = index['names'][1:]
+                if wanted is None:
+                    # the columns of the table are not known yet
+                    self._replace_partition(key_dir, partition, *fetch_columns(partition['start'], partition['end'], None))
+                    continue
+                missing = [c for c in wanted if c not in partition['columns']]
+                if missing and not self._add_columns(key_dir, partition, *fetch_columns(partition['start'], partition['end'], missing)):
+                    # rows arrived within the range since, fetch it again
+                    self._replace_partition(key_dir, partition, *fetch_columns(
+                        partition['start'], partition['end'], partition['columns'] + missing))
+        except _SchemaChanged:
+            # the schema changed, drop what was cached for this table
+            shutil.rmtree(key_dir)
+            os.makedirs(key_dir)
+            return self.query(database, table, start, end, fetch, columns=columns)
+
+        if columns is None:
+            columns = index['names'][1:]
+        now = time.time()
+        blocks_ts, blocks_values = [], []
+        for partition in sorted(covering, key=lambda p: p['start']):
+            partition['last_used'] = now
+            if partition['n_rows'] == 0:
+                continue
+            path = os.path.join(key_dir, partition['name'])
+            ts = np.load(os.path.join(path, 'ts.npy'), mmap_mode='r')
+            lo, hi = np.searchsorted(ts, [start, end + 1])
+            blocks_ts.append(ts[lo:hi])
+            blocks_values.append([np.load(os.path.join(path, _column_file(c)), mmap_mode='r')[lo:hi]
+                                  for c in columns])
+
+        timestamps = np.concatenate(blocks_ts or [np.empty(0, dtype=np.int64)]).astype('datetime64[ms]')
+        dtype = np.result_type(*[block[0] for block in blocks_values]) if blocks_values and columns else np.float64
+        # the projection is gathered from the cached columns, one column at a time
+        values = np.empty((len(timestamps), len(columns)), dtype=dtype)
+        row = 0
+        for block in blocks_values:
+            for j, column in enumerate(block):
+                values[row:row + len(column), j] = column
+            row += len(block[0]) if block else 0
+
+        self._write_index(key_dir, index)
+        self._evict()
+        return [index['time_serie']] + list(columns), timestamps, values
+
+    def count_before(self, database, table, start, count):
+        """
+        Return the number of rows older than ``start``. Within a run of
+        contiguous cached ranges, it is taken from the cached time stamp
+        indexes on top of the count before the run, so that the server only
+        counts the rows before every run once.
+
+        Parameters
+        ----------
+        database: str
+            Database name.
+        table: str
+            Table name.
+        start: int
+            Epoch milliseconds.
+        count: callable
+            ``count(start)`` returns the number of rows older than ``start``.
+
+        Returns
+        -------
+        n_rows: int
+            The number of rows older than ``start``.
+
+        """
+        key_dir = self._key_dir(database, table)
+        index = self._read_index(key_dir)
+        lower = self._run_start(index['partitions'], start)
+        if lower < start:
+            return (self.count_before(database, table, lower, count)
+                    + self._cached_rows(key_dir, index['partitions'], lower, start - 1))
+        if str(start) not in index['counts']:
+            index['counts'][str(start)] = int(count(start))
+            self._write_index(key_dir, index)
+        return index['counts'][str(start)]
+
+    def invalidate(self, database, table):
+        """
+        Remove every cached partition of a table, e.g. after it was
+        rewritten.
+
+        Parameters
+        ----------
+        database: str
+            Database name.
+        table: str
+            Table name.
+        """
+        shutil.rmtree(self._key_dir(database, table))
+
+    def clear(self):
+        """
+        Remove every cached partition.
+        """
+        shutil.rmtree(self.root)
+        os.makedirs(self.root)
+
+    def size(self):
+        """
+        Return the disk usage of the cached partitions in bytes.
+        """
+        return sum(p['bytes'] for _, _, p in self._all_partitions())
+
+    def _key_dir(self, database, table):
+        key_dir = os.path.join(self.root, '%s.%s' % (database, table))
+        os.makedirs(key_dir, exist_ok=True)
+        return key_dir
+
+    def _read_index(self, key_dir):
+        path = os.path.join(key_dir, self.INDEX)
+        if not os.path.exists(path):
+            return {'names': None, 'time_serie': None, 'partitions': [], 'counts': {}}
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_index(self, key_dir, index):
+        # write then rename, so that readers never see a partial index
+        path = os.path.join(key_dir, self.INDEX)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(index, f)
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def _run_start(partitions, start):
+        """
+        Return the start of the contiguous cached ranges ending right before
+        ``start``, ``start`` itself if no range does.
+        """
+        lower = start
+        while True:
+            before = [p['start'] for p in partitions if p['start'] < lower <= p['end'] + 1]
+            if not before:
+                return lower
+            lower = min(before)
+
+    @staticmethod
+    def _cached_rows(key_dir, partitions, start, end):
+        """
+        Count the cached rows within [start, end].
+        """
+        n_rows = 0
+        for partition in partitions:
+            if partition['end'] < start or partition['start'] > end or partition['n_rows'] == 0:
+                continue
+            ts = np.load(os.path.join(key_dir, partition['name'], 'ts.npy'), mmap_mode='r')
+            lo, hi = np.searchsorted(ts, [start, end + 1])
+            n_rows += int(hi - lo)
+        return n_rows
+
+    @staticmethod
+    def _missing(partitions, start, end):
+        """
+        Subtract the ranges covered by ``partitions`` from [start, end].
+        """
+        gaps = []
+        cursor = start
+        for partition in sorted(partitions, key=lambda p: p['start']):
+            if partition['end'] < cursor:
+                continue
+            if partition['start'] > end:
+                break
+            if partition['start'] > cursor:
+                gaps.append((cursor, partition['start'] - 1))
+            cursor = partition['end'] + 1
+        if cursor <= end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def _write_partition(self, key_dir, start, end, columns, timestamps, values):
+        name = uuid.uuid4().hex
+        os.makedirs(os.path.join(key_dir, name))
+        partition = {'name': name, 'start': int(start), 'end': int(end), 'columns': [],
+                     'n_rows': int(len(timestamps)), 'bytes': 0, 'last_used': time.time()}
+        timestamps = _epoch_ms(timestamps)
+        order = np.argsort(timestamps, kind='mergesort')
+        np.save(os.path.join(key_dir, name, 'ts.npy'), timestamps[order])
+        self._save_columns(key_dir, partition, columns, values, order)
+        return partition
+
+    def _add_columns(self, key_dir, partition, columns, timestamps, values):
+        """
+        Add columns to a partition, if their rows are those of the partition.
+        """
+        timestamps = _epoch_ms(timestamps)
+        order = np.argsort(timestamps, kind='mergesort')
+        cached = np.load(os.path.join(key_dir, partition['name'], 'ts.npy'), mmap_mode='r')
+        if not np.array_equal(cached, timestamps[order]):
+            return False
+        self._save_columns(key_dir, partition, columns, values, order)
+        return True
+
+    def _replace_partition(self, key_dir, partition, columns, timestamps, values):
+        shutil.rmtree(os.path.join(key_dir, partition['name']), ignore_errors=True)
+        partition.update(self._write_partition(key_dir, partition['start'], partition['end'],
+                                               columns, timestamps, values))
+
+    def _save_columns(self, key_dir, partition, columns, values, order):
+        path = os.path.join(key_dir, partition['name'])
+        for j, column in enumerate(columns):
+            np.save(os.path.join(path, _column_file(column)), np.ascontiguousarray(values[order, j]))
+        partition['columns'] = partition['columns'] + [c for c in columns if c not in partition['columns']]
+        partition['bytes'] = int(sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)))
+
+    def _all_partitions(self):
+        for key in os.listdir(self.root):
+            key_dir = os.path.join(self.root, key)
+            if not os.path.isdir(key_dir):
+                continue
+            index = self._read_index(key_dir)
+            for partition in index['partitions']:
+                yield key_dir, index, partition
+
+    def _evict(self):
+        """
+        Drop least recently used partitions until the cache fits ``max_bytes``.
+        """
+        partitions = sorted(self._all_partitions(), key=lambda item: item[2]['last_used'])
+        total = sum(p['bytes'] for _, _, p in partitions)
+        if total <= self.max_bytes:
+            return
+        evicted = {}
+        for key_dir, _, partition in partitions:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(os.path.join(key_dir, partition['name']), ignore_errors=True)
+            evicted.setdefault(key_dir, set()).add(partition['name'])
+            total -= partition['bytes']
+        for key_dir, names in evicted.items():
+            index = self._read_index(key_dir)
+            index['partitions'] = [p for p in index['partitions'] if p['name'] not in names]
+            self._write_index(key_dir, index)
+
+
+class FitCache(object):
+    """
+    Local on-disk cache of fitted detectors. A detector is keyed by its class,
+    its constructor parameters and a fingerprint of the training data, and
+    saved with ``save`` after fitting. Fitting an equal detector on the same
+    data again loads it instead, with its big arrays memory-mapped. Least
+    recently used detectors are evicted once the cache outgrows ``max_bytes``.
+
+    Parameters
+    ----------
+    root: str
+        Directory holding the cache.
+    max_bytes: int, optional (default=2 ** 32)
+        The disk budget of the cache in bytes.
+
+    """
+    INDEX = 'index.json'
+
+    def __init__(self, root, max_bytes=2 ** 32):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def fit(self, detector, X):
+        """
+        Fit ``detector`` on ``X`` in place, or load it if an equal detector
+        was fitted on the same data before.
+
+        Parameters
+        ----------
+        detector: Base
+            The detector, not fitted yet.
+        X: dataframe or numpy array of shape (n_samples, n_features)
+            The training data.
+
+        Returns
+        -------
+        detector: Base
+            The fitted detector.
+
+        """
+        # keyed before fitting, which may change the parameters or X
+        key = self.key(detector, X)
+        path = os.path.join(self.root, key)
+        index = self._read_index()
+        if key in index and os.path.isdir(path):
+            fitted = load_detector(path)
+            detector.__dict__.clear()
+            detector.__dict__.update(fitted.__dict__)
+        else:
+            detector.fit(X)
+            detector.save(path)
+            index[key] = {'bytes': _dir_bytes(path)}
+        index[key]['last_used'] = time.time()
+        self._evict(index)
+        self._write_index(index)
+        return detector
+
+    def key(self, detector, X):
+        """
+        Return the cache key of fitting ``detector`` on ``X``.
+
+        Parameters
+        ----------
+        detector: Base
+            The detector.
+        X: dataframe or numpy array of shape (n_samples, n_features)
+            The training data.
+
+        Returns
+        -------
+        key: str
+            The hex digest of the class, parameters and data.
+
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(('%s:%s:%s' % (type(detector).__module__, type(detector).__qualname__, FORMAT_VERSION)).encode())
+        for name, value in sorted(_constructor_params(detector).items()):
+            digest.update(('%s=%s;' % (name, _param_token(value))).encode())
+        if hasattr(X, 'columns'):
+            digest.update(repr(list(X.columns)).encode())
+        digest.update(fingerprint(X).encode())
+        return digest.hexdigest()
+
+    def clear(self):
+        """
+        Remove every cached detector.
+        """
+        shutil.rmtree(self.root)
+        os.makedirs(self.root)
+
+    def size(self):
+        """
+        Return the disk usage of the cached detectors in bytes.
+        """
+        return sum(entry['bytes'] for entry in self._read_index().values())
+
+    def _read_index(self):
+        path = os.path.join(self.root, self.INDEX)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_index(self, index):
+        path = os.path.join(self.root, self.INDEX)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(index, f)
+        os.replace(path + '.tmp', path)
+
+    def _evict(self, index):
+        """
+        Drop least recently used detectors until the cache fits ``max_bytes``.
+        """
+        total = sum(entry['bytes'] for entry in index.values())
+        for key in sorted(index, key=lambda k: index[k]['last_used']):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+            total -= index.pop(key)['bytes']
+
+
+class _SchemaChanged(Exception):
+    """The columns of a cached table changed on the server."""
+
+
+def _column_file(column):
+    # prefixed, so that no column clashes with the time stamp index
+    return 'col_%s.npy' % column
+
+
+def _epoch_ms(timestamps):
+    return np.asarray(timestamps).astype('datetime64[ms]').astype(np.int64)
+
+
+def _constructor_params(detector):
+    """
+    The values of the constructor parameters, as sklearn's ``get_params``.
+    Detectors storing a parameter with a trailing underscore, as SOD, are
+    read that way.
+    """
+    params = {}
+    for cls in type(detector).__mro__:
+        if '__init__' not in cls.__dict__ or cls is object:
+            continue
+        for name, parameter in inspect.signature(cls.__init__).parameters.items():
+            if name != 'self' and parameter.kind not in (parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD):
+                value = getattr(detector, name, getattr(detector, name + '_', parameter.default))
+                params.setdefault(name, value)
+        break
+    return params
+
+
+def _param_token(value):
+    if isinstance(value, np.random.RandomState):
+        # equal seeds give equal states, unlike the repr; the position in
+        # the key stream and the cached gaussian are part of the state
+        name, keys, pos, has_gauss, gauss = value.get_state()
+        return 'RandomState(%s,%d,%d,%r)' % (fingerprint(keys), pos, has_gauss, gauss)
+    if isinstance(value, np.ndarray):
+        return fingerprint(value)
+    if isinstance(value, type) or callable(value):
+        return '%s.%s' % (getattr(value, '__module__', ''), getattr(value, '__qualname__', repr(value)))
+    return repr(value)
+
+
+def _dir_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
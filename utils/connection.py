@@ -0,0 +1,209 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Session(object):
+    """
+    A connection and its cursor, used in place of a cursor by the query helpers.
+    When a statement fails, the cursor is recycled instead of closing the
+    shared connection.
+
+    Parameters
+    ----------
+    conn: taos.connection.TDengineConnection
+        TDEnginine connection name.
+    cursor: taos.cursor.TDengineCursor, optional (default=None)
+        TDEnginine cursor name. A new cursor is opened if None.
+    owned: bool, optional (default=True)
+        Whether the session owns the cursor. Cursors of the caller are
+        never closed or replaced.
+
+    """
+    def __init__(self, conn, cursor=None, owned=True):
+        self.conn = conn
+        self.cursor = cursor if cursor is not None else conn.cursor()
+        self.owned = owned
+        self.failed = False
+        self.last_used = time.time()
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    def execute(self, sql):
+        """
+        Execute a statement, recycling the cursor if it fails.
+
+        Parameters
+        ----------
+        sql: str
+            The statement to execute.
+        """
+        try:
+            return self.cursor.execute(sql)
+        except Exception:
+            self.failed = True
+            if self.owned:
+                self.recycle()
+            raise
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def recycle(self):
+        """
+        Close the current cursor and open a new one on the same connection.
+        """
+        try:
+            self.cursor.close()
+        except Exception:
+            pass
+        self.cursor = self.conn.cursor()
+
+    def close(self):
+        """
+        Close the cursor and the connection.
+        """
+        for resource in (self.cursor, self.conn):
+            try:
+                resource.close()
+            except Exception:
+                pass
+
+
+class ConnectionPool(object):
+    """
+    A bounded pool of reusable database sessions. Sessions are checked out
+    with a context manager and returned to the pool afterwards, so jobs run
+    back to back share their connections instead of reconnecting.
+
+    Parameters
+    ----------
+    connect: callable
+        Function without arguments returning a new connection.
+    size: int, optional (default=4)
+        The maximal number of open connections.
+    health_check: str or None, optional (default='select server_status()')
+        Statement run on a session before handing it out again after a
+        failure or after ``check_interval`` idle seconds. Unhealthy sessions
+        are replaced by new connections. No check is run if None.
+    check_interval: float, optional (default=30.)
+        The idle time in seconds after which a session is checked again.
+    timeout: float or None, optional (default=None)
+        The time in seconds to wait for a free session. Waits forever if None.
+    backend: utils.backends.Backend, optional (default=None)
+        The backend opening the connections, which the query and insert
+        helpers take their dialect from. TDengine is assumed if None.
+
+    """
+    def __init__(self, connect, size=4, health_check='select server_status()', check_interval=30., timeout=None, backend=None):
+        if size < 1:
+            raise ValueError('size should be at least 1, got %s' %size)
+        self.connect = connect
+        self.size = size
+        self.health_check = health_check
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self.backend = backend
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._n_open = 0
+        self._closed = False
+
+    @contextmanager
+    def checkout(self):
+        """
+        Check a session out of the pool, and return it once the block exits.
+
+        Yields
+        ------
+        session: Session
+            The checked out session.
+        """
+        session = self._acquire()
+        try:
+            yield session
+        finally:
+            self._release(session)
+
+    def close(self):
+        """
+        Close every idle connection. Checked out sessions are closed when
+        they are returned.
+        """
+        self._closed = True
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(session)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _acquire(self):
+        if self._closed:
+            raise RuntimeError('The connection pool is closed')
+        try:
+            session = self._idle.get_nowait()
+        except queue.Empty:
+            session = None
+
+        if session is None:
+            with self._lock:
+                can_open = self._n_open < self.size
+                if can_open:
+                    self._n_open += 1
+            if can_open:
+                return self._open()
+            try:
+                session = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise RuntimeError('No connection available after %s seconds' %self.timeout)
+
+        if not self._healthy(session):
+            self._discard(session)
+            with self._lock:
+                self._n_open += 1
+            return self._open()
+        return session
+
+    def _release(self, session):
+        session.last_used = time.time()
+        if self._closed:
+            self._discard(session)
+        else:
+            self._idle.put(session)
+
+    def _open(self):
+        try:
+            return Session(self.connect())
+        except Exception:
+            with self._lock:
+                self._n_open -= 1
+            raise
+
+    def _discard(self, session):
+        session.close()
+        with self._lock:
+            self._n_open -= 1
+
+    def _healthy(self, session):
+        if self.health_check is None:
+            return True
+        if not session.failed and time.time() - session.last_used < self.check_interval:
+            return True
+        try:
+            session.cursor.execute(self.health_check)
+            session.cursor.fetchall()
+        except Exception:
+            return False
+        session.failed = False
+        return True
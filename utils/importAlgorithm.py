@@ -1,33 +1,73 @@
-from algo.iforest import IFOREST
-from algo.ocsvm import OCSVM
-from algo.lof import LOF
-from algo.robustcovariance import RCOV
-from algo.staticautoencoder import StaticAutoEncoder
-from algo.luminolFunc import luminolDet
-from algo.cblof import CBLOF
-from algo.knn import KNN
-from algo.hbos import HBOS
-from algo.sod import SOD
-from algo.pca import PCA
-from algo.dagmm import DAGMM
-from algo.lstmad import LSTMAD
-from algo.lstmencdec import LSTMED
-from algo.autoencoder import AUTOENCODER
-
-def algorithm_selection(algorithm,random_state,contamination):
+import importlib
+
+# name -> (target, shared, defaults, unscaled), see register_algorithm
+_REGISTRY = {}
+
+def register_algorithm(name,target,shared=('contamination','random_state'),overwrite=False,unscaled=None,**defaults):
+    """
+    Register a detector under a name. Nothing is imported or built until the
+    detector is selected, so registering costs nothing.
+
+    Parameters
+    ----------
+    name: str
+        The name the detector is selected with.
+    target: str or callable
+        The detector class or factory, or its import path as
+        'package.module:ClassName'.
+    shared: tuple of str, optional (default=('contamination','random_state'))
+        The arguments of ``algorithm_selection`` passed on to the detector.
+    overwrite: bool, optional (default=False)
+        Whether to replace a detector registered under the same name.
+    unscaled: dict, optional (default=None)
+        The constructor parameters turning off the scaling the detector does
+        itself, for input scaled beforehand, e.g. by a ``Preprocessor``.
+    defaults: dict
+        Default constructor parameters of the detector.
+
+    """
+    if name in _REGISTRY and not overwrite:
+        raise ValueError('Algorithm %s is already registered' %name)
+    _REGISTRY[name] = (target, tuple(shared), defaults, dict(unscaled or {}))
+
+def available_algorithms():
+    """
+    Return the names of the registered detectors.
+
+    Returns
+    -------
+    names: list of str
+        The sorted detector names.
+
+    """
+    return sorted(_REGISTRY)
+
+def _resolve(target):
+    if isinstance(target, str):
+        module, _, attr = target.partition(':')
+        return getattr(importlib.import_module(module), attr)
+    return target
+
+def algorithm_selection(algorithm,random_state=None,contamination=0.1,prescaled=False,**params):
     """
-    Select algorithm from tokens.
+    Select algorithm from tokens. Only the module of the selected algorithm is imported.
 
     Parameters
     ----------
     algorithm: str, optional (default='iforest', choices=['iforest','lof','ocsvm','robustcovariance','staticautoencoder','luminol','cblof','knn','hbos','sod','pca','dagmm','autoencoder','lstm_ad','lstm_ed'])
-        The name of the algorithm.
+        The name of the algorithm, one of ``available_algorithms()``.
     random_state: np.random.RandomState
         The random state from the given random seeds.
     contamination : float in (0., 0.5), optional (default=0.1)
         The amount of contamination of the data set,
         i.e. the proportion of outliers in the data set. Used when fitting to
         define the threshold on the decision function.
+    prescaled: bool, optional (default=False)
+        Whether the input is scaled beforehand, so that the detectors scaling
+        their input themselves do not scale it a second time.
+    params: dict
+        Constructor parameters overriding the registered defaults, e.g.
+        ``n_neighbors=10``.
 
     Returns
     -------
@@ -35,22 +75,29 @@ def algorithm_selection(algorithm,random_state,contamination):
         The selected algorithm method.
 
     """
-    algorithm_dic={'iforest':IFOREST(contamination=contamination,n_estimators=100,max_samples="auto", max_features=1.,bootstrap=False,n_jobs=None,behaviour='old',random_state=random_state,verbose=0,warm_start=False),
-                   'ocsvm':OCSVM(gamma='auto',kernel='rbf', degree=3,coef0=0.0, tol=1e-3, nu=0.5, shrinking=True, cache_size=200,verbose=False, max_iter=-1, random_state=random_state),
-                   'lof': LOF(contamination=contamination,n_neighbors=20, algorithm='auto', leaf_size=30,metric='minkowski', p=2, metric_params=None, novelty=True, n_jobs=None),
-                   'robustcovariance':RCOV(random_state=random_state,store_precision=True, assume_centered=False,support_fraction=None, contamination=0.1),
-                   'staticautoencoder':StaticAutoEncoder(contamination=contamination,epoch=100,dropout_rate=0.2,regularizer_weight=0.1,activation='relu',kernel_regularizer=0.01,loss_function='mse',optimizer='adam'),
-                   'cblof':CBLOF(contamination=contamination,n_clusters=8, clustering_estimator=None, alpha=0.9, beta=5,use_weights=False, random_state=random_state,n_jobs=1),
-                   'knn':KNN(contamination=contamination,n_neighbors=5, method='largest',radius=1.0, algorithm='auto', leaf_size=30, metric='minkowski', p=2, metric_params=None, n_jobs=1),
-                   'hbos':HBOS(contamination=contamination, n_bins=10, alpha=0.1, tol=0.5),
-                   'sod':SOD(contamination=contamination,n_neighbors=20, ref_set=10,alpha=0.8),
-                   'pca':PCA(contamination=contamination, n_components=None, n_selected_components=None, copy=True, whiten=False, svd_solver='auto',tol=0.0, iterated_power='auto',random_state=random_state,weighted=True, standardization=True),
-                   'dagmm':DAGMM(contamination=contamination,num_epochs=10, lambda_energy=0.1, lambda_cov_diag=0.005, lr=1e-3, batch_size=50, gmm_k=3, normal_percentile=80, sequence_length=30, autoencoder_args=None),
-                   'luminol': luminolDet(contamination=contamination),
-                   'autoencoder':AUTOENCODER(contamination=contamination,num_epochs=10, batch_size=20, lr=1e-3,hidden_size=5, sequence_length=30, train_gaussian_percentage=0.25),
-                   'lstm_ad':LSTMAD(contamination=contamination,len_in=1, len_out=10, num_epochs=100, lr=1e-3, batch_size=1),
-                   'lstm_ed':LSTMED(contamination=contamination,num_epochs=10, batch_size=20, lr=1e-3,hidden_size=5, sequence_length=30, train_gaussian_percentage=0.25)
-                   }
-    alg = algorithm_dic[algorithm]
-    return alg
+    if algorithm not in _REGISTRY:
+        raise ValueError('Unknown algorithm %s, expected one of %s' %(algorithm, available_algorithms()))
+    target, shared, defaults, unscaled = _REGISTRY[algorithm]
+    call_args = {'contamination': contamination, 'random_state': random_state}
+    kwargs = dict(defaults)
+    kwargs.update((name, call_args[name]) for name in shared)
+    if prescaled:
+        kwargs.update(unscaled)
+    kwargs.update(params)
+    return _resolve(target)(**kwargs)
 
+register_algorithm('iforest','algo.iforest:IFOREST',n_estimators=100,max_samples="auto", max_features=1.,bootstrap=False,n_jobs=None,behaviour='old',verbose=0,warm_start=False)
+register_algorithm('ocsvm','algo.ocsvm:OCSVM',shared=('random_state',),gamma='auto',kernel='rbf', degree=3,coef0=0.0, tol=1e-3, nu=0.5, shrinking=True, cache_size=200,verbose=False, max_iter=-1)
+register_algorithm('lof','algo.lof:LOF',shared=('contamination',),n_neighbors=20, algorithm='auto', leaf_size=30,metric='minkowski', p=2, metric_params=None, novelty=True, n_jobs=None, approx_params=None)
+register_algorithm('robustcovariance','algo.robustcovariance:RCOV',shared=('random_state',),store_precision=True, assume_centered=False,support_fraction=None, contamination=0.1)
+register_algorithm('staticautoencoder','algo.staticautoencoder:StaticAutoEncoder',shared=('contamination',),epoch=100,dropout_rate=0.2,regularizer_weight=0.1,activation='relu',kernel_regularizer=0.01,loss_function='mse',optimizer='adam',scaler='robust',unscaled={'scaler':None})
+register_algorithm('cblof','algo.cblof:CBLOF',n_clusters=8, clustering_estimator=None, alpha=0.9, beta=5,use_weights=False,n_jobs=1)
+register_algorithm('knn','algo.knn:KNN',shared=('contamination',),n_neighbors=5, method='largest',radius=1.0, algorithm='auto', leaf_size=30, metric='minkowski', p=2, metric_params=None, n_jobs=1, approx_params=None)
+register_algorithm('hbos','algo.hbos:HBOS',shared=('contamination',),n_bins=10, alpha=0.1, tol=0.5)
+register_algorithm('sod','algo.sod:SOD',shared=('contamination',),n_neighbors=20, ref_set=10,alpha=0.8, algorithm='auto', approx_params=None)
+register_algorithm('pca','algo.pca:PCA',n_components=None, n_selected_components=None, copy=True, whiten=False, svd_solver='auto',tol=0.0, iterated_power='auto',weighted=True, standardization=True,unscaled={'standardization':False})
+register_algorithm('dagmm','algo.dagmm:DAGMM',shared=('contamination',),num_epochs=10, lambda_energy=0.1, lambda_cov_diag=0.005, lr=1e-3, batch_size=50, gmm_k=3, normal_percentile=80, sequence_length=30, autoencoder_args=None)
+register_algorithm('luminol','algo.luminolFunc:luminolDet',shared=('contamination',))
+register_algorithm('autoencoder','algo.autoencoder:AUTOENCODER',shared=('contamination',),num_epochs=10, batch_size=20, lr=1e-3,hidden_size=5, sequence_length=30, train_gaussian_percentage=0.25)
+register_algorithm('lstm_ad','algo.lstmad:LSTMAD',shared=('contamination',),len_in=1, len_out=10, num_epochs=100, lr=1e-3, batch_size=1)
+register_algorithm('lstm_ed','algo.lstmencdec:LSTMED',shared=('contamination',),num_epochs=10, batch_size=20, lr=1e-3,hidden_size=5, sequence_length=30, train_gaussian_percentage=0.25)
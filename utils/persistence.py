@@ -0,0 +1,173 @@
+import json
+import logging
+import os
+import pickle
+import shutil
+import sys
+import uuid
+import warnings
+
+import numpy as np
+
+# version of the artifact layout, raised on incompatible changes
+FORMAT_VERSION = 1
+
+META = 'meta.json'
+STATE = 'detector.pkl'
+ARRAYS = 'arrays'
+
+
+def _versions():
+    versions = {'python': '%d.%d' % sys.version_info[:2], 'numpy': np.__version__}
+    for name in ('sklearn', 'torch', 'tensorflow'):
+        if name in sys.modules:
+            versions[name] = getattr(sys.modules[name], '__version__', None)
+    return versions
+
+
+class _Pickler(pickle.Pickler):
+    """
+    Pickler storing big numpy arrays and torch tensors as ``.npy`` files and
+    Keras models as ``.h5`` files next to the pickle, referenced by id.
+    """
+    def __init__(self, file, root, min_bytes):
+        super().__init__(file, protocol=4)
+        self.root = root
+        self.min_bytes = min_bytes
+        # persistent ids are not memoised by pickle, objects referenced
+        # twice must be stored once to keep their identity
+        self.ids = {}
+        self.alive = []
+
+    def persistent_id(self, obj):
+        if id(obj) in self.ids:
+            return self.ids[id(obj)]
+        pid = self._store(obj)
+        if pid is not None:
+            self.ids[id(obj)] = pid
+            self.alive.append(obj)
+        return pid
+
+    def _store(self, obj):
+        if isinstance(obj, logging.Logger):
+            return ('logger', obj.name)
+        if isinstance(obj, np.ndarray) and not obj.dtype.hasobject and obj.nbytes >= self.min_bytes:
+            return ('array', self._save_array(obj))
+        torch = sys.modules.get('torch')
+        if torch is not None and isinstance(obj, torch.Tensor):
+            if obj.numel() * obj.element_size() < self.min_bytes:
+                return None
+            kind = 'parameter' if isinstance(obj, torch.nn.Parameter) else 'tensor'
+            return (kind, self._save_array(obj.detach().cpu().numpy()), obj.requires_grad)
+        tf = sys.modules.get('tensorflow')
+        if tf is not None and isinstance(obj, tf.keras.Model):
+            name = 'keras_%d.h5' % len(self.ids)
+            obj.save(os.path.join(self.root, name))
+            return ('keras', name)
+        return None
+
+    def _save_array(self, array):
+        name = os.path.join(ARRAYS, '%d.npy' % len(self.ids))
+        np.save(os.path.join(self.root, name), array)
+        return name
+
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, file, root, mmap):
+        super().__init__(file)
+        self.root = root
+        self.mmap = mmap
+        self.objects = {}
+
+    def persistent_load(self, pid):
+        if pid not in self.objects:
+            self.objects[pid] = self._load(pid)
+        return self.objects[pid]
+
+    def _load(self, pid):
+        kind = pid[0]
+        if kind == 'logger':
+            return logging.getLogger(pid[1])
+        if kind == 'keras':
+            import tensorflow as tf
+            return tf.keras.models.load_model(os.path.join(self.root, pid[1]))
+        # copy-on-write, so that the pages are shared until written
+        array = np.load(os.path.join(self.root, pid[1]), mmap_mode='c' if self.mmap else None)
+        if kind == 'array':
+            return array
+        import torch
+        tensor = torch.from_numpy(array)
+        if kind == 'parameter':
+            return torch.nn.Parameter(tensor, requires_grad=pid[2])
+        return tensor.requires_grad_(pid[2])
+
+
+def save_detector(detector, path, min_bytes=4096):
+    """
+    Save a fitted detector into the directory ``path``, replacing it if it
+    exists. Numpy arrays and torch tensors of at least ``min_bytes`` bytes,
+    e.g. training sets, tree data or Gaussian parameters, are stored as
+    ``.npy`` files, so that ``load_detector`` can memory-map them. Keras
+    models are stored as ``.h5`` files.
+
+    Parameters
+    ----------
+    detector: object
+        The detector.
+    path: str
+        Directory of the artifact.
+    min_bytes: int, optional (default=4096)
+        The size from which arrays are stored as ``.npy`` files.
+
+    """
+    tmp = '%s.%s.tmp' % (path.rstrip(os.sep), uuid.uuid4().hex)
+    os.makedirs(os.path.join(tmp, ARRAYS))
+    try:
+        with open(os.path.join(tmp, STATE), 'wb') as f:
+            _Pickler(f, tmp, min_bytes).dump(detector)
+        meta = {'format': FORMAT_VERSION,
+                'class': '%s:%s' % (type(detector).__module__, type(detector).__name__),
+                'versions': _versions()}
+        with open(os.path.join(tmp, META), 'w') as f:
+            json.dump(meta, f, indent=2)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    # write then rename, so that readers never see a partial artifact
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(tmp, path)
+
+
+def load_detector(path, mmap=True):
+    """
+    Load a detector saved by ``save_detector``.
+
+    Parameters
+    ----------
+    path: str
+        Directory of the artifact.
+    mmap: bool, optional (default=True)
+        Whether to memory-map the ``.npy`` files copy-on-write instead of
+        reading them, so that processes loading the same artifact share
+        their pages and loading costs no reads.
+
+    Returns
+    -------
+    detector: object
+        The detector. Torch modules are loaded on the CPU.
+
+    """
+    with open(os.path.join(path, META)) as f:
+        meta = json.load(f)
+    if meta['format'] > FORMAT_VERSION:
+        raise ValueError('%s has artifact format %s, this version reads up to %s'
+                         % (path, meta['format'], FORMAT_VERSION))
+    with open(os.path.join(path, STATE), 'rb') as f:
+        detector = _Unpickler(f, path, mmap).load()
+    current = _versions()
+    for name, version in meta['versions'].items():
+        if name != 'python' and name in current and current[name] != version:
+            warnings.warn('%s was saved with %s %s, loaded with %s'
+                          % (path, name, version, current[name]))
+    return detector
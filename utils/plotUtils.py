@@ -1,9 +1,15 @@
-from matplotlib import pyplot as plt
-import seaborn as sns
 import pandas as pd
-from sklearn.manifold import TSNE
 import numpy as np
-sns.set(style="ticks")
+
+
+def _plot_libs():
+    """
+    Import matplotlib and seaborn on first use, as loading them takes
+    seconds and most runs never plot.
+    """
+    from matplotlib import pyplot as plt
+    import seaborn as sns
+    return plt, sns
 
 
 def visualize_distribution(X,prediction,score):
@@ -20,6 +26,8 @@ def visualize_distribution(X,prediction,score):
         The outlier score of the test data.
     """
 
+    from sklearn.manifold import TSNE
+    plt, sns = _plot_libs()
     sns.set(style="ticks")
     X=X.to_numpy()
     X_embedding = TSNE(n_components=2).fit_transform(X)
@@ -40,6 +48,8 @@ def visualize_distribution_static(X,prediction,score):
     score: umpy array of shape (n_test, )
         The outlier score of the test data.
     """
+    from sklearn.manifold import TSNE
+    plt, sns = _plot_libs()
     sns.set(style="darkgrid")
 
     X=X.to_numpy()
@@ -68,6 +78,7 @@ def visualize_distribution_time_serie(ts,value):
     value: numpy array of shape (n_test, )
         The outlier score of the test data.
     """
+    plt, sns = _plot_libs()
     sns.set(style="ticks")
 
     ts = pd.DatetimeIndex(ts)
@@ -96,6 +107,7 @@ def visualize_outlierscore(value,label,contamination):
         define the threshold on the decision function.
     """
 
+    plt, sns = _plot_libs()
     sns.set(style="darkgrid")
 
     ts = np.arange(len(value))
@@ -132,6 +144,8 @@ def visualize_outlierresult(X,label):
         The label of test data produced by the algorithm.
 
     """
+    plt, sns = _plot_libs()
+    sns.set(style="ticks")
     X['outlier']=pd.Series(label)
     pal = dict(inlier="#4CB391", outlier="gray")
     g = sns.pairplot(X, hue="outlier", palette=pal)
@@ -0,0 +1,133 @@
+import numpy as np
+from sklearn.preprocessing import RobustScaler, StandardScaler
+
+from utils.utilities import get_float_dtype
+
+_SCALERS = {'standard': StandardScaler, 'robust': RobustScaler}
+
+
+def impute(X, copy=True):
+    """
+    Fill missing values column by column, linearly between the neighbouring
+    values and with the first or last value at the edges, as
+    ``DataFrame.interpolate`` followed by ``bfill``. Columns without any
+    value are left missing.
+
+    Parameters
+    ----------
+    X: dataframe or numpy array of shape (n_samples, n_features)
+        The input samples.
+    copy: bool, optional (default=True)
+        Whether to fill a copy instead of ``X`` itself, if ``X`` is an array.
+        Arrays without missing values are never copied.
+
+    Returns
+    -------
+    X: numpy array of shape (n_samples, n_features)
+        The imputed samples.
+
+    """
+    X = np.asarray(X)
+    missing = np.isnan(X)
+    if not missing.any():
+        return X
+    if copy:
+        X = X.copy()
+    rows = np.arange(X.shape[0])
+    for j in np.flatnonzero(missing.any(axis=0)):
+        valid = ~missing[:, j]
+        if valid.any():
+            X[missing[:, j], j] = np.interp(rows[missing[:, j]], rows[valid], X[valid, j])
+    return X
+
+
+class Preprocessor(object):
+    """
+    Preprocessing stage run once per data set before fitting or scoring
+    detectors: missing values are imputed, the features scaled and the result
+    cast into one C-contiguous array, which the detectors consume as is.
+
+    Parameters
+    ----------
+    impute: bool, optional (default=True)
+        Whether to fill missing values, see ``impute``.
+    scaler: str, transformer or None, optional (default=None)
+        'standard', 'robust', an sklearn transformer, or None not to scale.
+    dtype: numpy dtype, optional (default=None)
+        The dtype of the output, the ``get_float_dtype`` policy if None.
+
+    Attributes
+    ----------
+    scaler_: transformer or None
+        The fitted scaler.
+
+    """
+    def __init__(self, impute=True, scaler=None, dtype=None):
+        if isinstance(scaler, str) and scaler not in _SCALERS:
+            raise ValueError('Unknown scaler %s, expected one of %s' % (scaler, sorted(_SCALERS)))
+        self.impute = impute
+        self.scaler = scaler
+        self.dtype = dtype
+
+    def fit(self, X):
+        """
+        Fit the scaler on the imputed samples.
+
+        Parameters
+        ----------
+        X: dataframe or numpy array of shape (n_samples, n_features)
+            The training samples.
+
+        Returns
+        -------
+        self
+        """
+        self.fit_transform(X)
+        return self
+
+    def transform(self, X):
+        """
+        Impute, scale and cast the samples, into a single new array.
+
+        Parameters
+        ----------
+        X: dataframe or numpy array of shape (n_samples, n_features)
+            The input samples.
+
+        Returns
+        -------
+        X: numpy array of shape (n_samples, n_features)
+            The preprocessed samples.
+        """
+        return self._transform(X, fit=False)
+
+    def fit_transform(self, X):
+        """
+        Fit the scaler and preprocess the samples, see ``transform``.
+
+        Parameters
+        ----------
+        X: dataframe or numpy array of shape (n_samples, n_features)
+            The training samples.
+
+        Returns
+        -------
+        X: numpy array of shape (n_samples, n_features)
+            The preprocessed samples.
+        """
+        return self._transform(X, fit=True)
+
+    def _transform(self, X, fit):
+        dtype = get_float_dtype() if self.dtype is None else self.dtype
+        # the only copy, every later step works in place
+        X = np.array(X, dtype=dtype, order='C')
+        if self.impute:
+            X = impute(X, copy=False)
+        if fit:
+            scaler = self.scaler
+            if isinstance(scaler, str):
+                scaler = _SCALERS[scaler](copy=False)
+            self.scaler_ = scaler.fit(X) if scaler is not None else None
+        if self.scaler_ is not None:
+            X = np.ascontiguousarray(self.scaler_.transform(X), dtype=dtype)
+        return X
@@ -0,0 +1,182 @@
+import numpy as np
+from sklearn.utils import check_random_state
+
+
+class QuantileSketch(object):
+    """
+    Mergeable quantile sketch of a stream of scores in bounded memory (KLL).
+    Level ``h`` holds values standing for ``2 ** h`` scores each. A full level
+    is sorted, and every other value is promoted to the level above, so the
+    sketch keeps O(k log(n / k)) values of n scores, with a rank error of
+    about 1 / k.
+
+    Parameters
+    ----------
+    k: int, optional (default=200)
+        The capacity of the top level, trading memory for accuracy.
+    random_state: int, RandomState instance or None, optional (default=None)
+        Picks the odd or even values on compaction.
+
+    """
+    def __init__(self, k=200, random_state=None):
+        if k < 2:
+            raise ValueError('k must be at least 2, got %s' % k)
+        self.k = k
+        self.random_state = check_random_state(random_state)
+        self.levels = [np.empty(0)]
+        self.n = 0
+
+    @classmethod
+    def from_sorted(cls, values, k=200, random_state=None):
+        """
+        Sketch sorted values at once, taking every ``2 ** h``-th of them,
+        which costs O(k) instead of the O(n log n) of ``update``.
+
+        Parameters
+        ----------
+        values: numpy array of shape (n,)
+            The values in ascending order, without NaN.
+        k: int, optional (default=200)
+            The capacity of the top level.
+        random_state: int, RandomState instance or None, optional (default=None)
+            Picks the odd or even values on compaction.
+
+        Returns
+        -------
+        sketch: QuantileSketch
+        """
+        sketch = cls(k, random_state)
+        values = np.asarray(values, dtype=np.float64)
+        h = 0
+        while len(values) >> h > k:
+            h += 1
+        step = 2 ** h
+        # the middle value of every run of step values stands for the run,
+        # the values past the last full run stand for themselves
+        end = len(values) // step * step
+        if h:
+            sketch.levels = ([values[end:].copy()] + [np.empty(0)] * (h - 1)
+                             + [values[step // 2:end:step].copy()])
+        else:
+            sketch.levels = [values.copy()]
+        sketch.n = len(values)
+        sketch._compress()
+        return sketch
+
+    def __len__(self):
+        return self.n
+
+    def update(self, values):
+        """
+        Add a batch of values to the sketch. NaN values are ignored.
+
+        Parameters
+        ----------
+        values: array-like
+            The values, e.g. the anomaly scores of a batch.
+
+        Returns
+        -------
+        self
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.n += len(values)
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """
+        Merge another sketch into this one, e.g. the sketch of a parallel worker.
+
+        Parameters
+        ----------
+        other: QuantileSketch
+            The sketch to merge, which is left unchanged.
+
+        Returns
+        -------
+        self
+        """
+        for h, level in enumerate(other.levels):
+            if h == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[h] = np.concatenate([self.levels[h], level])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantile(self, q, *others):
+        """
+        Return the approximate q-th quantile of the values added so far.
+
+        Parameters
+        ----------
+        q: float in [0., 1.]
+            The quantile.
+        others: QuantileSketch
+            Sketches whose values count along with these, e.g. the training
+            scores next to the scores of a stream. They are left unchanged.
+
+        Returns
+        -------
+        value: float
+            The value at rank ``q * n``, NaN if the sketches are empty.
+        """
+        if not 0 <= q <= 1:
+            raise ValueError('q must be in [0, 1], got %s' % q)
+        values, weights = self._weighted()
+        if others:
+            pairs = [other._weighted() for other in others]
+            values = np.concatenate([values] + [pair[0] for pair in pairs])
+            weights = np.concatenate([weights] + [pair[1] for pair in pairs])
+        if len(values) == 0:
+            return np.nan
+        order = np.argsort(values, kind='mergesort')
+        ranks = np.cumsum(weights[order])
+        i = np.searchsorted(ranks, q * ranks[-1], side='left')
+        return values[order][min(i, len(values) - 1)]
+
+    def rank(self, value):
+        """
+        Return the approximate share of the values added so far below ``value``.
+
+        Parameters
+        ----------
+        value: float
+            The value.
+
+        Returns
+        -------
+        rank: float in [0., 1.]
+            The share of values smaller than ``value``.
+        """
+        values, weights = self._weighted()
+        if len(values) == 0:
+            return np.nan
+        return weights[values < value].sum() / weights.sum()
+
+    def _weighted(self):
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        return values, weights
+
+    def _capacity(self, h):
+        # lower levels get geometrically smaller, as their values weigh less
+        depth = len(self.levels) - h - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _compress(self):
+        while sum(len(level) for level in self.levels) > sum(self._capacity(h) for h in range(len(self.levels))):
+            for h, level in enumerate(self.levels):
+                if len(level) >= self._capacity(h):
+                    if h + 1 == len(self.levels):
+                        self.levels.append(np.empty(0))
+                    level = np.sort(level)
+                    # an odd value out stays at this level, so no weight is lost
+                    rest, level = level[len(level) - len(level) % 2:], level[:len(level) - len(level) % 2]
+                    promoted = level[self.random_state.randint(2)::2]
+                    self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+                    self.levels[h] = rest
+                    break
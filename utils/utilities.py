@@ -2,27 +2,96 @@ import numpy as np
 import numbers
 from sklearn.metrics import accuracy_score,precision_score,recall_score,f1_score
 import datetime
-import taos
+import hashlib
+import pickle
 import pandas as pd
 from sklearn.metrics import roc_auc_score
 from sklearn.preprocessing import StandardScaler
 import argparse
+import weakref
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from sklearn.utils import check_array
 
+from utils.backends import TDengineBackend, backend_of, fetch_blocks, format_ts
+from utils.connection import ConnectionPool, Session
+
 MAX_INT = np.iinfo(np.int32).max
 MIN_INT = -1 * MAX_INT
 
+# TDengine binary and nchar field types, which cannot be cast into features
+_NON_NUMERIC_TYPES = (8, 10)
+
+# dtype the TDengine float fields are read with, the other fields being read as float64
+_FIELD_DTYPES = {6: np.float32}
+
+# dtype of the features from the queries through the detectors
+_FLOAT_DTYPE = np.float64
+
+# the rows older than a time stamp counted per connection, by (table, epoch ms)
+_ROW_COUNTS = weakref.WeakKeyDictionary()
+
+def set_float_dtype(dtype):
+    """
+    Set the dtype policy of the data path: the feature matrices of queries,
+    the preprocessed data sets, and the tensors and networks of the torch
+    detectors use it, so that no intermediate casts are made. float32 halves
+    the memory traffic of distance computations, BLAS and torch.
+
+    Parameters
+    ----------
+    dtype: numpy dtype or str
+        np.float32 or np.float64.
+
+    """
+    global _FLOAT_DTYPE
+    dtype = np.dtype(dtype).type
+    if dtype not in (np.float32, np.float64):
+        raise ValueError('dtype must be float32 or float64, got %s' %np.dtype(dtype))
+    _FLOAT_DTYPE = dtype
+
+def get_float_dtype():
+    """
+    Return the dtype policy of the data path, see ``set_float_dtype``.
+
+    Returns
+    -------
+    dtype: numpy dtype
+        np.float32 or np.float64, np.float64 unless set otherwise.
+
+    """
+    return _FLOAT_DTYPE
+
+@contextmanager
+def float_dtype(dtype):
+    """
+    Context manager setting the dtype policy of the data path within a block.
+
+    Parameters
+    ----------
+    dtype: numpy dtype or str
+        np.float32 or np.float64.
+
+    """
+    previous = get_float_dtype()
+    set_float_dtype(dtype)
+    try:
+        yield
+    finally:
+        set_float_dtype(previous)
+
 def insert_demo_data(conn,consur,database,table,start_time,end_time,time_serie,ground_truth_flag):
     """
     Inserting demo_data. Monitoring the process of database operations with to create a database and table, with time stamps.
 
     Parameters
     ----------
-    conn: taos.connection.TDengineConnection
-        TDEnginine connection name.
+    conn: taos.connection.TDengineConnection or utils.connection.ConnectionPool
+        TDEnginine connection name, or a pool to check a session out of.
     cursor: taos.cursor.TDengineCursor
-        TDEnginine cursor name.
+        TDEnginine cursor name. Ignored if ``conn`` is a pool.
     database: str
         Connect database name.
     table: str
@@ -43,101 +112,209 @@ def insert_demo_data(conn,consur,database,table,start_time,end_time,time_serie,g
 
     """
 
-    # Create a database named db
-    try:
-        consur.execute('drop database if exists %s' %database)
-        consur.execute('create database if not exists %s' %database)
-    except Exception as err:
-        conn.close()
-        raise (err)
-
-    # use database
-    try:
-        consur.execute('use %s' %database)
-    except Exception as err:
-        conn.close()
-        raise (err)
+    backend = backend_of(conn)
+    with open_session(conn,consur) as session:
+        # Create a database named db
+        backend.create_database(session,database,drop=True)
 
-    # create table
-    try:
-        consur.execute('create table if not exists %s (ts timestamp, a float, b float)' %table)
-    except Exception as err:
-        conn.close()
-        raise (err)
+        # create table
+        backend.create_table(session,'%s.%s' %(database,table),[('ts','timestamp'),('a','float'),('b','float')])
 
-    start_time = datetime.datetime(2019, 8, 1)
-    time_interval = datetime.timedelta(seconds=60)
+    blocks = []
+    for scale in (0.3, 0.1):
+        # 200 samples around -2, 200 around 2 and 20 uniform outliers
+        blocks.append(np.concatenate([scale * np.random.randn(200, 2) - 2,
+                                      scale * np.random.randn(200, 2) + 2,
+                                      np.random.uniform(low=-4, high=4, size=(20, 2))]))
 
     # insert data
-    for i in range(200):
-        try:
-            consur.execute("insert into %s values ('%s', %f, %f,)" % (
-            table,start_time, 0.3 * np.random.randn(1)-2, 0.3 * np.random.randn(1)-2))
-        except Exception as err:
-            conn.close()
-            raise (err)
-        start_time += time_interval
-
-    for i in range(200):
-        try:
-            consur.execute("insert into %s values ('%s', %f, %f,)" % (
-            table, start_time, 0.3 * np.random.randn(1)+2, 0.3 * np.random.randn(1)+2))
-        except Exception as err:
-            conn.close()
-            raise (err)
-        start_time += time_interval
-
-    for i in range(20):
-        try:
-            consur.execute("insert into %s values ('%s', %f, %f,)" % (
-            table,start_time,np.random.uniform(low=-4, high=4), np.random.uniform(low=-4, high=4)))
-        except Exception as err:
-            conn.close()
-            raise (err)
-        start_time += time_interval
+    timestamps = demo_timestamps()
+    matrix = np.concatenate(blocks)
+    bulk_insert(conn,consur,'%s.%s' %(database,table),timestamps,matrix)
 
-    start_time = datetime.datetime(2019, 9, 1)
-    time_interval = datetime.timedelta(seconds=60)
-
-    # insert data
-    for i in range(200):
-        try:
-            consur.execute("insert into %s values ('%s', %f, %f,)" % (
-            table,start_time, 0.1 * np.random.randn(1)-2, 0.1 * np.random.randn(1)-2))
-        except Exception as err:
-            conn.close()
-            raise (err)
-        start_time += time_interval
-
-    for i in range(200):
-        try:
-            consur.execute("insert into %s values ('%s', %f, %f,)" % (
-            table,start_time, 0.1 * np.random.randn(1)+2, 0.1 * np.random.randn(1)+2))
-        except Exception as err:
-            conn.close()
-            raise (err)
-        start_time += time_interval
-
-    for i in range(20):
-        try:
-            consur.execute("insert into %s values ('%s', %f, %f,)" % (
-            table, start_time,np.random.uniform(low=-4, high=4), np.random.uniform(low=-4, high=4)))
-        except Exception as err:
-            conn.close()
-            raise (err)
-        start_time += time_interval
     if ground_truth_flag:
+        return demo_ground_truth()
+    else:
+        pass
+
+def demo_timestamps():
+    """
+    The time stamps of the rows inserted by ``insert_demo_data``, one minute
+    apart from the start of August and of September 2019, in the order of
+    ``demo_ground_truth``.
+
+    Returns
+    -------
+    timestamps: numpy array of shape (840,)
+        The time stamps as datetime64[ms].
+
+    """
+    time_interval = np.timedelta64(60, 's')
+    return np.concatenate([np.datetime64(month, 'ms') + np.arange(420) * time_interval
+                           for month in ('2019-08-01', '2019-09-01')])
+
+def demo_ground_truth():
+    """
+    The ground truth of the rows inserted by ``insert_demo_data``, which does
+    not depend on the random values.
+
+    Returns
+    -------
+    ground_truth: numpy array of shape (840,)
+        The ground truth numpy array, -1 for outliers and 1 for inliers.
+
+    """
+    n_outliers = 20
+    ground_truth = np.ones(840, dtype=int)
+    ground_truth[-n_outliers:] = -1
+    ground_truth[400:420] = -1
+    return ground_truth
 
-        n_outliers = 20
-        ground_truth = np.ones(840, dtype=int)
-        ground_truth[-n_outliers:] = -1
-        ground_truth[400:420] = -1
 
-        return ground_truth
+
+def _format_values(timestamps,matrix,column_types=None):
+    """
+    Format rows as SQL value tuples.
+
+    Parameters
+    ----------
+    timestamps: numpy array of shape (n_samples,)
+        The time stamps of the rows.
+    matrix: numpy array of shape (n_samples, n_features)
+        The values of the rows. NaN values are inserted as NULL.
+    column_types: list of str, optional (default=None)
+        The declared types of the columns, e.g. ``['int', 'nchar(8)']``, the
+        values are then formatted column by column as literals of these
+        types. Every value is a float if None.
+
+    Returns
+    -------
+    rows: list of str
+        The value tuples, e.g. "('2019-08-01 00:00:00.000',1.5,NULL)".
+
+    """
+    timestamps = [ts.replace('T', ' ') for ts in np.datetime_as_string(timestamps.astype('datetime64[ms]'), unit='ms').tolist()]
+    if column_types is not None:
+        columns = [_format_column(matrix[:, j], column_type) for j, column_type in enumerate(column_types)]
+        fmt = "('%s'" + ',%s' * len(columns) + ')'
+        return [fmt % row for row in zip(timestamps, *columns)]
+    # 9 significant digits round-trip float32 and 17 float64
+    fmt = "('%s'" + (',%.9g' if matrix.dtype == np.float32 else ',%.17g') * matrix.shape[1] + ')'
+    # one C-level format call per row on plain Python floats
+    rows = [fmt % row for row in zip(timestamps, *matrix.T.tolist())]
+    if np.isnan(matrix).any():
+        rows = [row.replace('nan', 'NULL') for row in rows]
+    return rows
+
+def _format_column(values, column_type):
+    """
+    Format the values of a column as SQL literals of its declared type,
+    missing values as NULL.
+    """
+    kind = column_type.split('(')[0].strip().lower()
+    missing = pd.isnull(values)
+    if kind in ('float', 'double'):
+        literals = ['%.17g' % value for value in np.where(missing, 0, values).astype(np.float64).tolist()]
+    elif kind in ('int', 'bigint', 'smallint', 'tinyint'):
+        literals = ['%d' % value for value in np.where(missing, 0, values).astype(np.int64).tolist()]
+    elif kind == 'bool':
+        literals = ['true' if value else 'false' for value in values.tolist()]
     else:
-        pass
+        # binary and nchar, quotes doubled
+        literals = ["'%s'" % str(value).replace("'", "''") for value in values.tolist()]
+    if missing.any():
+        literals = ['NULL' if null else literal for literal, null in zip(literals, missing.tolist())]
+    return literals
 
+def bulk_insert(conn,cursor,table,timestamps,matrix,batch_rows=1000,max_statement_bytes=60000,n_jobs=1,out_of_order=False,column_types=None):
+    """
+    Insert rows in batches of multi-row ``insert ... values`` statements,
+    instead of one round trip per row. Statements are generated vectorised
+    and, when ``conn`` is a pool, pipelined over several pooled connections.
 
+    Parameters
+    ----------
+    conn: taos.connection.TDengineConnection or utils.connection.ConnectionPool
+        TDEnginine connection name, or a pool to check sessions out of.
+    cursor: taos.cursor.TDengineCursor
+        TDEnginine cursor name. Ignored if ``conn`` is a pool.
+    table: str
+        Table to insert into, qualified with its database as 'db.table'.
+    timestamps: array-like of shape (n_samples,)
+        The time stamps of the rows.
+    matrix: array-like of shape (n_samples, n_features)
+        The values of the rows, in the column order of the table.
+    batch_rows: int, optional (default=1000)
+        The maximal number of rows per statement.
+    max_statement_bytes: int, optional (default=60000)
+        The maximal length of a statement, below the maxSQLLength of the server.
+    n_jobs: int, optional (default=1)
+        The number of statements executed concurrently. Only used if
+        ``conn`` is a pool.
+    out_of_order: bool, optional (default=False)
+        Whether the rows may be older than the rows already in the table,
+        which TDengine only accepts through ``import`` statements.
+    column_types: list of str, optional (default=None)
+        The declared types of the columns, e.g. ``['int', 'bool', 'nchar(8)']``,
+        for a matrix of mixed columns, e.g. a dataframe. Every value is
+        inserted as a float if None.
+
+    Returns
+    -------
+    n_rows: int
+        The number of inserted rows.
+
+    """
+    check_parameter(batch_rows, low=1, param_name='batch_rows', include_left=True)
+    check_parameter(n_jobs, low=1, param_name='n_jobs', include_left=True)
+    timestamps = np.asarray(timestamps)
+    matrix = np.asarray(matrix)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(-1, 1)
+    if column_types is not None and len(column_types) != matrix.shape[1]:
+        raise ValueError('%d column types for %d columns' %(len(column_types), matrix.shape[1]))
+    if column_types is None and matrix.dtype.kind != 'f':
+        matrix = matrix.astype(np.float64)
+    if len(timestamps) != len(matrix):
+        raise ValueError('timestamps has %d rows and matrix has %d rows' %(len(timestamps), len(matrix)))
+
+    backend = backend_of(conn)
+    prefix = backend.insert_statement(table, [], out_of_order=out_of_order)
+    separator = len(backend.row_separator)
+    statements = []
+    for start in range(0, len(matrix), batch_rows):
+        rows = _format_values(timestamps[start:start + batch_rows], matrix[start:start + batch_rows], column_types)
+        # split further so that no statement exceeds max_statement_bytes
+        sizes = np.cumsum([len(row) + separator for row in rows])
+        begin = 0
+        while begin < len(rows):
+            offset = sizes[begin - 1] if begin else 0
+            end = max(begin + 1, int(np.searchsorted(sizes, offset + max_statement_bytes - len(prefix), side='right')))
+            statements.append(backend.insert_statement(table, rows[begin:end], out_of_order=out_of_order))
+            begin = end
+
+    if n_jobs > 1 and isinstance(conn, ConnectionPool):
+        def execute(statement):
+            with conn.checkout() as session:
+                session.execute(statement)
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            list(executor.map(execute, statements))
+    else:
+        with open_session(conn,cursor) as session:
+            for statement in statements:
+                session.execute(statement)
+    # the new rows change the counts of query_data
+    counts = _row_counts(conn)
+    for key in [key for key in counts if key[0] == table]:
+        del counts[key]
+    return len(matrix)
+
+def _row_counts(conn):
+    # the memoised row counts of a connection or pool, dropped along with it
+    try:
+        return _ROW_COUNTS.setdefault(conn, {})
+    except TypeError:
+        return {}
 
 def output_performance(algorithm,ground_truth,y_pred,time,outlierness):
     """
@@ -188,28 +365,224 @@ def connect_server(host,user,password):
         TDEnginine cursor name.
 
     """
-    # Connect to TDengine server.
-    #
-    # parameters:
-    # @host     : TDengine server IP address
-    # @user     : Username used to connect to TDengine server
-    # @password : Password
-    # @database : Database to use when connecting to TDengine server
-    # @config   : Configuration directory
-    conn = taos.connect(host,user,password,config="/etc/taos")
+    conn = TDengineBackend(host,user,password,config="/etc/taos").connect()
     cursor = conn.cursor()
     return conn,cursor
 
-def query_data(conn,cursor,database,table,start_time,end_time,time_serie_name,ground_truth=None,time_serie=False,ground_truth_flag=True):
+def connect_pool(host,user,password,size=4,config="/etc/taos",**kwargs):
     """
-    Query data from given time range and table.
+    Create a pool of reusable connections to the server. The pool can be
+    passed as ``conn`` to the query and insert helpers in place of a
+    connection and cursor pair.
 
     Parameters
     ----------
-    conn: taos.connection.TDengineConnection
-        TDEnginine connection name.
+    host: str
+        Host name as the address of the TDEngine Server.
+    user: str
+        User name of the TDEngine Server.
+    password: str
+        Password for the TDEngine Server.
+    size: int, optional (default=4)
+        The maximal number of open connections.
+    config: str, optional (default="/etc/taos")
+        Configuration directory.
+    kwargs: dict
+        Further arguments of utils.connection.ConnectionPool, e.g.
+        ``health_check``, ``check_interval`` or ``timeout``.
+
+    Returns
+    -------
+    pool: utils.connection.ConnectionPool
+        The connection pool.
+
+    """
+    return TDengineBackend(host,user,password,config=config).pool(size=size,**kwargs)
+
+@contextmanager
+def open_session(conn,cursor):
+    """
+    Yield a session for either a connection pool or a connection and cursor pair.
+    A failing statement recycles the cursor of a pooled session, and never
+    closes the connection of the caller.
+
+    Parameters
+    ----------
+    conn: taos.connection.TDengineConnection or utils.connection.ConnectionPool
+        TDEnginine connection name, or a pool to check a session out of.
     cursor: taos.cursor.TDengineCursor
-        TDEnginine cursor name.
+        TDEnginine cursor name. Ignored if ``conn`` is a pool.
+
+    Yields
+    ------
+    session: utils.connection.Session
+        The session to execute statements with.
+
+    """
+    if isinstance(conn, ConnectionPool):
+        with conn.checkout() as session:
+            yield session
+    else:
+        yield Session(conn,cursor,owned=False)
+
+def fetch_columns(cursor,dtype=None):
+    """
+    Read the result set of an executed query straight into typed NumPy columns.
+    The first column is taken as the time serie column, as TDengine requires,
+    and every other column is cast into one contiguous feature matrix.
+
+    Parameters
+    ----------
+    cursor: taos.cursor.TDengineCursor or utils.connection.Session
+        TDEnginine cursor on which a select has been executed.
+    dtype: numpy dtype, optional (default=None)
+        The dtype of the feature matrix, np.float32 or np.float64. The
+        ``get_float_dtype`` policy if None.
+
+    Returns
+    -------
+    names: list of str
+        Column names taken from ``cursor.description``.
+    timestamps: numpy array of shape (n_samples,)
+        The time stamps as datetime64[ms].
+    values: numpy array of shape (n_samples, n_features)
+        The C-contiguous feature matrix. NULL values become NaN.
+
+    """
+    if dtype is None:
+        dtype = get_float_dtype()
+    description = cursor.description
+    names = [col[0] for col in description]
+    for col in description[1:]:
+        if col[1] in _NON_NUMERIC_TYPES:
+            raise TypeError('Column %s is not numerical and cannot be used as a feature' %col[0])
+
+    # the dtype each column is read with, NULL values becoming NaN
+    field_dtypes = [_FIELD_DTYPES.get(col[1], np.float64) for col in description[1:]]
+
+    n_samples = 0
+    timestamps = np.empty(0, dtype='datetime64[ms]')
+    values = np.empty((0, len(names) - 1), dtype=dtype)
+    for columns in fetch_blocks(cursor):
+        n_rows = len(columns[0])
+        if n_samples + n_rows > len(timestamps):
+            # grow the arrays geometrically, the number of rows being unknown upfront
+            size = max(2 * len(timestamps), n_samples + n_rows)
+            timestamps = _resize_rows(timestamps, size, n_samples)
+            values = _resize_rows(values, size, n_samples)
+        rows = slice(n_samples, n_samples + n_rows)
+        timestamps[rows] = np.asarray(columns[0], dtype='datetime64[ms]')
+        for j, field_dtype in enumerate(field_dtypes):
+            values[rows, j] = np.asarray(columns[j + 1], dtype=field_dtype)
+        n_samples += n_rows
+    if n_samples < len(timestamps):
+        timestamps, values = timestamps[:n_samples].copy(), values[:n_samples].copy()
+    return names, timestamps, values
+
+def _resize_rows(array, size, n_rows):
+    # a new array of ``size`` rows starting with the first ``n_rows`` rows of ``array``
+    resized = np.empty((size,) + array.shape[1:], dtype=array.dtype)
+    resized[:n_rows] = array[:n_rows]
+    return resized
+
+def table_columns(conn,cursor,database,table,time_serie_name):
+    """
+    Return the column names of a table.
+
+    Parameters
+    ----------
+    conn: taos.connection.TDengineConnection or utils.connection.ConnectionPool
+        TDEnginine connection name, or a pool to check a session out of.
+    cursor: taos.cursor.TDengineCursor
+        TDEnginine cursor name. Ignored if ``conn`` is a pool.
+    database: str
+        Connect database name.
+    table: str
+        Table name.
+    time_serie_name: str
+        Time_serie column name in the table.
+
+    Returns
+    -------
+    names: list of str
+        The column names, the time serie column first.
+
+    """
+    with open_session(conn,cursor) as session:
+        session.execute(backend_of(conn).range_query('%s.%s' %(database,table),time_serie_name,limit=1))
+        session.fetchall()
+        return [col[0] for col in session.description]
+
+def to_epoch_ms(timestamps):
+    """
+    Convert time stamps into an int64 epoch index in milliseconds.
+
+    Parameters
+    ----------
+    timestamps: array-like of shape (n_samples,)
+        Time stamps as datetime64, datetime, str or int64 epoch milliseconds.
+
+    Returns
+    -------
+    epoch: numpy array of shape (n_samples,)
+        The int64 epoch milliseconds.
+
+    """
+    timestamps = np.asarray(timestamps)
+    if timestamps.dtype.kind in 'iu':
+        return timestamps.astype(np.int64, copy=False)
+    return timestamps.astype('datetime64[ms]').astype(np.int64)
+
+def align_ground_truth(timestamps,ground_truth,ground_truth_ts=None,offset=0):
+    """
+    Select the ground truth labels of the queried rows.
+
+    Parameters
+    ----------
+    timestamps: numpy array of shape (n_samples,)
+        Time stamps of the queried rows, in time order.
+    ground_truth: numpy array of shape (n_labels,)
+        Ground truth labels.
+    ground_truth_ts: numpy array of shape (n_labels,), optional (default=None)
+        Sorted time stamps of ``ground_truth``. If given, labels are matched
+        on time stamps with a binary search.
+    offset: int, optional (default=0)
+        Position of the first queried row in ``ground_truth``. Only used when
+        ``ground_truth_ts`` is None.
+
+    Returns
+    -------
+    new_ground_truth: numpy array of shape (n_samples,)
+        The ground truth aligned with ``timestamps``.
+
+    """
+    ground_truth = np.asarray(ground_truth)
+    if ground_truth_ts is None:
+        if offset + len(timestamps) > len(ground_truth):
+            raise ValueError('ground_truth has %d labels, %d are required' %(len(ground_truth), offset + len(timestamps)))
+        return ground_truth[offset:offset + len(timestamps)]
+
+    index = to_epoch_ms(ground_truth_ts)
+    epoch = to_epoch_ms(timestamps)
+    positions = np.searchsorted(index, epoch)
+    found = positions < len(index)
+    found[found] = index[positions[found]] == epoch[found]
+    if not found.all():
+        raise ValueError('%d queried rows have no ground truth label' %np.count_nonzero(~found))
+    return ground_truth[positions]
+
+def query_data(conn,cursor,database,table,start_time,end_time,time_serie_name,ground_truth=None,time_serie=False,ground_truth_flag=True,dtype=None,as_frame=True,ground_truth_ts=None,cache=None,interval=None,agg='avg',columns=None):
+    """
+    Query data from given time range and table. The query is executed once and
+    its result is read column-wise into a time stamp index and a contiguous
+    feature matrix.
+
+    Parameters
+    ----------
+    conn: taos.connection.TDengineConnection or utils.connection.ConnectionPool
+        TDEnginine connection name, or a pool to check a session out of.
+    cursor: taos.cursor.TDengineCursor
+        TDEnginine cursor name. Ignored if ``conn`` is a pool.
     database: str
         Connect database name.
     table: str
@@ -226,118 +599,110 @@ def query_data(conn,cursor,database,table,start_time,end_time,time_serie_name,gr
         Whether contains time stamps as one of the features or not.
     ground_truth_flag: bool, optional (default=False)
         Whether uses ground truth to evaluate the performance or not.
+    dtype: numpy dtype, optional (default=None)
+        The dtype of the feature matrix, np.float32 or np.float64. The
+        ``get_float_dtype`` policy if None.
+    as_frame: bool, optional (default=True)
+        If True, wrap the feature matrix into a DataFrame without copying it.
+        If False, return the time stamps and the feature matrix as NumPy arrays.
+    ground_truth_ts: numpy array of shape (n_samples,), optional (default=None)
+        Sorted time stamps of the ``ground_truth`` labels. If None,
+        ``ground_truth`` is taken to cover the whole table in time order.
+    cache: utils.cache.QueryCache, optional (default=None)
+        Local cache of queried ranges. Only the parts of the range which are
+        not cached yet are fetched from the server. Used only if both
+        ``start_time`` and ``end_time`` are set and ``interval`` is None.
+        The ``ground_truth`` offset is then counted from the cached time
+        stamps, else the rows before ``start_time`` are counted once per
+        connection.
+    interval: str, datetime.timedelta or numpy.timedelta64, optional (default=None)
+        If set, the server aggregates the rows into buckets of this width,
+        e.g. '1m' or '1h', and one row is returned per non-empty bucket.
+        Ground truth is then aligned on ``ground_truth_ts``, which is required.
+    agg: str or list of str, optional (default='avg')
+        The aggregates computed per bucket, among 'avg', 'min', 'max',
+        'count' and 'sum'. The features are named '<column>_<agg>'.
+    columns: list of str, optional (default=None)
+        The feature columns to select, e.g. the ``features`` of a detector.
+        Only these columns are transferred. Every column is selected if None.
 
     Returns
     -------
     X: pandas DataFrame
         Queried data as DataFrame from given table and time range.
+        Only returned if ``as_frame`` is True.
+    timestamps: numpy array of shape (n_samples,)
+        The time stamps as datetime64[ms]. Only returned if ``as_frame`` is False.
+    values: numpy array of shape (n_samples, n_features)
+        The contiguous feature matrix. Only returned if ``as_frame`` is False.
+    new_ground_truth: numpy array of shape (n_samples,)
+        The ground truth aligned with the queried rows. Only returned if
+        ``ground_truth_flag`` is True.
 
     """
-    # query data and return data in the form of list
-    if start_time and end_time:
-        try:
-            cursor.execute("select * from %s.%s where %s >= \'%s\' and %s <= \'%s\' " %(database,table,time_serie_name,start_time,time_serie_name,end_time))
-        except Exception as err:
-            conn.close()
-            raise (err)
-    elif not start_time and not end_time:
-        try:
-            cursor.execute('select * from %s.%s' %(database,table))
-        except Exception as err:
-            conn.close()
-            raise (err)
-    elif start_time and not end_time:
-        try:
-            cursor.execute("select * from %s.%s where %s >=  \'%s\' " %(database,table,time_serie_name,start_time))
-        except Exception as err:
-            conn.close()
-            raise (err)
-    elif not start_time and  end_time:
-        try:
-            cursor.execute("select * from %s.%s where %s <=  \'%s\' " %(database,table,time_serie_name,end_time))
-        except Exception as err:
-            conn.close()
-            raise (err)
+    if dtype is None:
+        dtype = get_float_dtype()
+    backend = backend_of(conn)
+    qualified_table = '%s.%s' %(database,table)
+    if interval is not None:
+        aggs = [agg] if isinstance(agg, str) else list(agg)
+        if ground_truth_flag and ground_truth_ts is None:
+            raise ValueError('Aggregated rows can only be aligned with ground_truth_ts')
+        if columns is None:
+            columns = table_columns(conn,cursor,database,table,time_serie_name)[1:]
 
-    # Column names are in c1.description list
-    cols = cursor.description
-    # Use fetchall to fetch data in a list
-    data = cursor.fetchall()
+    def fetch(lower,upper,projection=columns):
+        with open_session(conn,cursor) as session:
+            if interval is None:
+                session.execute(backend.range_query(qualified_table,time_serie_name,lower,upper,columns=projection))
+            else:
+                session.execute(backend.interval_query(qualified_table,time_serie_name,columns,interval,aggs,lower,upper))
+            return fetch_columns(session, dtype=dtype)
 
-    if start_time and end_time:
-        try:
-            cursor.execute("select * from %s.%s where %s >=  \'%s\' and %s <=  \'%s\' " %(database,table,time_serie_name,start_time,time_serie_name,end_time))
-        except Exception as err:
-            conn.close()
-            raise (err)
-    elif not start_time and not end_time:
-        try:
-            cursor.execute('select * from %s.%s' %(database,table))
-        except Exception as err:
-            conn.close()
-            raise (err)
-    elif start_time and not end_time:
-        try:
-            cursor.execute("select * from %s.%s where %s >=  \'%s\' " %(database,table,time_serie_name,start_time))
-        except Exception as err:
-            conn.close()
-            raise (err)
-    elif not start_time and  end_time:
-        try:
-            cursor.execute("select * from %s.%s where %s <=  \'%s\' " %(database,table,time_serie_name,end_time))
-        except Exception as err:
-            conn.close()
-            raise (err)
+    def count_before(lower):
+        # rows are stored in time order, so the range starts right after
+        # every row older than start_time
+        with open_session(conn,cursor) as session:
+            session.execute(backend.count_query(qualified_table,time_serie_name,lower))
+            return int(session.fetchall()[0][0] or 0)
 
-    tmp = pd.DataFrame(list(data))
+    def memoised_count_before(lower):
+        # counted once per table and start, older rows being assumed not to change
+        counts = _row_counts(conn)
+        key = (qualified_table,int(to_epoch_ms(lower)))
+        if key not in counts:
+            counts[key] = count_before(lower)
+        return counts[key]
 
-    if time_serie:
-        X = tmp
+    offset = 0
+    if cache is not None and start_time and end_time and interval is None:
+        # projections are gathered from the cached columns of the table
+        names, timestamps, values = cache.query(database,table,int(to_epoch_ms(start_time)),int(to_epoch_ms(end_time)),
+                                                lambda lower, upper, projection: fetch(np.datetime64(lower,'ms'),np.datetime64(upper,'ms'),projection),
+                                                columns=columns)
+        values = np.array(values, dtype=dtype, order='C')
+        if ground_truth_flag and ground_truth_ts is None:
+            offset = cache.count_before(database,table,int(to_epoch_ms(start_time)),
+                                        lambda lower: count_before(np.datetime64(lower,'ms')))
     else:
-        X = tmp.iloc[:, 1:]
+        names, timestamps, values = fetch(start_time,end_time)
+        if ground_truth_flag and ground_truth_ts is None and start_time:
+            offset = memoised_count_before(start_time)
+
+    if as_frame:
+        X = pd.DataFrame(values, columns=names[1:], copy=False)
+        if time_serie:
+            X.insert(0, names[0], timestamps)
 
     if ground_truth_flag:
-        if True:
-            try:
-                cursor.execute('select * from %s.%s' %(database,table))
-            except Exception as err:
-                conn.close()
-                raise (err)
-            whole_data = cursor.fetchall()
-            try:
-                cursor.execute('select * from %s.%s' %(database,table))
-            except Exception as err:
-                conn.close()
-                raise (err)
-
-            whole_tmp = pd.DataFrame(list(whole_data))
-            timestamp=np.array(whole_tmp.ix[:,0].to_numpy(), dtype='datetime64')
-            timestamp=np.reshape(timestamp,-1)
-            new_ground_truth=[]
-            if start_time and end_time:
-                for i in range(len(whole_tmp)):
-                    if timestamp[i]>=np.datetime64(start_time) and timestamp[i]<=np.datetime64(end_time):
-                        new_ground_truth.append(ground_truth[i])
-            elif start_time and not end_time:
-                for i in range(len(whole_tmp)):
-                    if timestamp[i]>=np.datetime64(start_time):
-                        new_ground_truth.append(ground_truth[i])
-            elif not start_time and  end_time:
-                for i in range(len(whole_tmp)):
-                    if timestamp[i]<=np.datetime64(end_time):
-                        new_ground_truth.append(ground_truth[i])
-            elif not start_time and not end_time:
-                new_ground_truth=ground_truth
-            new_ground_truth=np.array(new_ground_truth)
-        else:
-            new_ground_truth=ground_truth
-        X.fillna(method='ffill')
-        X.fillna(method='bfill')
+        new_ground_truth = align_ground_truth(timestamps,ground_truth,ground_truth_ts=ground_truth_ts,offset=offset)
+        if not as_frame:
+            return timestamps, values, new_ground_truth
         return X, new_ground_truth
 
     else:
-        X.fillna(method='ffill')
-        X.fillna(method='bfill')
+        if not as_frame:
+            return timestamps, values
         return X
 
 
@@ -347,6 +712,197 @@ def query_data(conn,cursor,database,table,start_time,end_time,time_serie_name,gr
 
 
 
+def iter_query_data(conn,cursor,database,table,start_time,end_time,time_serie_name,chunk_rows=100000,chunk_span=None,dtype=None,columns=None):
+    """
+    Page data from given time range and table in bounded chunks, instead of
+    materialising the whole range in memory. Chunks are cut by a time stamp
+    cursor after at most ``chunk_rows`` rows, and optionally by fixed time
+    windows of ``chunk_span``.
+
+    Parameters
+    ----------
+    conn: taos.connection.TDengineConnection or utils.connection.ConnectionPool
+        TDEnginine connection name, or a pool to check a session out of.
+    cursor: taos.cursor.TDengineCursor
+        TDEnginine cursor name. Ignored if ``conn`` is a pool.
+    database: str
+        Connect database name.
+    table: str
+        Table to query from.
+    start_time: str
+        Time range, start from.
+    end_time: str
+        Time range, end from.
+    time_serie_name: str
+        Time_serie column name in the table.
+    chunk_rows: int or None, optional (default=100000)
+        The maximal number of rows per chunk. If None, chunks are only cut by
+        ``chunk_span``.
+    chunk_span: str, datetime.timedelta or numpy.timedelta64, optional (default=None)
+        The time span covered by each chunk, e.g. '1H'. Requires both
+        ``start_time`` and ``end_time``.
+    dtype: numpy dtype, optional (default=None)
+        The dtype of the feature matrix, np.float32 or np.float64. The
+        ``get_float_dtype`` policy if None.
+    columns: list of str, optional (default=None)
+        The feature columns to read, every column if None.
+
+    Yields
+    ------
+    timestamps: numpy array of shape (n_chunk,)
+        The time stamps of the chunk as datetime64[ms].
+    values: numpy array of shape (n_chunk, n_features)
+        The contiguous feature matrix of the chunk.
+
+    """
+    if chunk_rows is None and chunk_span is None:
+        raise ValueError('Either chunk_rows or chunk_span should be set')
+    if chunk_rows is not None:
+        check_parameter(chunk_rows, low=1, param_name='chunk_rows', include_left=True)
+
+    if chunk_span is None:
+        windows = [(start_time, end_time, '<=')]
+    else:
+        windows = [(lower, upper, '<') for lower, upper in _time_windows(start_time,end_time,chunk_span,'chunk_span')]
+
+    backend = backend_of(conn)
+    with open_session(conn,cursor) as session:
+        for lower, upper, upper_op in windows:
+            lower_op = '>='
+            while True:
+                session.execute(backend.range_query('%s.%s' %(database,table),time_serie_name,lower,upper,
+                                                    lower_op=lower_op,upper_op=upper_op,order=True,limit=chunk_rows,
+                                                    columns=columns))
+                _, timestamps, values = fetch_columns(session, dtype=dtype)
+                if len(timestamps):
+                    yield timestamps, values
+                if chunk_rows is None or len(timestamps) < chunk_rows:
+                    break
+                # continue right after the last time stamp of this chunk
+                lower, lower_op = format_ts(timestamps[-1]), '>'
+
+def prefetch_query_data(conn,cursor,database,table,start_time,end_time,time_serie_name,window,prefetch=1,**kwargs):
+    """
+    Query a time range window by window with ``query_data``, fetching the
+    next windows in a background thread while the caller processes the
+    current one, so that query latency and model compute overlap. At most
+    ``prefetch`` windows are fetched ahead, which bounds the memory use.
+
+    Parameters
+    ----------
+    conn: taos.connection.TDengineConnection or utils.connection.ConnectionPool
+        TDEnginine connection name, or a pool to check a session out of.
+    cursor: taos.cursor.TDengineCursor
+        TDEnginine cursor name. Ignored if ``conn`` is a pool. The cursor
+        should not be used elsewhere until the iteration is over.
+    database: str
+        Connect database name.
+    table: str
+        Table to query from.
+    start_time: str
+        Time range, start from.
+    end_time: str
+        Time range, end at.
+    time_serie_name: str
+        Time_serie column name in the table.
+    window: str, datetime.timedelta or numpy.timedelta64
+        The time span of each window, e.g. '1D'.
+    prefetch: int, optional (default=1)
+        The number of windows fetched ahead of the processed one.
+    kwargs: dict
+        Further arguments of ``query_data``, e.g. ``ground_truth``,
+        ``ground_truth_flag``, ``columns`` or ``cache``.
+
+    Yields
+    ------
+    lower: numpy.datetime64
+        The start of the window (inclusive).
+    upper: numpy.datetime64
+        The end of the window (inclusive).
+    result: pandas DataFrame or tuple
+        The result of ``query_data`` for the window.
+
+    """
+    check_parameter(prefetch, low=1, param_name='prefetch', include_left=True)
+    one_ms = np.timedelta64(1, 'ms')
+    windows = deque((lower, upper - one_ms) for lower, upper in _time_windows(start_time,end_time,window,'window'))
+
+    def fetch(lower,upper):
+        return query_data(conn,cursor,database,table,lower,upper,time_serie_name,**kwargs)
+
+    # a single worker keeps the cursor of the caller and the cache free of concurrent use
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        try:
+            while windows and len(pending) < prefetch:
+                lower, upper = windows.popleft()
+                pending.append((lower, upper, executor.submit(fetch, lower, upper)))
+            while pending:
+                lower, upper, future = pending.popleft()
+                result = future.result()
+                if windows:
+                    next_lower, next_upper = windows.popleft()
+                    pending.append((next_lower, next_upper, executor.submit(fetch, next_lower, next_upper)))
+                yield lower, upper, result
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+
+def _time_windows(start_time,end_time,span,param_name):
+    """
+    Cut the inclusive range [start_time, end_time] into consecutive half-open
+    windows [lower, upper) of a fixed time span, the last one clipped.
+    """
+    if not (start_time and end_time):
+        raise ValueError('%s requires both start_time and end_time' %param_name)
+    width = pd.Timedelta(span).to_timedelta64().astype('timedelta64[ms]')
+    if width <= np.timedelta64(0, 'ms'):
+        raise ValueError('%s should be positive, got %s' %(param_name,span))
+    lower = np.datetime64(start_time, 'ms')
+    stop = np.datetime64(end_time, 'ms') + np.timedelta64(1, 'ms')
+    windows = []
+    while lower < stop:
+        upper = min(lower + width, stop)
+        windows.append((lower, upper))
+        lower = upper
+    return windows
+
+def fingerprint(X, chunk_rows=65536):
+    """
+    Hash the content of a data set, e.g. to recognise an input scored before.
+    Rows are hashed block by block, so that no contiguous copy of the whole
+    data set is made.
+
+    Parameters
+    ----------
+    X: dataframe or numpy array of shape (n_samples, n_features)
+        The data set.
+    chunk_rows: int, optional (default=65536)
+        The number of rows hashed at once.
+
+    Returns
+    -------
+    digest: str
+        The hex digest of the shape, dtype and values of ``X``.
+
+    """
+    frame = hasattr(X, 'iloc')
+    # a frame is converted block by block, with the dtype of its whole array
+    dtype = np.asarray(X.iloc[:0]).dtype if frame else np.asarray(X).dtype
+    if not frame or dtype.hasobject:
+        X, frame = np.asarray(X), False
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(('%s%s' %(X.shape, dtype.str)).encode())
+    if dtype.hasobject:
+        digest.update(pickle.dumps(X))
+        return digest.hexdigest()
+    if X.ndim == 0:
+        X = X.reshape(1)
+    for start in range(0, len(X), chunk_rows):
+        block = X.iloc[start:start + chunk_rows] if frame else X[start:start + chunk_rows]
+        digest.update(np.ascontiguousarray(block, dtype=dtype).view(np.uint8))
+    return digest.hexdigest()
+
 def check_parameter(param, low=MIN_INT, high=MAX_INT, param_name='',
                     include_left=False, include_right=False):
     """Check if an input is within the defined range.